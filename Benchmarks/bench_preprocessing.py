@@ -0,0 +1,162 @@
+"""
+Benchmark of the receipt preprocessing pipelines on synthetic receipt photos: latency and character accuracy.
+
+Usage:
+    python -m Benchmarks.bench_preprocessing [--count 10] [--seed 0] [--preprocess-only] [--backend pytesseract]
+"""
+import argparse
+from Benchmarks.generator import ITEM_NOUNS, ITEM_WORDS, LOCATIONS
+import cv2
+import numpy as np
+from OCR.backends import BACKENDS, get_engine
+from OCR.preprocessing import load_image, preprocess
+from OCR.scanner import PREPROCESSING
+import os
+from PIL import Image, ImageDraw, ImageFont
+import random
+import statistics
+import tempfile
+import time
+
+
+# CONSTANTS
+# The pipelines compared: what scan_receipt used to do (the GaussianBlur with a 1x1 kernel did nothing) and the default
+PIPELINES = {
+    "legacy": {**PREPROCESSING, "steps": ["grayscale", "normalize", "threshold"], "threshold": 100},
+    "default": PREPROCESSING,
+}
+# A 12MP phone photo, taken in portrait
+PHOTO_WIDTH = 3000
+PHOTO_HEIGHT = 4000
+# The receipt is rendered on 80mm paper at this resolution before being "photographed"
+RENDER_DPI = 400
+PAPER_WIDTH_INCHES = 3.15
+LINE_CHARS = 32
+MAX_ROTATION_DEGREES = 8
+FONTS = ["DejaVuSansMono.ttf", "LiberationMono-Regular.ttf", "Courier New.ttf"]
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    for name in FONTS:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def receipt_text(rng: random.Random) -> str:
+    """
+    Make up the text of a receipt: a store, a date, some items with their prices and the totals.
+    """
+    lines = [rng.choice(LOCATIONS).upper().center(LINE_CHARS).rstrip(), f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", ""]
+    subtotal = 0
+    for _ in range(rng.randint(6, 18)):
+        item = " ".join(rng.sample(ITEM_WORDS, rng.randint(0, 1)) + [rng.choice(ITEM_NOUNS)]).upper()[:LINE_CHARS - 9]
+        cents = rng.randint(99, 4999)
+        subtotal += cents
+        price = f"{cents // 100}.{cents % 100:02d}"
+        lines.append(f"{item}{price:>{LINE_CHARS - len(item)}}")
+    tax = round(subtotal * 0.13)
+    lines.append("")
+    for label, cents in (("SUBTOTAL", subtotal), ("HST", tax), ("TOTAL", subtotal + tax)):
+        price = f"{cents // 100}.{cents % 100:02d}"
+        lines.append(f"{label}{price:>{LINE_CHARS - len(label)}}")
+    return "\n".join(lines)
+
+
+def render_receipt(text: str) -> np.ndarray:
+    """
+    Print the text on a strip of receipt paper (a grayscale image).
+    """
+    width = round(PAPER_WIDTH_INCHES * RENDER_DPI)
+    font = _font(round(width * 0.9 / (LINE_CHARS * 0.6)))
+    line_height = round(font.size * 1.3) if hasattr(font, "size") else 12
+    margin = round(width * 0.05)
+    paper = Image.new("L", (width, 2 * margin + line_height * (text.count("\n") + 1)), color=245)
+    ImageDraw.Draw(paper).multiline_text((margin, margin), text, fill=25, font=font, spacing=line_height - font.size)
+    return np.array(paper)
+
+
+def photograph(paper: np.ndarray, rng: random.Random) -> np.ndarray:
+    """
+    Make a 12MP colour "photo" of the receipt: rotated and placed on a dark table,
+    lit unevenly and with sensor noise.
+    """
+    np_rng = np.random.default_rng(rng.randrange(2**32))
+    scale = min(0.85 * PHOTO_HEIGHT / paper.shape[0], 0.6 * PHOTO_WIDTH / paper.shape[1])
+    rotation = cv2.getRotationMatrix2D((paper.shape[1] / 2, paper.shape[0] / 2), rng.uniform(-MAX_ROTATION_DEGREES, MAX_ROTATION_DEGREES), scale)
+    rotation[:, 2] += (PHOTO_WIDTH / 2 - paper.shape[1] / 2, PHOTO_HEIGHT / 2 - paper.shape[0] / 2)
+    size = (PHOTO_WIDTH, PHOTO_HEIGHT)
+    receipt = cv2.warpAffine(paper, rotation, size, flags=cv2.INTER_LINEAR)
+    covered = cv2.warpAffine(np.full(paper.shape, 255, np.uint8), rotation, size, flags=cv2.INTER_NEAREST) > 0
+
+    photo = np.where(covered, receipt, np.uint8(70)).astype(np.float32)
+    # Light falling off across the photo in a random direction
+    direction = rng.uniform(0, 2 * np.pi)
+    ys, xs = np.mgrid[0:PHOTO_HEIGHT, 0:PHOTO_WIDTH].astype(np.float32)
+    ramp = xs / PHOTO_WIDTH * np.cos(direction) + ys / PHOTO_HEIGHT * np.sin(direction)
+    photo *= 0.6 + 0.4 * (ramp - ramp.min()) / (ramp.max() - ramp.min())
+    photo += np_rng.normal(0, 6, photo.shape).astype(np.float32)
+    return cv2.cvtColor(np.clip(photo, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def character_accuracy(read: str, truth: str) -> float:
+    """
+    1 - the edit distance between the text read and the true text, over the length of the true text
+    (whitespace is collapsed first, since OCR engines space text differently).
+    """
+    read, truth = " ".join(read.split()), " ".join(truth.split())
+    previous = list(range(len(read) + 1))
+    for i, truth_char in enumerate(truth, start=1):
+        current = [i]
+        for j, read_char in enumerate(read, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (truth_char != read_char)))
+        previous = current
+    return max(0.0, 1 - previous[-1] / max(len(truth), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=10, help="number of synthetic receipts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--preprocess-only", action="store_true", help="only time the preprocessing (no OCR, no accuracy)")
+    parser.add_argument("--backend", choices=list(BACKENDS), help="OCR backend, default is tesserocr if installed, else pytesseract")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        receipts = []
+        for i in range(args.count):
+            text = receipt_text(rng)
+            path = os.path.join(tmp, f"receipt_{i}.jpg")
+            cv2.imwrite(path, photograph(render_receipt(text), rng), [cv2.IMWRITE_JPEG_QUALITY, 90])
+            receipts.append((path, text))
+
+        if not args.preprocess_only:
+            # Created before timing starts, so loading the engine isn't counted against the first scan
+            engine = get_engine(args.backend)
+
+        print(f"{'pipeline':<10} {'load ms':>9} {'preprocess ms':>14} {'ocr ms':>9} {'accuracy':>9} {'output size':>12}")
+        for name, params in PIPELINES.items():
+            load_ms, preprocess_ms, ocr_ms, accuracy = [], [], [], []
+            for path, text in receipts:
+                start = time.perf_counter()
+                image = load_image(path, params)
+                loaded = time.perf_counter()
+                image = preprocess(image, params)
+                preprocessed = time.perf_counter()
+                load_ms.append((loaded - start) * 1000)
+                preprocess_ms.append((preprocessed - loaded) * 1000)
+                if not args.preprocess_only:
+                    read = engine.read_text(image)
+                    ocr_ms.append((time.perf_counter() - preprocessed) * 1000)
+                    accuracy.append(character_accuracy(read, text))
+
+            ocr = f"{statistics.median(ocr_ms):>9.0f} {statistics.fmean(accuracy):>9.1%}" if ocr_ms else f"{'-':>9} {'-':>9}"
+            print(f"{name:<10} {statistics.median(load_ms):>9.0f} {statistics.median(preprocess_ms):>14.0f} {ocr} "
+                  f"{f'{image.shape[1]}x{image.shape[0]}':>12}")
+
+
+if __name__ == "__main__":
+    main()
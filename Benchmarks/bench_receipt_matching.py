@@ -0,0 +1,77 @@
+"""
+Benchmark of matching item names read from receipts against the known expense names (OCR.receipt_parser.ItemIndex):
+time per line and accuracy, for vocabularies of different sizes.
+
+Usage:
+    python -m Benchmarks.bench_receipt_matching [--sizes 1000 10000 50000] [--lines 2000] [--seed 0]
+"""
+import argparse
+from OCR.receipt_parser import ItemIndex
+import random
+import statistics
+import time
+
+
+# CONSTANTS
+SYLLABLES = ["ba", "ko", "ri", "tan", "mel", "sto", "pe", "gra", "nu", "che", "vo", "lin", "das", "fi", "ore", "qu", "zen", "ham", "pol", "ut"]
+# Characters OCR engines commonly read in place of others
+CONFUSIONS = {"o": "0", "l": "1", "i": "1", "s": "5", "b": "8", "e": "c", "a": "o", "n": "m", "g": "9", "t": "f"}
+ERRORS_PER_LINE = 2
+
+
+def vocabulary(rng: random.Random, size: int) -> list[str]:
+    """
+    Make size distinct names of one to three made-up words.
+    """
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(max(100, size // 4))})
+    names = set()
+    while len(names) < size:
+        names.add(" ".join(rng.sample(words, rng.randint(1, 3))))
+    return sorted(names)
+
+
+def misread(name: str, rng: random.Random) -> str:
+    """
+    The name as an OCR engine might read it off a receipt: in capitals, with a few characters misread or dropped.
+    """
+    chars = list(name)
+    for _ in range(ERRORS_PER_LINE):
+        i = rng.randrange(len(chars))
+        if chars[i] in CONFUSIONS:
+            chars[i] = CONFUSIONS[chars[i]]
+        elif len(chars) > 3:
+            del chars[i]
+    return "".join(chars).upper()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 50_000])
+    parser.add_argument("--lines", type=int, default=2000, help="number of receipt lines matched per size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'names':>8} {'build s':>8} {'median us':>10} {'p99 us':>8} {'correct':>8} {'no match':>9}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        names = vocabulary(rng, size)
+        start = time.perf_counter()
+        index = ItemIndex.from_usage((name, None, 1) for name in names)
+        build = time.perf_counter() - start
+
+        truths = [rng.choice(names) for _ in range(args.lines)]
+        lines = [misread(name, rng) for name in truths]
+        seconds, correct, unmatched = [], 0, 0
+        for line, truth in zip(lines, truths):
+            start = time.perf_counter()
+            found = index.match(line)
+            seconds.append(time.perf_counter() - start)
+            correct += found == truth
+            unmatched += found is None
+        micros = sorted(s * 1e6 for s in seconds)
+        print(f"{size:>8} {build:>8.2f} {statistics.median(micros):>10.0f} {micros[int(0.99 * len(micros))]:>8.0f} "
+              f"{correct / len(lines):>8.1%} {unmatched / len(lines):>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of Database._search_expenses against the correlated NOT EXISTS query it used to run.
+
+Usage:
+    python -m Benchmarks.bench_search_expenses [--sizes 10000 100000 1000000] [--no-indexes] [--timeout 30]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from Database.database import Database, INDEXES
+
+
+# The query _search_expenses ran before it was rewritten, for comparison
+OLD_QUERY = """
+    SELECT * FROM receipts INNER JOIN (SELECT * FROM expenses e1 WHERE NOT EXISTS
+        (SELECT * FROM expenses e2 WHERE e1.item = e2.item and e2.id < e1.id)) e ON receipts.id = e.receipt_id
+    WHERE JulianDay('now') - JulianDay(date) <= ?"""
+
+
+def _fill(database: Database, n_expenses: int, seed: int = 0) -> None:
+    """
+    Fill the database with n_expenses expenses over the last two years, about four expenses per receipt
+    and one distinct item per twenty expenses.
+    """
+    rng = random.Random(seed)
+    n_items = max(100, n_expenses // 20)
+    n_receipts = max(1, n_expenses // 4)
+    with database.transaction() as c:
+        c.execute("INSERT INTO categories (category, subcategory) VALUES ('groceries', '')")
+        c.executemany(
+            "INSERT INTO receipts (id, total, date, location) VALUES (?, 0, date('now', ?), 'store')",
+            ((i + 1, f"-{rng.randrange(730)} days") for i in range(n_receipts))
+        )
+        c.executemany(
+            "INSERT INTO expenses (item, amount, type, receipt_id, category_id) VALUES (?, ?, 'need', ?, 1)",
+            ((f"item {rng.randrange(n_items)}", rng.randrange(100, 10000), rng.randrange(n_receipts) + 1)
+             for _ in range(n_expenses))
+        )
+
+
+def _time(fn, timeout: float) -> float:
+    """
+    Time fn, giving up after timeout seconds (returns None if it timed out).
+    """
+    try:
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            return None
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--no-indexes", action="store_true", help="drop the secondary indexes before timing")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before giving up on a query")
+    args = parser.parse_args()
+
+    print(f"{'expenses':>10} {'old (s)':>10} {'new (s)':>10} {'old item (ms)':>14} {'new item (ms)':>14}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Database(os.path.join(tmp, "bench.db"), resolve=False)
+            database._create_empty_database(os.path.join(tmp, "bench.db"))
+            _fill(database, size)
+            conn = database._get_connection()
+            if args.no_indexes:
+                for index_name in INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+            conn.execute("ANALYZE")
+
+            deadline = [0.0]
+            conn.set_progress_handler(lambda: time.perf_counter() > deadline[0], 10_000)
+
+            def run(fn):
+                deadline[0] = time.perf_counter() + args.timeout
+                return _time(fn, args.timeout)
+
+            old = run(lambda: conn.execute(OLD_QUERY, (365,)).fetchall())
+            new = run(lambda: database._search_expenses(cols=["item"]))
+            old_item = run(lambda: conn.execute(OLD_QUERY + " AND item = ?", (365, "item 1")).fetchall())
+            new_item = run(lambda: database._search_expenses(expense_item="item 1"))
+            database.close()
+
+        def fmt(seconds, scale=1):
+            return f">{args.timeout * scale:.0f}" if seconds is None else f"{seconds * scale:.3f}"
+        print(f"{size:>10} {fmt(old):>10} {fmt(new):>10} {fmt(old_item, 1000):>14} {fmt(new_item, 1000):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Deterministic generator of realistic budget databases, for benchmarks.
+
+Usage:
+    python -m Benchmarks.generator PATH [--years 5] [--seed 0]
+"""
+import argparse
+import datetime
+from itertools import accumulate
+import random
+from Database.database import Database
+from Transactions.expenses import Expense, LedgerEntry, Receipt
+from Transactions.incomes import Income, Paystub, PaystubLedger
+from Transactions.transactions import ExpenseTransaction, IncomeTransaction
+
+
+# CONSTANTS
+ACCOUNTS = [("Visa", "Credit card"), ("Mastercard", "Credit card"), ("Chequing", "Debit card"), ("Cash", "")]
+CATEGORIES = [
+    ("groceries", "produce"), ("groceries", "meat"), ("groceries", "dairy"), ("groceries", "pantry"),
+    ("restaurants", ""), ("transportation", "gas"), ("transportation", "transit"), ("bills", "rent"),
+    ("bills", "utilities"), ("entertainment", ""), ("health", ""), ("savings", "")
+]
+ITEM_WORDS = [
+    "organic", "large", "frozen", "fresh", "whole", "sliced", "family", "spicy", "sweet", "smoked",
+    "red", "green", "light", "extra", "mini", "classic", "greek", "roasted", "wild", "aged"
+]
+ITEM_NOUNS = [
+    "apples", "bananas", "milk", "bread", "chicken", "beef", "cheese", "yogurt", "eggs", "rice",
+    "pasta", "coffee", "tea", "salmon", "tomatoes", "onions", "potatoes", "lettuce", "butter", "cereal",
+    "pizza", "burrito", "gas", "bus pass", "movie", "pharmacy", "hydro", "internet", "rent", "tfsa"
+]
+LOCATIONS = ["Costco", "Loblaws", "Metro", "No Frills", "Shell", "Esso", "Cineplex", "Shoppers", "Amazon", "Landlord"]
+# (payer, days between paystubs, amount in cents)
+PAYERS = [("Work", 14, 250000), ("Side gig", 30, 40000)]
+SPLIT_PAYMENT_RATE = 0.2
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[dict]:
+    """
+    Make size distinct items, each with a category, a type and a typical price (in cents).
+    """
+    names = set()
+    while len(names) < size:
+        words = rng.sample(ITEM_WORDS, rng.randint(0, 2)) + [rng.choice(ITEM_NOUNS)]
+        name = " ".join(words)
+        # Make the name unique once the word combinations run out
+        names.add(name if name not in names else f"{name} {len(names)}")
+    # Sorted first so the order (and so the popularity of each item) only depends on the seed
+    names = sorted(names)
+    rng.shuffle(names)
+    return [
+        {
+            "name": name,
+            "category_id": rng.randrange(len(CATEGORIES)) + 1,
+            "type": rng.choices(["need", "want", "savings"], weights=[6, 3, 1])[0],
+            "price": round(rng.lognormvariate(1.8, 0.9) * 100) + 1,
+        }
+        for name in names
+    ]
+
+
+def _expense_transactions(rng: random.Random, start: datetime.date, end: datetime.date, vocabulary: list[dict],
+                          receipts_per_day: float, excluded_cols: list):
+    """
+    Yield ExpenseTransactions for every day from start to end. Item popularity follows a Zipf-like
+    distribution and some receipts are split across two accounts.
+    """
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    day = start
+    while day <= end:
+        for _ in range(rng.randint(0, round(2 * receipts_per_day))):
+            items = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, 8))
+            receipt = Receipt(total=0, date=day.isoformat(), location=rng.choice(LOCATIONS))
+            expenses = []
+            total = 0
+            for item in items:
+                amount = round(item["price"] * rng.uniform(0.8, 1.2))
+                total += amount
+                expenses.append(Expense(
+                    item=item["name"],
+                    amount=amount,
+                    receipt=receipt,
+                    type=item["type"] if "type" not in excluded_cols else None,
+                    category_id=item["category_id"] if "category_id" not in excluded_cols else None,
+                    details=("" if rng.random() < 0.9 else "on sale") if "details" not in excluded_cols else None
+                ))
+            receipt.total = total
+
+            if rng.random() < SPLIT_PAYMENT_RATE:
+                first = round(total * rng.uniform(0.2, 0.8))
+                account_ids = rng.sample(range(1, len(ACCOUNTS) + 1), 2)
+                ledger_entries = [
+                    LedgerEntry(amount=first, receipt=receipt, account_id=account_ids[0]),
+                    LedgerEntry(amount=total - first, receipt=receipt, account_id=account_ids[1])
+                ]
+            else:
+                ledger_entries = [LedgerEntry(amount=total, receipt=receipt, account_id=rng.randint(1, len(ACCOUNTS)))]
+            yield ExpenseTransaction(receipt=receipt, expenses=expenses, ledger_entries=ledger_entries)
+        day += datetime.timedelta(days=1)
+
+
+def _income_transactions(rng: random.Random, start: datetime.date, end: datetime.date, excluded_cols: list):
+    """
+    Yield IncomeTransactions for each payer in PAYERS, paid every so many days into the chequing account.
+    """
+    for payer, every_days, amount in PAYERS:
+        day = start
+        while day <= end:
+            total = round(amount * rng.uniform(0.95, 1.05))
+            paystub = Paystub(total=total, date=day.isoformat(), payer=payer)
+            details = "" if "income_details" not in excluded_cols else None
+            yield IncomeTransaction(
+                paystub=paystub,
+                income_events=[Income(amount=total, paystub=paystub, details=details)],
+                ledger_entries=[PaystubLedger(amount=total, paystub=paystub, account_id=3)]
+            )
+            day += datetime.timedelta(days=every_days)
+
+
+def generate_database(
+    path: str,
+    years: float = 5,
+    receipts_per_day: float = 3,
+    vocabulary_size: int = 2000,
+    seed: int = 0,
+    end_date: str = None,
+    excluded_cols: list = []
+    ) -> Database:
+    """
+    Create a database at path (with _create_empty_database) and fill it with synthetic history:
+    years of receipts with their expenses and (sometimes split) ledger payments, and regular paystubs.
+    The same arguments always produce the same database.
+
+    Args:
+        path: The path of the database to create.
+        years: How many years of history to generate.
+        receipts_per_day: The average number of receipts per day.
+        vocabulary_size: The number of distinct expense items.
+        seed: The seed of the random number generator.
+        end_date: The date of the last day of history (YYYY-MM-DD), default is today.
+        excluded_cols: The optional columns to leave out of the database (see Database._create_empty_database).
+
+    Returns:
+        The Database.
+    """
+    rng = random.Random(seed)
+    end = datetime.date.fromisoformat(end_date) if end_date else datetime.date.today()
+    start = end - datetime.timedelta(days=round(365 * years) - 1)
+
+    database = Database(path, resolve=False)
+    database._create_empty_database(path, excluded_cols=excluded_cols)
+    with database.transaction() as c:
+        c.executemany("INSERT INTO accounts (name, description) VALUES (?, ?)", ACCOUNTS)
+        if "category_id" not in excluded_cols:
+            c.executemany("INSERT INTO categories (category, subcategory) VALUES (?, ?)", CATEGORIES)
+
+    vocabulary = _vocabulary(rng, vocabulary_size)
+    ExpenseTransaction.execute_many(database, _expense_transactions(rng, start, end, vocabulary, receipts_per_day, excluded_cols))
+    IncomeTransaction.execute_many(database, _income_transactions(rng, start, end, excluded_cols))
+    return database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="path of the database to create")
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--receipts-per-day", type=float, default=3)
+    parser.add_argument("--vocabulary", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end-date", help="last day of history (YYYY-MM-DD), default is today")
+    args = parser.parse_args()
+
+    database = generate_database(args.path, years=args.years, receipts_per_day=args.receipts_per_day,
+                                 vocabulary_size=args.vocabulary, seed=args.seed, end_date=args.end_date)
+    for table_name in ["receipts", "expenses", "ledger", "paystubs"]:
+        print(f"{table_name}: {database.query_db(f'SELECT COUNT(*) FROM {table_name}')[0][0]} rows")
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
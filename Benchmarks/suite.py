@@ -0,0 +1,164 @@
+"""
+Benchmark suite timing the hot paths of Database and Transactions on generated databases of several sizes.
+
+Usage:
+    python -m Benchmarks.suite [--years 1 5 25] [--repeat 20] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+from contextlib import redirect_stdout
+import datetime
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from Benchmarks.generator import generate_database
+from Transactions.expenses import Expense, LedgerEntry, Receipt
+from Transactions.incomes import Income, Paystub, PaystubLedger
+from Transactions.transactions import ExpenseTransaction, IncomeTransaction
+
+
+# The benchmarks are run against history ending on a fixed date so results are comparable across days
+END_DATE = "2026-01-01"
+
+
+def _benchmarks(database) -> dict:
+    """
+    The benchmarks to run on a database, as name -> function. The query cache is cleared before each
+    query so what is timed is the query itself.
+    """
+    item = database.query_db("SELECT item FROM expenses GROUP BY item ORDER BY COUNT(*) DESC LIMIT 1")[0][0]
+    category_ids = [1, 3, 5]
+
+    def uncached(fn):
+        def run():
+            database._query_cache.clear()
+            return fn()
+        return run
+
+    def expense_transaction():
+        receipt = Receipt(total=1250, date=END_DATE, location="Benchmark")
+        return ExpenseTransaction(
+            receipt=receipt,
+            expenses=[Expense(item=item, amount=1250, receipt=receipt, type="need", category_id=1, details="")],
+            ledger_entries=[LedgerEntry(amount=1250, receipt=receipt, account_id=1)]
+        ).execute(database)
+
+    def income_transaction():
+        paystub = Paystub(total=10000, date=END_DATE, payer="Benchmark")
+        return IncomeTransaction(
+            paystub=paystub,
+            income_events=[Income(amount=10000, paystub=paystub, details="")],
+            ledger_entries=[PaystubLedger(amount=10000, paystub=paystub, account_id=3)]
+        ).execute(database)
+
+    def print_table(table_name):
+        def run():
+            with redirect_stdout(io.StringIO()):
+                database.print_table(table_name, pager=False)
+        return run
+
+    return {
+        "search_expenses_all": uncached(lambda: database._search_expenses(days=100000, cols=["item"])),
+        "search_expenses_item": uncached(lambda: database._search_expenses(expense_item=item, days=100000)),
+        "search_categories_all": uncached(lambda: database._search_categories()),
+        "search_categories_ids": uncached(lambda: database._search_categories(category_ids)),
+        "search_incomes_payer": uncached(lambda: database._search_incomes(payer="Work")),
+        "print_table_ledger": uncached(print_table("ledger")),
+        "print_table_categories": uncached(print_table("categories")),
+        "expense_transaction_execute": expense_transaction,
+        "income_transaction_execute": income_transaction,
+    }
+
+
+def _time(fn, repeat: int) -> dict:
+    """
+    Time fn repeat times (after one warm up call).
+
+    Returns:
+        The minimum, median and mean time in milliseconds.
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(times), "median_ms": statistics.median(times), "mean_ms": statistics.fmean(times), "runs": repeat}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(years: list, repeat: int, seed: int = 0) -> dict:
+    """
+    Generate a database for each number of years of history and time every benchmark on it.
+
+    Returns:
+        The results, with the environment they were measured in.
+    """
+    results = {
+        "commit": _git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "scales": {},
+    }
+    for n_years in years:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            database = generate_database(os.path.join(tmp, "bench.db"), years=n_years, seed=seed, end_date=END_DATE)
+            generated_s = time.perf_counter() - start
+            scale = {
+                "years": n_years,
+                "expenses": database.query_db("SELECT COUNT(*) FROM expenses")[0][0],
+                "generate_s": generated_s,
+                "benchmarks": {name: _time(fn, repeat) for name, fn in _benchmarks(database).items()},
+            }
+            database.close()
+        results["scales"][str(n_years)] = scale
+    return results
+
+
+def _print_results(results: dict, baseline: dict = None) -> None:
+    for key, scale in results["scales"].items():
+        print(f"\n{scale['years']} years ({scale['expenses']} expenses, generated in {scale['generate_s']:.1f}s)")
+        baseline_scale = (baseline or {}).get("scales", {}).get(key, {}).get("benchmarks", {})
+        for name, timing in scale["benchmarks"].items():
+            line = f"  {name:<30} {timing['median_ms']:>10.3f} ms"
+            if name in baseline_scale:
+                line += f"  ({timing['median_ms'] / baseline_scale[name]['median_ms']:.2f}x baseline)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 5, 25], help="sizes of history to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run_suite(args.years, args.repeat, seed=args.seed)
+    _print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
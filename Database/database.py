@@ -1,109 +1,1007 @@
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
 from dataclasses import dataclass
+import datetime
+from Database.money import format_cents
+from Database.tracing import QueryTracer, SLOW_QUERY_MS
+import json
+import functools
 import logging
 import os
-from prettytable import from_db_cursor
+from prettytable import PrettyTable
 import re
 import sqlite3
+import threading
+from typing import Callable
+
+
+# CONSTANTS
+DB_EXTENSIONS = (".db", ".sqlite3")
+DB_PATH_ENV_VAR = "BUDGET_DB"
+CONFIG_PATH = os.environ.get(
+    "BUDGET_CONFIG",
+    os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "personal-budget", "config.json")
+)
+MAX_SEARCH_DEPTH = 3
+STATEMENT_CACHE_SIZE = 256
+FETCH_CHUNK_SIZE = 1000
+PAGE_SIZE = 100
+MIN_ROWID = -2**63
+QUERY_CACHE_SIZE = 128
+QUERY_CACHE_MAX_ROWS = 10000
+MIGRATION_BATCH_SIZE = 10000
+SKIPPED_DIRS = {"__pycache__", "node_modules", "site-packages", "venv", "env", "build", "dist"}
+RECEIPT_COLS = ("total", "date", "location")
+INDEXES = {
+    "expenses_item_id": ("expenses", ("item", "id")),
+    "expenses_receipt_id": ("expenses", ("receipt_id",)),
+    "expenses_category_id": ("expenses", ("category_id",)),
+    "receipts_date": ("receipts", ("date",)),
+    "ledger_receipt_id": ("ledger", ("receipt_id",)),
+    "ledger_account_id": ("ledger", ("account_id",)),
+    "paystub_ledger_account_id": ("paystub_ledger", ("account_id",)),
+    "paystubs_payer": ("paystubs", ("payer",)),
+    "paystubs_date": ("paystubs", ("date",)),
+}
+# Table -> columns holding amounts of money, stored as integer cents
+MONEY_TABLES = {
+    "receipts": ("total",),
+    "expenses": ("amount",),
+    "ledger": ("amount",),
+    "incomes": ("amount",),
+    "paystubs": ("total",),
+    "paystub_ledger": ("amount",),
+}
+# Rollup table -> (source table, parent table, column of the source referencing the parent, key column, key expression).
+# In the key expression, {row} is the source row and parent is its receipt or paystub.
+ROLLUPS = {
+    "monthly_category_totals": ("expenses", "receipts", "receipt_id", "category_id", "{row}.category_id"),
+    "monthly_type_totals": ("expenses", "receipts", "receipt_id", "type", "{row}.type"),
+    "monthly_account_spending": ("ledger", "receipts", "receipt_id", "account_id", "{row}.account_id"),
+    "monthly_account_income": ("paystub_ledger", "paystubs", "paystub_id", "account_id", "{row}.account_id"),
+    "monthly_payer_income": ("incomes", "paystubs", "paystub_id", "payer", "parent.payer"),
+}
+# Table -> columns printed as dollars: the money columns, the rollup totals and the balance checkpoints
+PRINTED_MONEY_COLS = {
+    **MONEY_TABLES,
+    **{rollup_name: ("total",) for rollup_name in ROLLUPS},
+    "account_balances": ("balance",),
+}
+REPORT_MONTHS = 12
+# Columns of the monthly reports holding amounts of money
+REPORT_MONEY_COLS = ("total", "spent", "earned")
+
+
+def _cached_query(method):
+    """
+    Decorator memoizing the result of a read-only Database method in the database's query cache
+    (see Database._cached). The cached result is shared between callers, so it must not be modified.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = repr((method.__name__, args, sorted(kwargs.items())))
+        return self._cached(key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
+
+def _log_prefetch_error(future: Future) -> None:
+    # A failed prefetch only means the query is run again when it is needed
+    if not future.cancelled() and future.exception() is not None:
+        logging.warning(f"Prefetch failed. See error message -> {future.exception()}")
+
+
+class ColumnarResult(dict):
+    """
+    The result of a query stored column by column: a dictionary of column name -> values of that column.
+    """
+    @classmethod
+    def from_cursor(cls, cursor: sqlite3.Cursor, numeric_arrays: bool = False, chunk_size: int = FETCH_CHUNK_SIZE) -> "ColumnarResult":
+        """
+        Read the rows of an executed query chunk_size at a time and transpose them into columns.
+
+        Args:
+            cursor: A cursor on which a query was executed.
+            numeric_arrays: Whether to store columns holding only numbers as arrays (array.array) instead of lists.
+            chunk_size: How many rows to fetch at a time.
+
+        Returns:
+            A ColumnarResult with one entry per column of the query.
+        """
+        names = [col_data[0] for col_data in cursor.description]
+        columns = [[] for _ in names]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+
+        if numeric_arrays:
+            columns = [cls._to_array(column) for column in columns]
+        return cls(zip(names, columns))
+
+    @staticmethod
+    def _to_array(column: list):
+        """
+        Store a column as an array of integers or floats if it holds only numbers, otherwise leave it as a list.
+        """
+        if not column:
+            return column
+        types = set(map(type, column))
+        if types == {int}:
+            return array("q", column)
+        if types <= {int, float}:
+            return array("d", column)
+        return column
+
+    @property
+    def num_rows(self) -> int:
+        return len(next(iter(self.values()), ()))
 
 
 @dataclass
 class Database:
     """
     A Database is a class to organize all the operations that actually interact with the sqlite database.
-    The path attribute is automatically set when the class is initialized.
+    The path attribute is automatically set when the class is initialized (see _resolve_path),
+    unless resolve is False, in which case the path given is used as is (eg: for a database about to be created).
+
+    A single connection to the database is opened lazily and reused for the lifetime of the object,
+    call close() when done with the database. That connection belongs to the thread that created the object,
+    other threads (eg: the prefetch thread, see prefetch) read through read-only connections of their own.
+
+    The results of read-only queries (methods decorated with _cached_query) are kept in a small LRU cache
+    which is emptied whenever the database changes, through this connection or any other.
 
     Attributes:
         path: The path to the database.
+        numeric_arrays: Whether the _search_* methods return numeric columns as compact arrays instead of lists.
+        tracer: The QueryTracer recording every statement run, if tracing is enabled (see enable_tracing).
+        new_path: The path given explicitly (argument or DB_PATH_ENV_VAR) when no file exists there yet,
+                  where a new database is to be created instead of looking for another one.
     """
-    def __init__(self):
-        db_regex = re.compile(r'(.*)(\.db|\.sqlite3)$')
-        path = "."
-        files = []
-        for r, _, f in os.walk(path):
-            for file in f:
-                files.append(os.path.join(r, file))
-        matches = list(filter(lambda x: db_regex.match(x), files))
+    def __init__(self, path: str = None, resolve: bool = True):
+        self.numeric_arrays = False
+        self.tracer = None
+        self._connection = None
+        self._connection_path = None
+        self._writer_thread = threading.get_ident()
+        # Each other thread's read-only connection (see _get_read_connection), and all of them to close them
+        self._readers = threading.local()
+        self._read_connections = []
+        # Results of read-only queries (see _cached), least recently used first. The generation is bumped
+        # every time the cache is emptied, and keys being computed on another thread map to an event set when done.
+        self._query_cache = OrderedDict()
+        self._query_cache_stamp = None
+        self._query_cache_generation = 0
+        self._query_cache_pending = {}
+        self._query_cache_lock = threading.RLock()
+        self._prefetcher = None
+        self.path = self._resolve_path(path) if resolve else path
+        self.new_path = (path or os.environ.get(DB_PATH_ENV_VAR)) if resolve and self.path is None else None
+
+    @staticmethod
+    def _resolve_path(path: str = None) -> str:
+        """
+        Find the database to use, from the first of the following that is set:
+            1. The path passed in (eg: from the command line).
+            2. The path in the environment variable DB_PATH_ENV_VAR.
+            3. The last database used, remembered in CONFIG_PATH (if the file still exists).
+            4. A scan of the working directory, at most MAX_SEARCH_DEPTH directories deep.
+        A path given explicitly (1 or 2) is never replaced by another database: if no file exists there,
+        no database is found (and a new one is to be created at that path).
+
+        Args:
+            path: An explicit path to the database.
+
+        Returns:
+            The path to the database, or None if no database was found.
+        """
+        explicit_path = path or os.environ.get(DB_PATH_ENV_VAR)
+        if explicit_path:
+            if os.path.isfile(explicit_path):
+                return explicit_path
+            logging.warning(f"Database {explicit_path} does not exist.")
+            return None
+
+        remembered_path = Database._read_remembered_path()
+        if remembered_path and os.path.isfile(remembered_path):
+            return remembered_path
+
+        matches = Database._scan_for_databases(".")
         if len(matches) == 0:
-            self.path = None
+            return None
         elif len(matches) == 1:
-            self.path = matches[0]
-        else:
-            print("Multiple databases found, please enter the index of the database you want to use: ")
-            for i, match in enumerate(matches):
-                print(f"{i+1}: {match}")
+            return matches[0]
+
+        print("Multiple databases found, please enter the index of the database you want to use: ")
+        for i, match in enumerate(matches):
+            print(f"{i+1}: {match}")
+        try:
+            db_idx = int(input("> "))
+            assert(db_idx >= 1 and db_idx <= len(matches))
+        except (ValueError, AssertionError):
+            print("Invalid selection.")
+            return None
+        return matches[db_idx - 1]
+
+    @staticmethod
+    def _scan_for_databases(root: str, max_depth: int = MAX_SEARCH_DEPTH) -> list:
+        """
+        Search a directory for database files (.db or .sqlite3), skipping hidden and vendored directories.
+
+        Args:
+            root: The directory to start the search from.
+            max_depth: How many directories below root to search.
+
+        Returns:
+            A sorted list of the paths of the databases found.
+        """
+        matches = []
+        directories = [(root, 0)]
+        while directories:
+            directory, depth = directories.pop()
             try:
-                db_idx = int(input("> "))
-                assert(db_idx >= 1 and db_idx <= len(matches))
-            except ValueError:
-                print("Invalid selection.")
-                self.path = None
-            except AssertionError:
-                print("Invalid selection.")
-                self.path = None
-            self.path = matches[db_idx - 1]
-            self.history = []
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if depth < max_depth and entry.name not in SKIPPED_DIRS:
+                        directories.append((entry.path, depth + 1))
+                elif entry.name.endswith(DB_EXTENSIONS):
+                    matches.append(entry.path)
+        return sorted(matches)
+
+    @staticmethod
+    def _read_remembered_path() -> str:
+        """
+        Read the path of the last database used from the config file.
+
+        Returns:
+            The remembered path, or None if there is none.
+        """
+        try:
+            with open(CONFIG_PATH) as f:
+                return json.load(f).get("last_database")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    def _remember_path(path: str) -> None:
+        """
+        Save the path of the database to the config file so it is found immediately next time.
+
+        Args:
+            path: The path to the database.
+        """
+        try:
+            os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
+            with open(CONFIG_PATH, "w") as f:
+                json.dump({"last_database": os.path.abspath(path)}, f)
+        except OSError as e:
+            logging.warning(f"Could not remember database path in {CONFIG_PATH}. See error message -> {e}")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        Return the long-lived connection to the database, opening it on first use
+        (or if the path of the database has changed since it was opened).
+
+        Returns:
+            The database connection.
+        """
+        if self._connection is not None and self._connection_path != self.path:
+            self.close()
+        if self._connection is None:
+            logging.info(f"Opening connection to database {self.path}.")
+            self._connection = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+            self._connection_path = self.path
+            if self.tracer is not None:
+                self._connection.set_trace_callback(self.tracer.trace_callback)
+
+            # Bring databases created by older versions up to date. A brand new (empty) database
+            # is migrated by _create_empty_database once its tables exist.
+            cursor = self._cursor(self._connection)
+            if cursor.execute("SELECT count(*) FROM sqlite_master WHERE type='table'").fetchone()[0]:
+                self._migrate(cursor)
+                self._connection.commit()
+            cursor.close()
+        return self._connection
+
+    def _get_read_connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's read-only connection to the database, opening it on first use. Threads other than
+        the one that created the Database read through a connection of their own, so they never wait on
+        (or interfere with) the writer's connection.
+
+        Returns:
+            The database connection.
+        """
+        conn = getattr(self._readers, "connection", None)
+        if conn is None:
+            logging.info(f"Opening read connection to database {self.path}.")
+            # Only ever used by this thread, but closed by close() from the writer's thread
+            conn = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            if self.tracer is not None:
+                conn.set_trace_callback(self.tracer.trace_callback)
+            self._readers.connection = conn
+            with self._query_cache_lock:
+                self._read_connections.append(conn)
+        return conn
+
+    def _in_writer_thread(self) -> bool:
+        return threading.get_ident() == self._writer_thread
+
+    def _cursor(self, conn: sqlite3.Connection) -> sqlite3.Cursor:
+        """
+        Create a cursor on the connection, which reports to the tracer if tracing is enabled.
+        """
+        if self.tracer is not None:
+            return conn.cursor(self.tracer.cursor_class)
+        return conn.cursor()
+
+    def enable_tracing(self, slow_threshold_ms: float = SLOW_QUERY_MS, slow_log_path: str = None) -> QueryTracer:
+        """
+        Start recording every statement run on the database (see QueryTracer).
+
+        Args:
+            slow_threshold_ms: Statements taking at least this long are written to the slow-query log.
+            slow_log_path: The path of the slow-query log (default is to log slow statements as warnings).
+
+        Returns:
+            The QueryTracer.
+        """
+        self.tracer = QueryTracer(slow_threshold_ms=slow_threshold_ms, slow_log_path=slow_log_path)
+        if self._connection is not None:
+            self._connection.set_trace_callback(self.tracer.trace_callback)
+        return self.tracer
+
+    def _migrate(self, c: sqlite3.Cursor) -> None:
+        """
+        Apply the migrations the database hasn't had yet, in order. The number of migrations
+        applied is stored in the database's user_version.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        migrations = [self._create_indexes, self._create_rollups, self._create_balances, self._convert_to_cents,
+                      self._create_receipt_scans, self._create_ocr_cache, self._add_rollup_parent_triggers,
+                      self._add_balance_parent_triggers]
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for new_version, migration in enumerate(migrations[version:], start=version + 1):
+            logging.info(f"Migrating database {self.path} to version {new_version} ({migration.__name__}).")
+            migration(c)
+            c.execute(f"PRAGMA user_version = {new_version}")
+
+    @staticmethod
+    def _create_indexes(c: sqlite3.Cursor) -> None:
+        """
+        Create the secondary indexes in INDEXES, skipping any whose table or columns
+        were excluded when the database was created.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        for index_name, (table_name, cols) in INDEXES.items():
+            table_cols = [col[1] for col in c.execute(f"PRAGMA table_info({table_name})").fetchall()]
+            if all(col in table_cols for col in cols):
+                c.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(cols)})")
+
+    @staticmethod
+    def _rollup_sources(c: sqlite3.Cursor) -> dict:
+        """
+        Returns the rollups in ROLLUPS that can be kept in this database (those whose tables and
+        key column weren't excluded when the database was created).
+        """
+        sources = {}
+        for rollup_name, (source, parent, parent_col, key, key_expr) in ROLLUPS.items():
+            source_cols = [col[1] for col in c.execute(f"PRAGMA table_info({source})").fetchall()]
+            if parent_col in source_cols and ("{row}" not in key_expr or key in source_cols):
+                sources[rollup_name] = (source, parent, parent_col, key, key_expr)
+        return sources
+
+    @staticmethod
+    def _create_rollups(c: sqlite3.Cursor) -> None:
+        """
+        Create the monthly rollup tables in ROLLUPS (the total amount and number of rows per month and key,
+        eg: per month and category), the triggers keeping them up to date as rows are inserted into and
+        deleted from their source tables, and fill them from the existing rows.
+
+        A row's month is its receipt's or paystub's, so deleting the receipt or paystub first takes its rows out
+        of the rollups (they are left without a month), and deleting them afterwards changes nothing.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        for rollup_name, (source, parent, parent_col, key, key_expr) in Database._rollup_sources(c).items():
+            c.execute(f"""CREATE TABLE IF NOT EXISTS {rollup_name} (
+                month TEXT NOT NULL,
+                {key},
+                total INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (month, {key})
+            )""")
+            # The receipt or paystub is always inserted before the rows referencing it (see Transaction._write)
+            c.execute(f"""CREATE TRIGGER IF NOT EXISTS {rollup_name}_insert AFTER INSERT ON {source}
+            BEGIN
+                INSERT INTO {rollup_name} (month, {key}, total, count)
+                    SELECT substr(parent.date, 1, 7), {key_expr.format(row="NEW")}, NEW.amount, 1
+                    FROM {parent} parent WHERE parent.id = NEW.{parent_col}
+                    ON CONFLICT (month, {key}) DO UPDATE SET total = total + excluded.total, count = count + 1;
+            END""")
+            c.execute(f"""CREATE TRIGGER IF NOT EXISTS {rollup_name}_delete AFTER DELETE ON {source}
+            BEGIN
+                UPDATE {rollup_name} SET total = total - OLD.amount, count = count - 1
+                    WHERE (month, {key}) IN (
+                        SELECT substr(parent.date, 1, 7), {key_expr.format(row="OLD")}
+                        FROM {parent} parent WHERE parent.id = OLD.{parent_col}
+                    );
+                DELETE FROM {rollup_name} WHERE count <= 0;
+            END""")
+            # Before the delete, so the receipt or paystub can still be joined like in the source's triggers
+            rows = f"""FROM {source} src INNER JOIN {parent} parent ON parent.id = src.{parent_col}
+                            WHERE parent.id = OLD.id AND {key_expr.format(row="src")} IS {rollup_name}.{key}"""
+            c.execute(f"""CREATE TRIGGER IF NOT EXISTS {rollup_name}_{parent}_delete BEFORE DELETE ON {parent}
+            BEGIN
+                UPDATE {rollup_name} SET total = total - (SELECT coalesce(SUM(src.amount), 0) {rows}),
+                                         count = count - (SELECT COUNT(*) {rows})
+                    WHERE month = substr(OLD.date, 1, 7);
+                DELETE FROM {rollup_name} WHERE count <= 0;
+            END""")
+        Database._rebuild_rollups(c)
+
+    @staticmethod
+    def _add_rollup_parent_triggers(c: sqlite3.Cursor) -> None:
+        """
+        Add the triggers taking rows out of the rollups when their receipt or paystub is deleted (see _create_rollups),
+        and recompute the rollups, which were left wrong wherever a receipt or paystub was deleted before its rows.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        Database._create_rollups(c)
+
+    @staticmethod
+    def _rebuild_rollups(c: sqlite3.Cursor) -> None:
+        """
+        Recompute the monthly rollup tables from their source tables.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        for rollup_name, (source, parent, parent_col, key, key_expr) in Database._rollup_sources(c).items():
+            c.execute(f"DELETE FROM {rollup_name}")
+            c.execute(f"""
+            INSERT INTO {rollup_name} (month, {key}, total, count)
+                SELECT substr(parent.date, 1, 7), {key_expr.format(row="src")}, SUM(src.amount), COUNT(*)
+                FROM {source} src INNER JOIN {parent} parent ON parent.id = src.{parent_col}
+                GROUP BY 1, 2""")
+
+    @staticmethod
+    def _create_balances(c: sqlite3.Cursor) -> None:
+        """
+        Create the account balance checkpoints: the balance of each account (money paid into it through paystub_ledger
+        minus money paid out of it through ledger) at the end of every month it was used, kept up to date by triggers
+        on ledger and paystub_ledger, and fill them from the existing rows.
+
+        A payment changes the checkpoint of its month and of every later month of its account,
+        so adding a transaction costs one update per month of history after its date.
+        Like the rollups (see _create_rollups), deleting a receipt or paystub before its payments reverses them.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        # Balances as of a date scan that date's month of paystubs by date
+        Database._create_indexes(c)
+        c.execute("""CREATE TABLE IF NOT EXISTS account_balances (
+            account_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            balance INTEGER NOT NULL,
+            PRIMARY KEY (account_id, month)
+        )""")
+        for source, parent, parent_col, sign in (("ledger", "receipts", "receipt_id", "-"), ("paystub_ledger", "paystubs", "paystub_id", "+")):
+            for event, row, change in (("INSERT", "NEW", sign), ("DELETE", "OLD", "+" if sign == "-" else "-")):
+                month = f"(SELECT substr(date, 1, 7) FROM {parent} WHERE id = {row}.{parent_col})"
+                c.execute(f"""CREATE TRIGGER IF NOT EXISTS account_balances_{source}_{event.lower()} AFTER {event} ON {source}
+                BEGIN
+                    INSERT OR IGNORE INTO account_balances (account_id, month, balance)
+                        SELECT {row}.account_id, {month}, coalesce((
+                            SELECT balance FROM account_balances
+                                WHERE account_id = {row}.account_id AND month < {month}
+                                ORDER BY month DESC LIMIT 1
+                        ), 0);
+                    UPDATE account_balances SET balance = balance {change} {row}.amount
+                        WHERE account_id = {row}.account_id AND month >= {month};
+                END""")
+            # Before the delete, while the receipt's or paystub's date is still what the payments' month is
+            reverse = "+" if sign == "-" else "-"
+            c.execute(f"""CREATE TRIGGER IF NOT EXISTS account_balances_{parent}_delete BEFORE DELETE ON {parent}
+            BEGIN
+                UPDATE account_balances SET balance = balance {reverse} (
+                    SELECT SUM(l.amount) FROM {source} l WHERE l.{parent_col} = OLD.id AND l.account_id = account_balances.account_id
+                )
+                    WHERE month >= substr(OLD.date, 1, 7)
+                    AND account_id IN (SELECT account_id FROM {source} WHERE {parent_col} = OLD.id);
+            END""")
+        Database._rebuild_balances(c)
+
+    @staticmethod
+    def _add_balance_parent_triggers(c: sqlite3.Cursor) -> None:
+        """
+        Add the triggers reversing a receipt's or paystub's payments when it is deleted (see _create_balances),
+        and recompute the checkpoints, which were left wrong wherever a receipt or paystub was deleted before its payments.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        Database._create_balances(c)
+
+    @staticmethod
+    def _rebuild_balances(c: sqlite3.Cursor) -> None:
+        """
+        Recompute the account balance checkpoints from ledger and paystub_ledger.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        c.execute("DELETE FROM account_balances")
+        c.execute("""
+        INSERT INTO account_balances (account_id, month, balance)
+            SELECT account_id, month, SUM(SUM(amount)) OVER (PARTITION BY account_id ORDER BY month)
+            FROM (
+                SELECT l.account_id, substr(r.date, 1, 7) AS month, -l.amount AS amount
+                    FROM ledger l INNER JOIN receipts r ON r.id = l.receipt_id
+                UNION ALL
+                SELECT l.account_id, substr(p.date, 1, 7) AS month, l.amount AS amount
+                    FROM paystub_ledger l INNER JOIN paystubs p ON p.id = l.paystub_id
+            )
+            GROUP BY account_id, month""")
+
+    def rebuild_rollups(self) -> None:
+        """
+        Recompute the monthly rollup tables and the account balance checkpoints from scratch. The triggers only follow
+        rows being inserted and deleted, so this is needed after rows were updated in place
+        (eg: an amount or a date fixed with an SQL query).
+
+        Effects:
+            Modifies the monthly rollup tables and table 'account_balances' in the database.
+        """
+        with self.transaction() as c:
+            self._rebuild_rollups(c)
+            self._rebuild_balances(c)
+
+    def account_balances(self, date: str = None) -> dict:
+        """
+        The balance of every account at the end of a date: the last checkpoint before that date's month
+        plus the payments made from the start of the month to the date.
+
+        Args:
+            date: The date (YYYY-MM-DD), default is today.
+
+        Returns:
+            A dictionary of column name -> list of values with the id, name and balance of each account.
+        """
+        # Today is resolved before the cache is looked up, so a session left open past midnight doesn't get yesterday's balances
+        return self._account_balances(date or datetime.date.today().isoformat())
+
+    @_cached_query
+    def _account_balances(self, date: str) -> dict:
+        with self._create_connection() as c:
+            c.execute("""
+            WITH checkpoints AS (
+                SELECT b.account_id, b.balance FROM account_balances b
+                    WHERE b.month = (SELECT MAX(month) FROM account_balances WHERE account_id = b.account_id AND month < substr(:date, 1, 7))
+            ), payments AS (
+                SELECT l.account_id, -l.amount AS amount
+                    FROM receipts r INNER JOIN ledger l ON l.receipt_id = r.id
+                    WHERE r.date BETWEEN date(:date, 'start of month') AND :date
+                UNION ALL
+                SELECT l.account_id, l.amount AS amount
+                    FROM paystubs p INNER JOIN paystub_ledger l ON l.paystub_id = p.id
+                    WHERE p.date BETWEEN date(:date, 'start of month') AND :date
+            )
+            SELECT accounts.id, accounts.name, coalesce(checkpoints.balance, 0) + coalesce(month.amount, 0) AS balance
+                FROM accounts
+                LEFT JOIN checkpoints ON checkpoints.account_id = accounts.id
+                LEFT JOIN (SELECT account_id, SUM(amount) AS amount FROM payments GROUP BY account_id) month
+                    ON month.account_id = accounts.id
+                ORDER BY accounts.id""", {"date": date})
+            return ColumnarResult.from_cursor(c, numeric_arrays=self.numeric_arrays)
+
+    @staticmethod
+    def _convert_to_cents(c: sqlite3.Cursor) -> None:
+        """
+        Convert the amounts of money in MONEY_TABLES from REAL dollars to INTEGER cents. SQLite can't change
+        the type of a column, so each table is copied (MIGRATION_BATCH_SIZE rows at a time) into a new table
+        with INTEGER columns, which then replaces it. The rollup tables and balance checkpoints (and their triggers)
+        are recreated afterwards, since they depend on the converted tables.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        tables = {
+            name: sql for name, sql in c.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall()
+            if name in MONEY_TABLES and any(re.search(rf"\b{col} REAL\b", sql) for col in MONEY_TABLES[name])
+        }
+        if not tables:
+            # A database created with INTEGER amounts
+            return
+
+        c.execute("SAVEPOINT convert_to_cents")
+        try:
+            for (trigger_name,) in c.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+                c.execute(f"DROP TRIGGER {trigger_name}")
+            for rollup_name in [*ROLLUPS, "account_balances"]:
+                c.execute(f"DROP TABLE IF EXISTS {rollup_name}")
+
+            for table_name, sql in tables.items():
+                money_cols = MONEY_TABLES[table_name]
+                for col in money_cols:
+                    sql = re.sub(rf"\b{col} REAL\b", f"{col} INTEGER", sql)
+                c.execute(re.sub(rf"\b{table_name}\b", f"{table_name}_cents", sql, count=1))
+
+                cols = [col[1] for col in c.execute(f"PRAGMA table_info({table_name})").fetchall()]
+                select = ", ".join(f"CAST(round({col} * 100) AS INTEGER)" if col in money_cols else col for col in cols)
+                last_rowid = MIN_ROWID
+                copied = 0
+                while True:
+                    c.execute(f"""
+                    INSERT INTO {table_name}_cents ({', '.join(cols)})
+                        SELECT {select} FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?""", (last_rowid, MIGRATION_BATCH_SIZE))
+                    copied += c.rowcount
+                    if c.rowcount < MIGRATION_BATCH_SIZE:
+                        break
+                    last_rowid = c.execute(f"SELECT MAX(rowid) FROM {table_name}_cents").fetchone()[0]
+                    logging.info(f"Converted {copied} rows of table {table_name} to cents.")
+                c.execute(f"DROP TABLE {table_name}")
+                c.execute(f"ALTER TABLE {table_name}_cents RENAME TO {table_name}")
+                logging.info(f"Converted table {table_name} to cents ({copied} rows).")
+
+            Database._create_indexes(c)
+            Database._create_rollups(c)
+            Database._create_balances(c)
+        except BaseException:
+            c.execute("ROLLBACK TO convert_to_cents")
+            c.execute("RELEASE convert_to_cents")
+            raise
+        c.execute("RELEASE convert_to_cents")
+
+    @staticmethod
+    def _create_receipt_scans(c: sqlite3.Cursor) -> None:
+        """
+        Create the table storing the text read from scanned receipt images.
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        c.execute("""CREATE TABLE IF NOT EXISTS receipt_scans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL,
+            text TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            scanned_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )""")
+
+    @staticmethod
+    def _create_ocr_cache(c: sqlite3.Cursor) -> None:
+        """
+        Create the table caching the text read from receipt images (see OCR.cache.OCRCache).
+
+        Args:
+            c: A cursor on the database connection.
+        """
+        c.execute("""CREATE TABLE IF NOT EXISTS ocr_cache (
+            image_hash TEXT NOT NULL,
+            params_hash TEXT NOT NULL,
+            text TEXT NOT NULL,
+            last_used INTEGER NOT NULL,
+            PRIMARY KEY (image_hash, params_hash)
+        )""")
+        c.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used)")
 
     @contextmanager
     def _create_connection(self):
         """
-        Create a database connection to a SQLite database.
+        Borrow a cursor on the database connection. Any changes made through the cursor
+        are committed when the block exits. Outside the writer's thread the cursor is on
+        the thread's read-only connection (see _get_read_connection).
 
         Yields:
-            The database connection.
+            A cursor on the database connection.
+        """
+        conn = self._get_connection() if self._in_writer_thread() else self._get_read_connection()
+        cursor = self._cursor(conn)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            if conn.in_transaction:
+                conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Open an explicit transaction on the database connection. The transaction is committed
+        if the block exits normally and rolled back if it raises.
+
+        Yields:
+            A cursor on the database connection.
         """
-        conn = sqlite3.connect(self.path)
+        conn = self._get_connection()
+        cursor = self._cursor(conn)
         try:
-            cursor =  conn.cursor()
+            cursor.execute("BEGIN")
             yield cursor
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if conn.in_transaction:
+                conn.commit()
         finally:
-            logging.info("Closing connection to database.")
-            conn.commit()
-            conn.close()
+            cursor.close()
 
-    def print_table(self, table_name: str, sql_query: str = "", cols: str = "") -> None:
+    def _cached(self, key: str, compute):
+        """
+        Return the cached result for key, computing and caching it if needed.
+
+        The cache is emptied whenever the database has changed since the results were cached:
+        total_changes counts rows changed through this connection, PRAGMA data_version changes when
+        another connection commits and PRAGMA schema_version changes when the schema does.
+        At most QUERY_CACHE_SIZE results are kept, and results with more than QUERY_CACHE_MAX_ROWS rows are not cached.
+
+        Only the writer's thread checks whether the database has changed. Other threads (see prefetch)
+        use the cache as it is and only add their results if it wasn't emptied while they were computed.
+        A result being computed on another thread is waited for rather than computed twice.
+
+        Args:
+            key: The key of the query (method name and arguments).
+            compute: A function running the query.
+
+        Returns:
+            The result of the query.
+        """
+        writer = self._in_writer_thread()
+        if writer:
+            self._check_query_cache()
+        while True:
+            with self._query_cache_lock:
+                if key in self._query_cache:
+                    self._query_cache.move_to_end(key)
+                    return self._query_cache[key]
+                pending = self._query_cache_pending.get(key)
+                if pending is None:
+                    generation = self._query_cache_generation
+                    done = self._query_cache_pending[key] = threading.Event()
+                    break
+            # Being computed on another thread: wait for it, then look again
+            pending.wait()
+            if writer:
+                self._check_query_cache()
+
+        try:
+            result = compute()
+        finally:
+            with self._query_cache_lock:
+                del self._query_cache_pending[key]
+            done.set()
+        with self._query_cache_lock:
+            if generation == self._query_cache_generation and result is not None and self._result_rows(result) <= QUERY_CACHE_MAX_ROWS:
+                self._query_cache[key] = result
+                if len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return result
+
+    def _check_query_cache(self) -> None:
+        """
+        Empty the query cache if the database has changed since it was last checked (see _cached).
+        Only called from the writer's thread, since it uses the writer's connection.
+        """
+        conn = self._get_connection()
+        stamp = (
+            conn.total_changes,
+            conn.execute("PRAGMA data_version").fetchone()[0],
+            conn.execute("PRAGMA schema_version").fetchone()[0]
+        )
+        with self._query_cache_lock:
+            if stamp != self._query_cache_stamp:
+                self._query_cache.clear()
+                self._query_cache_stamp = stamp
+                self._query_cache_generation += 1
+
+    def prefetch(self, fetch: Callable[[], object]) -> Future:
+        """
+        Run read-only queries (calls to methods decorated with _cached_query) on a background thread, so their
+        results are already cached when they are needed (eg: while the user is typing). Asking for a query that
+        is still being prefetched waits for it instead of running it twice.
+
+        Args:
+            fetch: A function making the queries, run on the prefetch thread with its own read-only connection.
+
+        Returns:
+            A Future for the value returned by fetch. If fetch fails the error is logged, and the queries
+            simply run again when they are needed.
+        """
+        # Checked now, so results cached by the prefetch aren't thrown away by the next check for no reason
+        self._check_query_cache()
+        if self._prefetcher is None:
+            self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        future = self._prefetcher.submit(fetch)
+        future.add_done_callback(_log_prefetch_error)
+        return future
+
+    @staticmethod
+    def _result_rows(result) -> int:
+        if isinstance(result, ColumnarResult):
+            return result.num_rows
+        if isinstance(result, tuple):
+            # A page from _read_page
+            return len(result[1])
+        return len(result)
+
+    def close(self) -> None:
+        """
+        Commit any pending changes and close the connection to the database.
+        """
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown(wait=True, cancel_futures=True)
+            self._prefetcher = None
+        with self._query_cache_lock:
+            for conn in self._read_connections:
+                conn.close()
+            self._read_connections = []
+            self._readers = threading.local()
+            self._query_cache.clear()
+            self._query_cache_stamp = None
+            self._query_cache_generation += 1
+        if self._connection is None:
+            return
+        logging.info("Closing connection to database.")
+        try:
+            self._connection.commit()
+        finally:
+            self._connection.close()
+            self._connection = None
+            self._connection_path = None
+
+    def print_table(self, table_name: str, sql_query: str = "", cols: str = "", page_size: int = PAGE_SIZE, pager: bool = True) -> None:
         """
         Print the contents of a table in the database using package PrettyTable.
         By default, prints the entire table, but can be modified to print a subset of the table.
 
         The function will first look to use the SQL query, then it will use the cols argument to print the whole table.
 
+        Rows are fetched and printed page_size at a time. If there is more than one page and pager is True,
+        the user can move between pages, otherwise only the first page is printed. Tables are paged by rowid
+        (so any page is a single index lookup, however far into the table it is), SQL queries can only be paged forward.
+
         Args:
             table_name: The name of the table to print.
             sql_query: An optional sql query to use to print the table.
             cols: The names of the columns to print (default is none, which prints all columns).
+            page_size: The number of rows to print at a time.
+            pager: Whether to let the user page through the rows (otherwise only the first page is printed).
         """
-        with self._create_connection() as c:
-
-            if sql_query != "":
+        if sql_query != "":
+            with self._create_connection() as c:
                 try:
                     c.execute(sql_query)
                 except sqlite3.OperationalError as e:
                     logging.error(f"Invalid SQL query. See error message -> {e}")
                     return
+                self._page_cursor(c, page_size, pager)
+            return
 
-            elif cols != "":
-                try:
-                    c.execute(f"SELECT {cols} FROM {table_name}")
-                except sqlite3.OperationalError as e:
-                    # Two possible errors: either table name was invalid or column name was invalid
-                    if "no such table" in str(e):
-                        logging.error(f"Table {table_name} does not exist in database {self.path}.")
-                        return
-                    else:
-                        # Find the column name(s) in the error message (typical error message has two colons in it, 
-                        # the latter of which is directly before the column name that caused an error.
-                        logging.error(f"Column {str(e).split(': ')[-1]} does not exist in table {table_name}.")
-                        return
-            else:
-                try:
-                    c.execute(f"SELECT * FROM {table_name}")
-                except:
-                    logging.error(f"Table {table_name} does not exist.")
-                    return
+        # Stack of the rowid each page visited so far starts after
+        page_starts = [MIN_ROWID]
+        while True:
+            page = self._read_page(table_name, cols, page_starts[-1], page_size)
+            if page is None:
+                return
+            names, rows, more = page
+            self._print_rows(names, [row[1:] for row in rows], PRINTED_MONEY_COLS.get(table_name, ()))
+
+            first_row = (len(page_starts) - 1) * page_size + 1
+            if not more and len(page_starts) == 1:
+                return
+            if not pager:
+                print(f"Only the first {page_size} rows are shown.")
+                return
+            print(f"Showing rows {first_row}-{first_row + len(rows) - 1}. Press enter for the next page, "
+                  "enter \"p\" for the previous page or \"q\" to stop: ")
+            choice = input("> ").lower()
+            if choice == "q":
+                return
+            if choice == "p":
+                if len(page_starts) > 1:
+                    page_starts.pop()
+            elif more:
+                page_starts.append(rows[-1][0])
+
+    @_cached_query
+    def _read_page(self, table_name: str, cols: str, after: int, page_size: int) -> tuple:
+        """
+        Read one page of a table, ordered by rowid.
 
-            mytable = from_db_cursor(c)
-            print(mytable)
+        Args:
+            table_name: The name of the table to read.
+            cols: The names of the columns to read (empty string for all columns).
+            after: The rowid the page starts after.
+            page_size: The number of rows in the page.
+
+        Returns:
+            A tuple of the column names, the rows (each starting with its rowid) and whether there are more rows,
+            or None if the table or a column does not exist.
+        """
+        with self._create_connection() as c:
+            # The rowid is selected first to know where each page ends, it is not printed
+            try:
+                c.execute(f"SELECT rowid, {cols if cols != '' else '*'} FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                          (after, page_size + 1))
+            except sqlite3.OperationalError as e:
+                # Two possible errors: either table name was invalid or column name was invalid
+                if "no such table" in str(e):
+                    logging.error(f"Table {table_name} does not exist in database {self.path}.")
+                else:
+                    # Find the column name(s) in the error message (typical error message has two colons in it, 
+                    # the latter of which is directly before the column name that caused an error.
+                    logging.error(f"Column {str(e).split(': ')[-1]} does not exist in table {table_name}.")
+                return None
+            names = [col_data[0] for col_data in c.description][1:]
+            rows = c.fetchall()
+            return names, rows[:page_size], len(rows) > page_size
+
+    @staticmethod
+    def _page_cursor(c: sqlite3.Cursor, page_size: int, pager: bool) -> None:
+        """
+        Print the rows of an executed query page_size at a time, asking the user before each new page.
+        Values are printed as stored (eg: amounts of money in cents), nothing says which columns of a query are money.
+
+        Args:
+            c: A cursor on which a query was executed.
+            page_size: The number of rows to print at a time.
+            pager: Whether to let the user page through the rows (otherwise only the first page is printed).
+        """
+        if c.description is None:
+            # Not a query returning rows (eg: an UPDATE)
+            return
+        names = [col_data[0] for col_data in c.description]
+        rows = c.fetchmany(page_size)
+        while True:
+            Database._print_rows(names, rows)
+            next_rows = c.fetchmany(page_size)
+            if not next_rows:
+                return
+            if not pager:
+                print(f"Only the first {page_size} rows are shown.")
+                return
+            print("Press enter for the next page or enter \"q\" to stop: ")
+            if input("> ").lower() == "q":
+                return
+            rows = next_rows
+
+    @staticmethod
+    def _print_rows(names: list, rows: list, money_cols: tuple = ()) -> None:
+        """
+        Print rows as a table. Amounts of money are stored in cents, the columns in money_cols are printed in dollars.
+        Only callers knowing where their columns come from pass money_cols (a query's column named total may be a count).
+        """
+        money = [i for i, name in enumerate(names) if name in money_cols]
+        if money:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for i in money:
+                    if isinstance(row[i], int):
+                        row[i] = format_cents(row[i])
+        table = PrettyTable(field_names=names)
+        table.add_rows(rows)
+        print(table)
 
     def _insert_into_table(self, table_name: str, values: list, cols: list = [] )-> int:
         """
@@ -127,19 +1025,18 @@ class Database:
 
             # Create the string of column names
             col_str = ", ".join(str(i) for i in cols)
-            
-            # Create the string of values
-            val_str = ", ".join("\'" + str(i) + "\'" for i in values)
+
+            # Values are bound as parameters so the statement text only depends on the table and columns
+            placeholders = ", ".join("?" for _ in values)
 
             # Insert the row
             if len(col_str) == 0:
-                c.execute(f"INSERT INTO {table_name} VALUES ({val_str})")
+                c.execute(f"INSERT INTO {table_name} VALUES ({placeholders})", values)
             else:
-                c.execute(f"INSERT INTO {table_name} ({col_str}) VALUES ({val_str})")
+                c.execute(f"INSERT INTO {table_name} ({col_str}) VALUES ({placeholders})", values)
 
             # Retrieve ID of the last row inserted.
-            row_id = c.execute(f"""SELECT last_insert_rowid()""").fetchone()[0]
-            return row_id
+            return c.lastrowid
 
     def _create_empty_database(self, path, excluded_cols: list = []) -> None:
         """
@@ -165,7 +1062,7 @@ class Database:
             create_expense_commands = {
                 'id': "id INTEGER PRIMARY KEY AUTOINCREMENT",
                 'item': "item TEXT NOT NULL",
-                'amount': "amount REAL NOT NULL",
+                'amount': "amount INTEGER NOT NULL",
                 'type': "type TEXT NOT NULL CONSTRAINT valid_type CHECK(Type IN ('want', 'need', 'savings'))",
                 'receipt_id': "receipt_id INTEGER NOT NULL",
                 'category_id': "category_id INTEGER NOT NULL",
@@ -194,7 +1091,7 @@ class Database:
             # Receipts table (stores details about a single receipt eg: receipt number, amount, date)
             c.execute("""CREATE TABLE IF NOT EXISTS receipts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                total REAL NOT NULL,
+                total INTEGER NOT NULL,
                 date TEXT NOT NULL CONSTRAINT valid_date CHECK(Date IS date(Date,'+0 days')),
                 location TEXT NOT NULL
             )""")
@@ -204,7 +1101,7 @@ class Database:
             # perhaps with multiple cards. If a payment was made with multiple cards, there will be multiple entries)
             c.execute("""CREATE TABLE IF NOT EXISTS ledger (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                amount REAL NOT NULL,
+                amount INTEGER NOT NULL,
                 receipt_id INTEGER NOT NULL,
                 account_id INTEGER NOT NULL,
                 FOREIGN KEY (receipt_id) REFERENCES receipts(id),
@@ -215,7 +1112,7 @@ class Database:
             if "income_details" not in excluded_cols:
                 c.execute("""CREATE TABLE IF NOT EXISTS incomes (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    amount REAL NOT NULL,
+                    amount INTEGER NOT NULL,
                     paystub_id INTEGER NOT NULL,
                     details TEXT,
                     FOREIGN KEY (paystub_id) REFERENCES paystubs(id)
@@ -223,7 +1120,7 @@ class Database:
             else:
                 c.execute("""CREATE TABLE IF NOT EXISTS incomes (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    amount REAL NOT NULL,
+                    amount INTEGER NOT NULL,
                     paystub_id INTEGER NOT NULL,
                     FOREIGN KEY (paystub_id) REFERENCES paystubs(id)
                 )""")
@@ -232,7 +1129,7 @@ class Database:
             # eg: paid $1000 on July 1st to chequing account)
             c.execute("""CREATE TABLE IF NOT EXISTS paystubs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                total REAL NOT NULL,
+                total INTEGER NOT NULL,
                 date TEXT NOT NULL CONSTRAINT valid_date CHECK(Date IS date(Date,'+0 days')),
                 payer TEXT NOT NULL
             )""")
@@ -240,13 +1137,17 @@ class Database:
             # paystubs_ledger table (stores pretty much the same thing as the ledger table, but for paystubs)
             c.execute("""CREATE TABLE IF NOT EXISTS paystub_ledger (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                amount REAL NOT NULL,
+                amount INTEGER NOT NULL,
                 paystub_id INTEGER NOT NULL,
                 account_id INTEGER NOT NULL,
                 FOREIGN KEY (paystub_id) REFERENCES paystubs(id),
                 FOREIGN KEY (account_id) REFERENCES accounts(id)
             )""")
 
+            # Indexes and any later changes to the schema
+            self._migrate(c)
+
+    @_cached_query
     def _get_tables(self) -> list:
         """"
         Returns a list of all tables in the database.
@@ -259,6 +1160,21 @@ class Database:
             # For some reason, "sqlite_sequence" is in the list of tables so we filter it out
             return [table[0] for table in c.fetchall() if table[0] != "sqlite_sequence"]
 
+    @_cached_query
+    def _get_columns(self, table_name: str) -> list:
+        """
+        Returns a list of the columns of a table in the database.
+
+        Args:
+            table_name: The name of the table.
+
+        Returns:
+            list: The names of the columns of the table (empty if the table does not exist).
+        """
+        with self._create_connection() as c:
+            c.execute(f"PRAGMA table_info({table_name})")
+            return [col[1] for col in c.fetchall()]
+
     def query_db(self, sql_query: str) -> list:
         """
         Query the database and return the results.
@@ -278,36 +1194,60 @@ class Database:
 
             return c.fetchall()
 
-    def _search_expenses(self, expense_item: str = "", days: str = 365)-> dict:
+    @_cached_query
+    def _search_expenses(self, expense_item: str = "", days: str = 365, cols: list = None)-> dict:
         """
-        Searches for the expense in the database.
+        Searches for the expense in the database. Only the first time each item was entered is considered,
+        joined with its receipt.
 
         Args:
             expense_item: The item to search for.
             days: How many days to limit the search to.
+            cols: The columns to return (expense columns or receipt columns 'total', 'date' and 'location').
+                  Default is None, which returns every expense column and the receipt columns.
 
         Returns:
-            A list of the expense names that fit the criteria.
+            A dictionary of column name -> list of values for the expenses that fit the criteria.
         """
+        if cols is None:
+            select = "e.*, receipts.total, receipts.date, receipts.location"
+        else:
+            select = ", ".join(f"receipts.{col}" if col in RECEIPT_COLS else f"e.{col}" for col in cols)
+
         with self._create_connection() as c:
+            # The first occurrence of an item is the one with the smallest id, which the (item, id) index gives directly
             if not expense_item:
                 c.execute(f"""
-                SELECT *  \
-                    FROM receipts INNER JOIN (SELECT * FROM expenses e1 WHERE NOT EXISTS \
-                        (SELECT * FROM expenses e2 WHERE e1.item = e2.item and e2.id < e1.id)) e ON receipts.id = e.receipt_id\
-                    WHERE JulianDay('now') - JulianDay(date) <= {days}""")
+                SELECT {select}
+                    FROM (SELECT MIN(id) AS first_id FROM expenses GROUP BY item) first
+                    INNER JOIN expenses e ON e.id = first.first_id
+                    INNER JOIN receipts ON receipts.id = e.receipt_id
+                    WHERE JulianDay('now') - JulianDay(receipts.date) <= ?""", (days,))
             else:
                 c.execute(f"""
-                SELECT *\
-                    FROM receipts INNER JOIN (SELECT * FROM expenses e1 WHERE NOT EXISTS \
-                        (SELECT * FROM expenses e2 WHERE e1.item = e2.item and e2.id < e1.id)) e ON receipts.id = e.receipt_id\
-                    WHERE JulianDay('now') - JulianDay(date) <= {days} AND item = '{expense_item}'""")
-            result = {col_data[0]: [] for col_data in c.description}
-            for row in c.fetchall():
-                for col_index, col_data in enumerate(row):
-                    result[c.description[col_index][0]].append(col_data)
-            return result
+                SELECT {select}
+                    FROM expenses e
+                    INNER JOIN receipts ON receipts.id = e.receipt_id
+                    WHERE e.id = (SELECT MIN(id) FROM expenses WHERE item = ?)
+                    AND JulianDay('now') - JulianDay(receipts.date) <= ?""", (expense_item, days))
+            return ColumnarResult.from_cursor(c, numeric_arrays=self.numeric_arrays)
+
+    @_cached_query
+    def _count_items(self) -> list:
+        """
+        Count how many times each expense item was entered on each date.
 
+        Returns:
+            A list of (item, date, count) tuples.
+        """
+        with self._create_connection() as c:
+            c.execute("""
+            SELECT e.item, receipts.date, COUNT(*)
+                FROM expenses e INNER JOIN receipts ON receipts.id = e.receipt_id
+                GROUP BY e.item, receipts.date""")
+            return c.fetchall()
+
+    @_cached_query
     def _search_categories(self, category_ids: list[int] = []) -> dict:
         """
         Search for a category in the database.
@@ -323,13 +1263,11 @@ class Database:
             if not category_ids:
                 c.execute("SELECT * FROM categories")
             else:
-                c.execute(f"SELECT * FROM categories WHERE id IN { '(' + str(category_ids)[1:-1] + ')'}")
-            result = {col_data[0]: [] for col_data in c.description}
-            for row in c.fetchall():
-                for col_index, col_data in enumerate(row):
-                    result[c.description[col_index][0]].append(col_data)
-            return result
+                # Passing the ids as one JSON array keeps the statement text the same for any number of ids
+                c.execute("SELECT * FROM categories WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(category_ids),))
+            return ColumnarResult.from_cursor(c, numeric_arrays=self.numeric_arrays)
 
+    @_cached_query
     def _search_paystubs(self, paystub_id: int = None, payer: str = "", date: str = "") -> dict:
         """
         Search for a paystub in the database.
@@ -345,19 +1283,16 @@ class Database:
         """
         with self._create_connection() as c:
             if paystub_id:
-                c.execute(f"SELECT * FROM paystubs WHERE id = {paystub_id}")
+                c.execute("SELECT * FROM paystubs WHERE id = ?", (paystub_id,))
             elif payer:
-                c.execute(f"SELECT * FROM paystubs WHERE payer = '{payer}'")
+                c.execute("SELECT * FROM paystubs WHERE payer = ?", (payer,))
             elif date:
-                c.execute(f"SELECT * FROM paystubs WHERE date = '{date}'")
+                c.execute("SELECT * FROM paystubs WHERE date = ?", (date,))
             else:
                 c.execute("SELECT * FROM paystubs")
-            result = {col_data[0]: [] for col_data in c.description}
-            for row in c.fetchall():
-                for col_index, col_data in enumerate(row):
-                    result[c.description[col_index][0]].append(col_data)
-            return result
+            return ColumnarResult.from_cursor(c, numeric_arrays=self.numeric_arrays)
 
+    @_cached_query
     def _search_incomes(self, income_id: int = None, payer: str = "") -> dict:
         """
         Search for an income in the database.
@@ -373,16 +1308,60 @@ class Database:
         """
         with self._create_connection() as c:
             if income_id:
-                c.execute(f"SELECT * FROM incomes WHERE id = {income_id}")
+                c.execute("SELECT * FROM incomes WHERE id = ?", (income_id,))
             elif payer:
-                c.execute(f"SELECT id, amount, details FROM incomes NATURAL JOIN paystubs WHERE payer = '{payer}'")
+                c.execute("""SELECT incomes.* FROM incomes INNER JOIN paystubs ON paystubs.id = incomes.paystub_id
+                    WHERE payer = ? ORDER BY incomes.id""", (payer,))
             else:
                 c.execute("SELECT * FROM incomes")
-            result = {col_data[0]: [] for col_data in c.description}
-            for row in c.fetchall():
-                for col_index, col_data in enumerate(row):
-                    result[c.description[col_index][0]].append(col_data)
-            return result
+            return ColumnarResult.from_cursor(c, numeric_arrays=self.numeric_arrays)
+
+    @_cached_query
+    def monthly_report(self, by: str = "category", months: int = REPORT_MONTHS) -> dict:
+        """
+        Totals per month for the last few months, read from the monthly rollup tables
+        (so the cost depends on the number of months, not on the number of expenses).
+
+        Args:
+            by: What to total by in each month: 'category', 'type', 'account' or 'payer'.
+            months: How many months to report, counting the current one.
+
+        Returns:
+            A dictionary of column name -> list of values, ordered by month,
+            or None if the database does not keep that rollup.
+        """
+        reports = {
+            "category": """
+            SELECT r.month, categories.category, categories.subcategory, r.total, r.count
+                FROM monthly_category_totals r LEFT JOIN categories ON categories.id = r.category_id
+                WHERE r.month >= ? ORDER BY r.month, r.total DESC""",
+            "type": """
+            SELECT month, type, total, count FROM monthly_type_totals
+                WHERE month >= ? ORDER BY month, total DESC""",
+            "account": """
+            SELECT r.month, accounts.name AS account, SUM(r.spent) AS spent, SUM(r.earned) AS earned
+                FROM (
+                    SELECT month, account_id, total AS spent, 0 AS earned FROM monthly_account_spending
+                    UNION ALL
+                    SELECT month, account_id, 0 AS spent, total AS earned FROM monthly_account_income
+                ) r LEFT JOIN accounts ON accounts.id = r.account_id
+                WHERE r.month >= ? GROUP BY r.month, r.account_id ORDER BY r.month, r.account_id""",
+            "payer": """
+            SELECT month, payer, total, count FROM monthly_payer_income
+                WHERE month >= ? ORDER BY month, total DESC""",
+        }
+        if by not in reports:
+            logging.error(f"Unknown report {by}, expected one of {', '.join(reports)}.")
+            return None
+
+        with self._create_connection() as c:
+            first_month = c.execute("SELECT strftime('%Y-%m', 'now', 'start of month', ?)", (f"-{months - 1} months",)).fetchone()[0]
+            try:
+                c.execute(reports[by], (first_month,))
+            except sqlite3.OperationalError as e:
+                logging.error(f"Database {self.path} has no monthly totals by {by}. See error message -> {e}")
+                return None
+            return ColumnarResult.from_cursor(c, numeric_arrays=self.numeric_arrays)
 
     def delete_row(self, table_name: str, row_id: int) -> None:
         """
@@ -392,4 +1371,4 @@ class Database:
             database_name: The name of the database to delete from.
         """
         with self._create_connection() as c:
-            c.execute(f"DELETE FROM {table_name} WHERE id = '{row_id}'")
+            c.execute(f"DELETE FROM {table_name} WHERE id = ?", (row_id,))
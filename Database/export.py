@@ -0,0 +1,298 @@
+from contextlib import contextmanager
+import csv
+from Database.database import Database, FETCH_CHUNK_SIZE
+import gzip
+import io
+import json
+import os
+import sqlite3
+from typing import BinaryIO, Iterable, Iterator, TextIO
+
+
+# CONSTANTS
+COMPRESSIONS = ("gzip", "zstd")
+# File extension -> format or compression, eg: expenses.csv.gz is gzipped CSV
+FORMAT_EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+# Rows buffered into each row group of a Parquet file (one row group per chunk would make reading it slow)
+PARQUET_ROW_GROUP_ROWS = 50_000
+# Source exporting every expense joined with its receipt (and category), for analysis outside the program
+EXPENSE_HISTORY = "expense_history"
+
+
+def fetch_chunks(cursor: sqlite3.Cursor, chunk_size: int = FETCH_CHUNK_SIZE) -> Iterator[list[tuple]]:
+    """
+    Stream the rows of an executed query chunk_size rows at a time.
+    """
+    while rows := cursor.fetchmany(chunk_size):
+        yield rows
+
+
+def _write_csv(out: TextIO, cols: list[str], chunks: Iterable[list[tuple]]) -> None:
+    writer = csv.writer(out)
+    writer.writerow(cols)
+    for rows in chunks:
+        writer.writerows(rows)
+
+
+def _write_jsonl(out: TextIO, cols: list[str], chunks: Iterable[list[tuple]]) -> None:
+    for rows in chunks:
+        out.writelines(json.dumps(dict(zip(cols, row))) + "\n" for row in rows)
+
+
+# Text format -> function writing the column names and the chunks of rows to a text file
+WRITERS = {
+    "csv": _write_csv,
+    "jsonl": _write_jsonl,
+}
+EXPORT_FORMATS = (*WRITERS, "parquet")
+
+
+def _write_parquet(out: BinaryIO, cols: list[str], chunks: Iterable[list[tuple]], compression: str = None) -> None:
+    """
+    Write the chunks of rows to a Parquet file, PARQUET_ROW_GROUP_ROWS rows (rounded up to whole chunks) per row group,
+    so at most a row group is held in memory. Column types are taken from the first chunk,
+    columns with only NULLs or values of several types in it (SQLite doesn't enforce column types) are written as text.
+    Parquet compresses each column itself, with compression if given, otherwise with pyarrow's default (snappy).
+
+    Raises:
+        ValueError: If a later chunk has a value that doesn't fit its column's type.
+    """
+    # Optional dependency, only needed to export to Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def column_type(values: tuple) -> pa.DataType:
+        try:
+            type = pa.array(values).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pa.string()
+        return pa.string() if pa.types.is_null(type) else type
+
+    def column(col: str, values: tuple, type: pa.DataType) -> pa.Array:
+        if pa.types.is_string(type):
+            return pa.array([value if value is None or isinstance(value, str) else str(value) for value in values], type=type)
+        try:
+            return pa.array(values, type=type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f"Column {col} has values of several types, export it as text (eg: CAST({col} AS TEXT)). {e}")
+
+    writer = None
+    # Chunks (as tables) of the row group being filled
+    tables, buffered = [], 0
+    try:
+        for rows in chunks:
+            values = list(zip(*rows))
+            if writer is None:
+                schema = pa.schema([(col, column_type(col_values)) for col, col_values in zip(cols, values)])
+                writer = pq.ParquetWriter(out, schema, compression=compression or "snappy")
+            tables.append(pa.Table.from_arrays([column(field.name, col_values, field.type) for col_values, field in zip(values, schema)],
+                                               schema=schema))
+            buffered += len(rows)
+            if buffered >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.concat_tables(tables), row_group_size=buffered)
+                tables, buffered = [], 0
+        if tables:
+            writer.write_table(pa.concat_tables(tables), row_group_size=buffered)
+        if writer is None:
+            # No rows, still write the columns
+            schema = pa.schema([(col, pa.string()) for col in cols])
+            writer = pq.ParquetWriter(out, schema, compression=compression or "snappy")
+            writer.write_table(schema.empty_table())
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+@contextmanager
+def _text_stream(out: BinaryIO, compression: str = None) -> Iterator[TextIO]:
+    """
+    A UTF-8 text stream writing to out, compressed with compression (one of COMPRESSIONS) if given.
+    out is left open (eg: sys.stdout.buffer).
+    """
+    if compression == "gzip":
+        binary = gzip.GzipFile(fileobj=out, mode="wb")
+    elif compression == "zstd":
+        # Optional dependency, only needed for zstd compression
+        import zstandard
+
+        binary = zstandard.ZstdCompressor().stream_writer(out, closefd=False)
+    else:
+        binary = None
+    text = io.TextIOWrapper(binary or out, encoding="utf-8", newline="")
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if binary is not None:
+            binary.close()
+
+
+def expense_history_query(database: Database) -> str:
+    """
+    The query of every expense with the date, location and total of its receipt, and its category if expenses have one.
+    """
+    select = "e.*, r.date, r.location, r.total AS receipt_total"
+    joins = "INNER JOIN receipts r ON r.id = e.receipt_id"
+    if "category_id" in database._get_columns("expenses"):
+        select += ", c.category, c.subcategory"
+        joins += " LEFT JOIN categories c ON c.id = e.category_id"
+    return f"SELECT {select} FROM expenses e {joins} ORDER BY e.id"
+
+
+def source_query(database: Database, source: str) -> str:
+    """
+    The query to export for source: every row of the table if source is the name of a table,
+    the expense history if it is EXPENSE_HISTORY, otherwise source itself.
+    """
+    if source in database._get_tables():
+        return f'SELECT * FROM "{source}"'
+    if source == EXPENSE_HISTORY:
+        return expense_history_query(database)
+    return source
+
+
+def formats_from_path(path: str) -> tuple[str, str]:
+    """
+    The format and compression of an export file from its extensions, eg: ("csv", "gzip") for expenses.csv.gz.
+    Either is None if the path doesn't say.
+    """
+    root, extension = os.path.splitext(path)
+    compression = COMPRESSION_EXTENSIONS.get(extension.lower())
+    if compression is not None:
+        root, extension = os.path.splitext(root)
+    return FORMAT_EXTENSIONS.get(extension.lower()), compression
+
+
+def _check_format(format: str, compression: str = None) -> None:
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format}, expected one of {', '.join(EXPORT_FORMATS)}.")
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression}, expected one of {', '.join(COMPRESSIONS)}.")
+
+
+@contextmanager
+def _run_query(database: Database, sql: str, read_only: bool = False) -> Iterator[sqlite3.Cursor]:
+    """
+    Execute a statement, yielding the cursor to fetch its rows from. If read_only, only queries returning rows
+    are run: a statement that would change the database or returns no rows raises a ValueError instead of running.
+    """
+    with database._create_connection() as c:
+        if not read_only:
+            c.execute(sql)
+            yield c
+            return
+        c.execute("PRAGMA query_only = ON")
+        try:
+            try:
+                c.execute(sql)
+            except sqlite3.OperationalError as e:
+                if "readonly" in str(e):
+                    raise ValueError("Only queries can be exported, not statements changing the database.") from e
+                raise
+            if c.description is None:
+                raise ValueError("Only queries returning rows can be exported.")
+            yield c
+        finally:
+            c.execute("PRAGMA query_only = OFF")
+
+
+def _write_rows(c: sqlite3.Cursor, out: BinaryIO, format: str, compression: str, chunk_size: int) -> int:
+    """
+    Stream the rows of an executed query to out, returning how many were written.
+    """
+    cols = [col[0] for col in c.description]
+    written = 0
+
+    def counted(chunks: Iterable[list[tuple]]) -> Iterator[list[tuple]]:
+        nonlocal written
+        for rows in chunks:
+            written += len(rows)
+            yield rows
+
+    if format == "parquet":
+        _write_parquet(out, cols, counted(fetch_chunks(c, chunk_size)), compression)
+    else:
+        with _text_stream(out, compression) as text:
+            WRITERS[format](text, cols, counted(fetch_chunks(c, chunk_size)))
+    return written
+
+
+def export_query(
+    database: Database,
+    sql: str,
+    out: BinaryIO,
+    format: str = "csv",
+    compression: str = None,
+    chunk_size: int = FETCH_CHUNK_SIZE,
+    read_only: bool = False
+    ) -> int:
+    """
+    Run a query and stream its rows to a file, fetching chunk_size rows at a time, so memory use doesn't depend
+    on the number of rows. Values are written as stored (eg: amounts of money in cents).
+
+    Args:
+        database: The database to query.
+        sql: The query.
+        out: The binary file to write to (eg: sys.stdout.buffer).
+        format: One of EXPORT_FORMATS.
+        compression: One of COMPRESSIONS, or None to not compress. Parquet files are compressed by column instead.
+        chunk_size: How many rows to fetch (and write) at a time.
+        read_only: Whether to refuse statements that aren't queries returning rows (see _run_query),
+                   otherwise they are run (eg: an UPDATE) and nothing is written.
+
+    Returns:
+        The number of rows written, or None if the statement returns no rows (eg: an UPDATE).
+
+    Raises:
+        ValueError: If the format or compression is unknown, or the statement isn't a query and read_only is set.
+        ImportError: If the package needed for the format or compression isn't installed (pyarrow, zstandard).
+        sqlite3.Error: If the query fails.
+    """
+    _check_format(format, compression)
+    with _run_query(database, sql, read_only) as c:
+        if c.description is None:
+            return None
+        return _write_rows(c, out, format, compression, chunk_size)
+
+
+def export_to_path(
+    database: Database,
+    sql: str,
+    path: str,
+    format: str = None,
+    compression: str = None,
+    chunk_size: int = FETCH_CHUNK_SIZE
+    ) -> int:
+    """
+    Export the rows of a query to a file (see export_query). The format and compression default to what
+    the file's extensions say (see formats_from_path), then to uncompressed CSV.
+
+    Only queries are exported: the statement is run read-only and must return rows before the file is opened.
+    The rows are written to a temporary file next to path which replaces it once the export is done,
+    so a failed export never leaves a partial file behind nor touches an existing one.
+
+    Returns:
+        The number of rows written.
+
+    Raises:
+        ValueError: If the format or compression is unknown, or the statement isn't a query returning rows.
+        ImportError: If the package needed for the format or compression isn't installed (pyarrow, zstandard).
+        sqlite3.Error: If the query fails.
+    """
+    path_format, path_compression = formats_from_path(path)
+    format = format or path_format or "csv"
+    compression = compression or path_compression
+    _check_format(format, compression)
+    with _run_query(database, sql, read_only=True) as c:
+        partial_path = f"{path}.part"
+        try:
+            with open(partial_path, "wb") as out:
+                written = _write_rows(c, out, format, compression, chunk_size)
+            os.replace(partial_path, path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        return written
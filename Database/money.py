@@ -0,0 +1,40 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+# CONSTANTS
+CENTS_PER_DOLLAR = 100
+
+
+def to_cents(amount) -> int:
+    """
+    Convert an amount of dollars to integer cents, rounding half a cent up.
+
+    Args:
+        amount: The amount, either a number or a string as typed by a user or written in a statement
+                (eg: 12.34, "12.34", "$1,234.56" or "-12").
+
+    Returns:
+        The amount in cents (eg: 1234).
+
+    Raises:
+        ValueError: If the amount is not a number.
+    """
+    if isinstance(amount, float):
+        # The shortest repr of a float is what the user typed (eg: 0.1 rather than 0.1000000000000000055...)
+        amount = repr(amount)
+    try:
+        dollars = Decimal(str(amount).strip().replace("$", "").replace(",", ""))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not dollars.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+    return int((dollars * CENTS_PER_DOLLAR).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents: int) -> str:
+    """
+    Format integer cents as dollars (eg: 1234 -> "12.34", -5 -> "-0.05").
+    """
+    sign = "-" if cents < 0 else ""
+    dollars, cents = divmod(abs(cents), CENTS_PER_DOLLAR)
+    return f"{sign}{dollars}.{cents:02d}"
@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+import datetime
+import logging
+import sqlite3
+import sys
+import threading
+import time
+
+
+# CONSTANTS
+SLOW_QUERY_MS = 50.0
+# Helpers between the code that runs a statement and the cursor, skipped when finding the caller
+TRACING_INTERNALS = {"_cursor", "_create_connection", "transaction", "_cached", "wrapper", "<lambda>", "<genexpr>", "from_cursor", "_write"}
+SUMMARY_TOP_STATEMENTS = 5
+
+
+@dataclass
+class StatementStats:
+    """
+    This class aggregates every run of one statement from one caller.
+
+    Attributes:
+        caller: The method that ran the statement (eg: 'Database._search_expenses').
+        sql: The text of the statement.
+        count: How many times it ran.
+        seconds: The total time spent running it and fetching its rows.
+        max_seconds: The longest single run.
+        rows: The total number of rows fetched.
+    """
+    caller: str
+    sql: str
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    rows: int = 0
+
+
+class QueryTracer:
+    """
+    Records every statement run through a Database: its text, how long it took (executing it and fetching its rows),
+    how many rows it returned and which method ran it. Statements slower than slow_threshold_ms are appended
+    to the slow-query log, and summary() describes the whole session.
+
+    Timing is done by the cursors (TracingCursor). SQLite's trace callback also sees statements that don't go through
+    a cursor (eg: the BEGIN/COMMIT issued by the sqlite3 module), which are only counted, and gives the text of
+    each statement with its parameters filled in, which is what goes into the slow-query log.
+
+    Statements can be traced from several threads (eg: the prefetch thread, see Database.prefetch).
+
+    Attributes:
+        slow_threshold_ms: Statements taking at least this long are written to the slow-query log.
+        slow_log_path: The path of the slow-query log (None to only log slow statements with logging.warning).
+    """
+    def __init__(self, slow_threshold_ms: float = SLOW_QUERY_MS, slow_log_path: str = None):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_log_path = slow_log_path
+        self.started = time.perf_counter()
+        self.traced_statements = 0
+        self.slow_statements = 0
+        # The text of the last statement traced, per thread since each thread runs statements on its own connection
+        self._thread = threading.local()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        tracer = self
+
+        class TracingCursor(sqlite3.Cursor):
+            """
+            A cursor timing each statement it runs and counting the rows fetched, reporting to the tracer.
+            """
+            _pending = None
+
+            def execute(self, sql, parameters=()):
+                self._finish()
+                start = time.perf_counter()
+                try:
+                    return super().execute(sql, parameters)
+                finally:
+                    self._pending = [sql, tracer._caller(), time.perf_counter() - start, 0, tracer._last_expanded_sql()]
+
+            def executemany(self, sql, seq_of_parameters):
+                self._finish()
+                start = time.perf_counter()
+                try:
+                    return super().executemany(sql, seq_of_parameters)
+                finally:
+                    self._pending = [sql, tracer._caller(), time.perf_counter() - start, 0, tracer._last_expanded_sql()]
+
+            def fetchone(self):
+                return self._fetch(super().fetchone, single=True)
+
+            def fetchmany(self, size=None):
+                return self._fetch(lambda: super(TracingCursor, self).fetchmany(size or self.arraysize))
+
+            def fetchall(self):
+                return self._fetch(super().fetchall)
+
+            def __next__(self):
+                return self._fetch(super().__next__, single=True)
+
+            def close(self):
+                self._finish()
+                super().close()
+
+            def _fetch(self, fetch, single=False):
+                start = time.perf_counter()
+                result = fetch()
+                if self._pending is not None:
+                    self._pending[2] += time.perf_counter() - start
+                    self._pending[3] += (result is not None) if single else len(result)
+                return result
+
+            def _finish(self):
+                if self._pending is not None:
+                    tracer._record(*self._pending)
+                    self._pending = None
+
+        self.cursor_class = TracingCursor
+
+    def trace_callback(self, statement: str) -> None:
+        """
+        Callback for sqlite3.Connection.set_trace_callback.
+        """
+        with self._lock:
+            self.traced_statements += 1
+        self._thread.expanded_sql = statement
+
+    def _last_expanded_sql(self) -> str:
+        return getattr(self._thread, "expanded_sql", None)
+
+    @staticmethod
+    def _caller() -> str:
+        """
+        Returns the name of the function that ran the statement, skipping the tracing and connection helpers.
+        """
+        frame = sys._getframe(2)
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name not in TRACING_INTERNALS and code.co_filename != __file__ and "contextlib" not in code.co_filename:
+                return getattr(code, "co_qualname", code.co_name)
+            frame = frame.f_back
+        return "unknown"
+
+    def _record(self, sql: str, caller: str, seconds: float, rows: int, expanded_sql: str) -> None:
+        sql = " ".join(sql.split())
+        with self._lock:
+            stats = self._stats.get((caller, sql))
+            if stats is None:
+                stats = self._stats[(caller, sql)] = StatementStats(caller=caller, sql=sql)
+            stats.count += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.rows += rows
+            slow = seconds * 1000 >= self.slow_threshold_ms
+            if slow:
+                self.slow_statements += 1
+
+        if slow:
+            line = (f"{datetime.datetime.now().isoformat(timespec='seconds')}\t{seconds * 1000:.1f}ms\t{rows} rows\t"
+                    f"{caller}\t{' '.join((expanded_sql or sql).split())}")
+            if self.slow_log_path:
+                with open(self.slow_log_path, "a") as f:
+                    f.write(line + "\n")
+            else:
+                logging.warning(f"Slow query: {line}")
+
+    def summary(self) -> str:
+        """
+        Describe the statements run this session: totals per calling method and the slowest statements.
+        """
+        with self._lock:
+            all_stats = list(self._stats.values())
+        by_caller = {}
+        for stats in all_stats:
+            count, seconds, rows = by_caller.get(stats.caller, (0, 0.0, 0))
+            by_caller[stats.caller] = (count + stats.count, seconds + stats.seconds, rows + stats.rows)
+
+        total_count = sum(count for count, _, _ in by_caller.values())
+        total_seconds = sum(seconds for _, seconds, _ in by_caller.values())
+        lines = [
+            f"SQL trace: {total_count} statements in {total_seconds * 1000:.1f}ms "
+            f"({self.traced_statements} seen by SQLite, {self.slow_statements} slower than {self.slow_threshold_ms:g}ms) "
+            f"over a {time.perf_counter() - self.started:.0f}s session",
+            f"{'caller':<40} {'statements':>10} {'total ms':>10} {'mean ms':>9} {'rows':>8}",
+        ]
+        for caller, (count, seconds, rows) in sorted(by_caller.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{caller:<40} {count:>10} {seconds * 1000:>10.1f} {seconds * 1000 / count:>9.2f} {rows:>8}")
+
+        lines.append("Slowest statements:")
+        for stats in sorted(all_stats, key=lambda stats: -stats.max_seconds)[:SUMMARY_TOP_STATEMENTS]:
+            lines.append(f"  {stats.max_seconds * 1000:.1f}ms max, {stats.count}x, {stats.caller}: {stats.sql[:100]}")
+        return "\n".join(lines)
@@ -0,0 +1,147 @@
+import atexit
+import importlib.util
+import os
+import re
+import subprocess
+from typing import Any, Protocol
+
+
+# CONSTANTS
+OCR_LANGUAGE = "eng"
+
+
+class OCRBackend(Protocol):
+    """
+    An OCR engine. Engines are created once per process (see get_engine) and reused for every image,
+    so loading the language model is paid once per session rather than once per scan.
+    """
+    name: str
+
+    def read_text(self, image: Any) -> str:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def _tessdata_path() -> str:
+    """
+    Returns where Tesseract's language models are: TESSDATA_PREFIX if set, otherwise where the installed tesseract
+    binary keeps them (tesserocr's wheels bundle the library but not the models), or None if neither says.
+    """
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    try:
+        # eg: List of available languages in "/usr/share/tesseract-ocr/5/tessdata/" (2):
+        output = subprocess.run(["tesseract", "--list-langs"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r'"(.+?)"', output)
+    return match.group(1) if match else None
+
+
+class TesserocrBackend:
+    """
+    Tesseract through its C++ API (package tesserocr), in this process. The language model is loaded
+    when the backend is created and each image is handed over in memory.
+    """
+    name = "tesserocr"
+
+    def __init__(self, language: str = OCR_LANGUAGE):
+        import tesserocr
+
+        path = _tessdata_path()
+        self._api = tesserocr.PyTessBaseAPI(path=path, lang=language) if path else tesserocr.PyTessBaseAPI(lang=language)
+
+    def read_text(self, image: Any) -> str:
+        from PIL import Image
+
+        self._api.SetImage(Image.fromarray(image))
+        return self._api.GetUTF8Text()
+
+    def close(self) -> None:
+        self._api.End()
+
+
+class PytesseractBackend:
+    """
+    Tesseract through package pytesseract, which writes each image to a temporary file and runs the tesseract
+    binary on it (reloading the language model every time). Only used if asked for (eg: --ocr-backend pytesseract),
+    or if tesserocr isn't installed.
+    """
+    name = "pytesseract"
+
+    def __init__(self, language: str = OCR_LANGUAGE):
+        import pytesseract
+
+        self._pytesseract = pytesseract
+        self.language = language
+
+    def read_text(self, image: Any) -> str:
+        return self._pytesseract.image_to_string(image, lang=self.language)
+
+    def close(self) -> None:
+        pass
+
+
+class StandInBackend:
+    """
+    A stand-in for a real OCR engine, for tests and for trying the scanning workflow without Tesseract:
+    it reads no text, only describes the image it was given.
+    """
+    name = "stand-in"
+
+    def __init__(self, language: str = OCR_LANGUAGE):
+        self.language = language
+
+    def read_text(self, image: Any) -> str:
+        return f"{image.shape[1]}x{image.shape[0]} image"
+
+    def close(self) -> None:
+        pass
+
+
+# Backend name -> class, see register_backend
+BACKENDS = {
+    TesserocrBackend.name: TesserocrBackend,
+    PytesseractBackend.name: PytesseractBackend,
+    StandInBackend.name: StandInBackend,
+}
+# Backend name -> the engine created in this process
+_engines = {}
+
+
+def register_backend(backend: type) -> None:
+    """
+    Make an OCR backend class (following OCRBackend) available by its name, eg: to plug in a stand-in in tests.
+    Backends used with scan_receipts must be registered in the worker processes too, ie: at import time of a module.
+    """
+    BACKENDS[backend.name] = backend
+
+
+def default_backend() -> str:
+    """
+    Returns the name of the backend to use when none is given: tesserocr if it is installed, otherwise pytesseract.
+    """
+    if importlib.util.find_spec("tesserocr") is not None:
+        return TesserocrBackend.name
+    return PytesseractBackend.name
+
+
+def get_engine(name: str = None) -> OCRBackend:
+    """
+    Returns this process's engine for a backend, creating it on first use. Engines are closed when the process exits.
+
+    Args:
+        name: The name of the backend (see BACKENDS), default is default_backend().
+
+    Raises:
+        ValueError: If there is no backend with that name.
+    """
+    name = name or default_backend()
+    if name not in _engines:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown OCR backend {name}, expected one of {', '.join(BACKENDS)}.")
+        engine = _engines[name] = BACKENDS[name]()
+        atexit.register(engine.close)
+    return _engines[name]
@@ -0,0 +1,104 @@
+from Database.database import Database
+import hashlib
+import json
+from OCR.backends import default_backend
+
+
+# CONSTANTS
+OCR_CACHE_MAX_ENTRIES = 10000
+HASH_READ_SIZE = 1024 * 1024
+
+
+def image_hash(path: str) -> str:
+    """
+    Hash the bytes of an image, so the same receipt is recognized whatever its file is called.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def params_hash(params: dict) -> str:
+    """
+    Hash the preprocessing parameters the text of an image was read with.
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class OCRCache:
+    """
+    The text read from receipt images, stored in table 'ocr_cache' of the database and keyed by the hash of
+    the image bytes and of the preprocessing parameters (and OCR backend), so scanning an image again returns
+    its text without running OCR.
+
+    Only entries read with the current parameters are useful, so evict() drops the others along with
+    the least recently used entries beyond max_entries. Entries are ordered by use with a counter
+    (last_used) rather than a timestamp, which would tie for entries used in the same batch.
+
+    Attributes:
+        database: The database storing the cache.
+        params: The preprocessing parameters images are scanned with.
+        backend: The OCR backend images are scanned with (see OCR.backends), different engines read different text.
+        max_entries: The maximum number of entries kept.
+    """
+    def __init__(self, database: Database, params: dict, backend: str = None, max_entries: int = OCR_CACHE_MAX_ENTRIES):
+        self.database = database
+        self.params = params
+        self.backend = backend or default_backend()
+        self.max_entries = max_entries
+        self._params_hash = params_hash({**params, "backend": self.backend})
+
+    def get_many(self, image_hashes: list[str]) -> dict:
+        """
+        Look up the text of many images at once, marking the entries found as used.
+
+        Args:
+            image_hashes: The hashes of the images (see image_hash).
+
+        Returns:
+            A dictionary of image hash -> text for the images in the cache.
+        """
+        hashes = json.dumps(list(image_hashes))
+        with self.database.transaction() as c:
+            c.execute("""
+            SELECT image_hash, text FROM ocr_cache
+                WHERE params_hash = ? AND image_hash IN (SELECT value FROM json_each(?))""", (self._params_hash, hashes))
+            found = dict(c.fetchall())
+            if found:
+                c.execute("""
+                UPDATE ocr_cache SET last_used = (SELECT coalesce(MAX(last_used), 0) + 1 FROM ocr_cache)
+                    WHERE params_hash = ? AND image_hash IN (SELECT value FROM json_each(?))""",
+                          (self._params_hash, json.dumps(list(found))))
+        return found
+
+    def put(self, image_hash: str, text: str) -> None:
+        """
+        Store the text read from an image.
+
+        Args:
+            image_hash: The hash of the image (see image_hash).
+            text: The text read from the image.
+        """
+        with self.database.transaction() as c:
+            c.execute("""
+            INSERT OR REPLACE INTO ocr_cache (image_hash, params_hash, text, last_used)
+                VALUES (?, ?, ?, (SELECT coalesce(MAX(last_used), 0) + 1 FROM ocr_cache))""", (image_hash, self._params_hash, text))
+
+    def evict(self) -> int:
+        """
+        Drop the entries read with other preprocessing parameters (or backend) and, beyond max_entries,
+        the least recently used ones.
+
+        Returns:
+            The number of entries dropped.
+        """
+        with self.database.transaction() as c:
+            c.execute("DELETE FROM ocr_cache WHERE params_hash != ?", (self._params_hash,))
+            dropped = c.rowcount
+            c.execute("""
+            DELETE FROM ocr_cache WHERE rowid IN (
+                SELECT rowid FROM ocr_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""", (self.max_entries,))
+            return dropped + c.rowcount
@@ -0,0 +1,172 @@
+"""
+Preprocessing of receipt photos before OCR. The OpenCV and NumPy imports make this module slow to import,
+so it is only imported when an image is actually scanned (see OCR.scanner.ocr_image).
+"""
+import cv2
+import numpy as np
+
+
+# CONSTANTS
+# Height of the copy of the photo the receipt is looked for in
+DETECTION_HEIGHT = 600
+# The receipt must cover at least this fraction of the photo to be cropped to
+MIN_RECEIPT_AREA = 0.15
+# Height of the copy of the receipt the skew is measured on
+DESKEW_HEIGHT = 800
+DESKEW_COARSE_STEP = 1.0
+DESKEW_FINE_STEP = 0.1
+
+
+def load_image(path: str, params: dict) -> np.ndarray:
+    """
+    Read an image, decoding it straight to grayscale if the pipeline converts it to grayscale anyway.
+
+    Raises:
+        ValueError: If the image can't be read.
+    """
+    flags = cv2.IMREAD_GRAYSCALE if "grayscale" in params["steps"] else cv2.IMREAD_COLOR
+    image = cv2.imread(path, flags)
+    if image is None:
+        raise ValueError(f"Could not read image {path}")
+    return image
+
+
+def to_grayscale(image: np.ndarray, params: dict = None) -> np.ndarray:
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+
+def normalize(image: np.ndarray, params: dict = None) -> np.ndarray:
+    """
+    Stretch the intensities of the image to the full 0-255 range.
+    """
+    return cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX)
+
+
+def _order_corners(corners: np.ndarray) -> np.ndarray:
+    """
+    Order four corners as top left, top right, bottom right, bottom left.
+    """
+    sums = corners.sum(axis=1)
+    diffs = np.diff(corners, axis=1).ravel()
+    return np.array([corners[sums.argmin()], corners[diffs.argmin()], corners[sums.argmax()], corners[diffs.argmax()]], dtype=np.float32)
+
+
+def crop_receipt(image: np.ndarray, params: dict = None) -> np.ndarray:
+    """
+    Find the receipt in the photo (the largest bright region) and warp it to an upright rectangle, which also undoes
+    the rotation and perspective of the photo. The receipt is looked for in a small copy of the photo, only the
+    warp is done at full resolution. If no receipt is found the image is returned as it is.
+    """
+    gray = to_grayscale(image)
+    scale = min(1.0, DETECTION_HEIGHT / gray.shape[0])
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    small = cv2.GaussianBlur(small, (5, 5), 0)
+    # Receipt paper is brighter than what it lies on. Closing fills in the text so the receipt is one region.
+    mask = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+    if not contours:
+        return image
+    contour = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(contour) < MIN_RECEIPT_AREA * mask.size:
+        return image
+
+    # Four corners if the outline is a quadrilateral (a photo taken at an angle), otherwise its bounding rotated rectangle
+    outline = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+    corners = outline.reshape(-1, 2) if len(outline) == 4 else cv2.boxPoints(cv2.minAreaRect(contour))
+    corners = _order_corners(corners.astype(np.float32) / scale)
+    top_left, top_right, bottom_right, bottom_left = corners
+    width = int(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))
+    height = int(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    return cv2.warpPerspective(image, cv2.getPerspectiveTransform(corners, target), (width, height), flags=cv2.INTER_LINEAR)
+
+
+def downscale(image: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Shrink the image to params['target_dpi'], taking its width to be the width of the receipt
+    (params['receipt_width_inches']). Images already at or below that resolution are left as they are.
+    """
+    dpi = image.shape[1] / params["receipt_width_inches"]
+    scale = params["target_dpi"] / dpi
+    if scale >= 1:
+        return image
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _rotate(image: np.ndarray, degrees: float, border: int = 255) -> np.ndarray:
+    height, width = image.shape[:2]
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), degrees, 1.0)
+    return cv2.warpAffine(image, rotation, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+
+
+def _skew(ink: np.ndarray, angles: np.ndarray) -> float:
+    """
+    The angle (among angles) that best straightens the lines of text: the one whose row sums of ink vary the most,
+    since straight lines of text alternate between rows full of ink and empty rows.
+    """
+    scores = [np.var(_rotate(ink, angle, border=0).sum(axis=1, dtype=np.int64)) for angle in angles]
+    return float(angles[int(np.argmax(scores))])
+
+
+def deskew(image: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Rotate the image so its lines of text are horizontal, trying angles up to params['max_skew_degrees'] either way
+    (every DESKEW_COARSE_STEP degrees, then every DESKEW_FINE_STEP around the best one) on a small copy of the image.
+    """
+    gray = to_grayscale(image)
+    scale = min(1.0, DESKEW_HEIGHT / gray.shape[0])
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    ink = cv2.threshold(small, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+    limit = params["max_skew_degrees"]
+    angle = _skew(ink, np.arange(-limit, limit + DESKEW_COARSE_STEP / 2, DESKEW_COARSE_STEP))
+    angle = _skew(ink, np.arange(angle - DESKEW_COARSE_STEP, angle + DESKEW_COARSE_STEP + DESKEW_FINE_STEP / 2, DESKEW_FINE_STEP))
+    if abs(angle) < DESKEW_FINE_STEP / 2:
+        return image
+    border = 255 if image.ndim == 2 else (255, 255, 255)
+    return _rotate(image, angle, border=border)
+
+
+def threshold(image: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Binarize the image. params['threshold'] is either 'adaptive' (compare each pixel to the weighted mean
+    of its params['block_size'] neighbourhood minus params['offset'], which copes with shadows and uneven light),
+    'otsu' (one threshold picked from the histogram) or a fixed threshold between 0 and 255.
+    """
+    gray = to_grayscale(image)
+    method = params["threshold"]
+    if method == "adaptive":
+        return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, params["block_size"], params["offset"])
+    if method == "otsu":
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return cv2.threshold(gray, int(method), 255, cv2.THRESH_BINARY)[1]
+
+
+# Step name -> function, each taking the image and the parameters
+STEPS = {
+    "grayscale": to_grayscale,
+    "normalize": normalize,
+    "crop": crop_receipt,
+    "downscale": downscale,
+    "deskew": deskew,
+    "threshold": threshold,
+}
+
+
+def preprocess(image: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Run the steps of the pipeline (params['steps'], names from STEPS) on the image, in order.
+
+    Args:
+        image: The image, as read by load_image.
+        params: The steps to run and their parameters (see OCR.scanner.PREPROCESSING).
+
+    Returns:
+        The image to give to the OCR engine.
+    """
+    for step in params["steps"]:
+        image = STEPS[step](image, params)
+    return image
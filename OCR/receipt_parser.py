@@ -0,0 +1,362 @@
+"""
+Parsing of the text read from receipts into draft expense transactions. NumPy makes this module slow to import,
+so it is only imported when a receipt is actually scanned (see UI.cli.CLI.scan_receipt).
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+import datetime
+import numpy as np
+import re
+from Transactions.expenses import Expense, Receipt
+from typing import Iterable
+
+
+# CONSTANTS
+# Trigrams are taken from the name padded with a space either side, so short names and word boundaries count
+GRAM_PADDING = " "
+# Stop counting shared trigrams once this many names have been counted
+MAX_GRAM_POSTINGS = 10000
+# Number of names (with the most trigrams in common, relative to their length) whose edit distance to the text is computed
+MATCH_CANDIDATES = 8
+# A name matches if at most this fraction of its characters had to be changed
+MAX_EDIT_FRACTION = 0.34
+# Price at the end of a line, eg: '4.99', '$4.99', '4,99 H', '-2.00 T'
+PRICE_RE = re.compile(r"(?P<price>-?\$?\s?\d{1,6}[.,]\s?\d{2})(?:\s*(?P<flag>[A-Za-z*]{1,2}))?\s*$")
+# Flags printed after the price of taxed items (eg: 'H' for HST)
+TAX_FLAGS = {"H", "HC", "HT", "T", "TX", "X", "*", "G", "GP", "P"}
+DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), ("year", "month", "day")),
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b"), ("month", "day", "year")),
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2})\b"), ("month", "day", "year")),
+]
+TOTAL_WORDS = {"total", "amount due", "balance due"}
+SUBTOTAL_WORDS = {"subtotal", "sub total", "sub-total"}
+TAX_WORDS = {"tax", "hst", "gst", "pst", "qst", "vat"}
+# Lines with these words are about paying, not items
+PAYMENT_WORDS = {"cash", "change", "visa", "mastercard", "amex", "debit", "credit", "tender", "card", "tip", "rounding", "saved", "savings"}
+
+
+def _normalize(text: str) -> str:
+    # Lowercase, keep letters, digits and single spaces (OCR sprinkles punctuation on receipt lines)
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+
+def _grams(text: str) -> set[str]:
+    padded = f"{GRAM_PADDING}{text}{GRAM_PADDING}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _pattern(text: str) -> dict:
+    # Character -> bit mask of its positions in text, for _edit_distance
+    positions = {}
+    for i, char in enumerate(text):
+        positions[char] = positions.get(char, 0) | (1 << i)
+    return positions
+
+
+def _edit_distance(pattern: dict, length: int, text: str) -> int:
+    """
+    The Levenshtein distance between a string (given as its _pattern and its length) and text, with the bit-parallel
+    algorithm of Myers (as given by Hyyrö): a column of the edit distance table is kept as bit vectors of
+    its vertical differences, so each character of text costs a few integer operations instead of a row of cells.
+    """
+    if length == 0:
+        return len(text)
+    mask = (1 << length) - 1
+    last = 1 << (length - 1)
+    positive, negative, distance = mask, 0, length
+    for char in text:
+        equal = pattern.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | ~(horizontal | positive)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        positive = (horizontal_negative | ~(vertical | horizontal_positive)) & mask
+        negative = horizontal_positive & vertical & mask
+    return distance
+
+
+def _words(text: str, words: set[str]) -> bool:
+    # Whether text contains one of the words (or phrases) as whole words
+    padded = f" {text} "
+    return any(f" {word} " in padded for word in words)
+
+
+class ItemIndex:
+    """
+    The known expense names (eg: every expense.item entered so far), indexed to match the noisy names
+    read from receipts against them.
+
+    A lookup counts the trigrams each name shares with the text (from postings of name ids, rarest trigrams
+    first, counted with NumPy so it stays under a millisecond with tens of thousands of names), then computes
+    the edit distance to the MATCH_CANDIDATES most similar names and keeps the closest, as long as at most
+    MAX_EDIT_FRACTION of its characters differ. Ties go to the most used name.
+    """
+    def __init__(self):
+        # Normalized name -> id
+        self._ids = {}
+        # Id -> normalized name, name and number of uses (the most used name wins when several normalize the same)
+        self._keys = []
+        self._names = []
+        self._uses = []
+        # Id -> number of trigrams of the name
+        self._gram_counts = []
+        # Trigram -> ids of the names containing it, and the same as an array (built on first use)
+        self._grams = defaultdict(list)
+        self._arrays = {}
+        self._gram_counts_array = None
+
+    @classmethod
+    def from_usage(cls, usage: Iterable[tuple[str, str, int]]) -> "ItemIndex":
+        """
+        Build an index from (name, date, count) rows (eg: from Database._count_items).
+        """
+        index = cls()
+        for name, _, count in usage:
+            index.add(name, count)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, name: str, count: int = 1) -> None:
+        """
+        Record that a name was used count times, adding it to the index if it is new.
+        """
+        key = _normalize(name)
+        if not key:
+            return
+        known = self._ids.get(key)
+        if known is None:
+            known = self._ids[key] = len(self._keys)
+            grams = _grams(key)
+            for gram in grams:
+                self._grams[gram].append(known)
+                self._arrays.pop(gram, None)
+            self._keys.append(key)
+            self._names.append(name)
+            self._uses.append(count)
+            self._gram_counts.append(len(grams))
+            self._gram_counts_array = None
+        elif self._names[known] == name:
+            self._uses[known] += count
+        elif count > self._uses[known]:
+            self._names[known], self._uses[known] = name, count
+
+    def _postings(self, gram: str) -> np.ndarray:
+        if gram not in self._arrays:
+            self._arrays[gram] = np.array(self._grams[gram], dtype=np.int32)
+        return self._arrays[gram]
+
+    def match(self, text: str) -> str:
+        """
+        Find the known name closest to text.
+
+        Args:
+            text: The name as read from the receipt.
+
+        Returns:
+            The known name, or None if none is close enough.
+        """
+        key = _normalize(text)
+        if not key:
+            return None
+        if key in self._ids:
+            return self._names[self._ids[key]]
+
+        grams = _grams(key)
+        selected = []
+        counted = 0
+        for gram in sorted((gram for gram in grams if gram in self._grams), key=lambda gram: len(self._grams[gram])):
+            # Very common trigrams say little about the name and would make the lookup slow
+            if counted + len(self._grams[gram]) > MAX_GRAM_POSTINGS:
+                break
+            selected.append(self._postings(gram))
+            counted += len(self._grams[gram])
+        if not selected:
+            return None
+
+        if self._gram_counts_array is None:
+            self._gram_counts_array = np.array(self._gram_counts, dtype=np.int32)
+        # Sorting the ids groups each name's shared trigrams together: the counts are the lengths of the runs
+        ids = np.sort(np.concatenate(selected))
+        run_starts = np.empty(len(ids), dtype=bool)
+        run_starts[0] = True
+        np.not_equal(ids[1:], ids[:-1], out=run_starts[1:])
+        run_starts = np.flatnonzero(run_starts)
+        shared = np.diff(run_starts, append=len(ids))
+        ids = ids[run_starts]
+        # Dice coefficient: twice the trigrams in common over the trigrams of both
+        similarity = shared / (len(grams) + self._gram_counts_array[ids])
+        if len(ids) > MATCH_CANDIDATES:
+            ids = ids[np.argpartition(similarity, -MATCH_CANDIDATES)[-MATCH_CANDIDATES:]]
+
+        pattern = _pattern(key)
+        best, best_rank = None, None
+        for candidate in ids.tolist():
+            other = self._keys[candidate]
+            limit = MAX_EDIT_FRACTION * max(len(key), len(other))
+            if abs(len(key) - len(other)) > limit:
+                continue
+            distance = _edit_distance(pattern, len(key), other)
+            if distance <= limit and (best is None or (distance, -self._uses[candidate]) < best_rank):
+                best, best_rank = candidate, (distance, -self._uses[candidate])
+        return self._names[best] if best is not None else None
+
+
+@dataclass
+class LineItem:
+    """
+    This class stores an item read from a receipt.
+
+    Attributes:
+        text: The name as printed on the receipt.
+        amount: The price printed, in cents (before tax).
+        taxable: Whether the item was flagged as taxed.
+        item: The known expense name it matched, if any.
+    """
+    text: str
+    amount: int
+    taxable: bool = False
+    item: str = None
+
+    @property
+    def name(self) -> str:
+        return self.item or self.text
+
+
+@dataclass
+class ReceiptDraft:
+    """
+    This class stores what was read from a receipt, to be confirmed by the user before it is saved.
+
+    Attributes:
+        location: The store (the first line of text on the receipt), if found.
+        date: The date of the receipt (YYYY-MM-DD), if found.
+        total: The total printed on the receipt, in cents, if found.
+        subtotal: The subtotal printed on the receipt, in cents, if found.
+        tax: The tax printed on the receipt, in cents, if found.
+        items: The items read, in order.
+    """
+    location: str = None
+    date: str = None
+    total: int = None
+    subtotal: int = None
+    tax: int = None
+    items: list[LineItem] = field(default_factory=list)
+
+    def expenses(self, receipt: Receipt, tax_rate: float) -> list[Expense]:
+        """
+        Make the expenses of the receipt, adding tax (at tax_rate) to taxable items
+        since expenses are stored after tax.
+        """
+        return [
+            Expense(item=item.name, amount=round(item.amount * (1 + tax_rate)) if item.taxable else item.amount, receipt=receipt)
+            for item in self.items
+        ]
+
+
+def _parse_price(price: str) -> int:
+    # '$ 4,99' -> 499
+    digits = re.sub(r"[^0-9-]", "", price)
+    return int(digits)
+
+
+def _parse_date(line: str) -> str:
+    for pattern, order in DATE_PATTERNS:
+        for found in pattern.finditer(line):
+            parts = dict(zip(order, map(int, found.groups())))
+            if parts["year"] < 100:
+                parts["year"] += 2000
+            for month, day in ((parts["month"], parts["day"]), (parts["day"], parts["month"])):
+                try:
+                    return datetime.date(parts["year"], month, day).isoformat()
+                except ValueError:
+                    continue
+    return None
+
+
+class ReceiptParser:
+    """
+    Turns the text of a receipt, one line at a time, into a ReceiptDraft: the items (name and price, names
+    matched against the known expense names), the store, the date and the totals.
+
+    Attributes:
+        index: The known expense names, or None to keep the names as read.
+        draft: What was read so far.
+    """
+    def __init__(self, index: ItemIndex = None):
+        self.index = index
+        self.draft = ReceiptDraft()
+        self._totals_started = False
+
+    def feed(self, line: str) -> LineItem:
+        """
+        Parse one line of the receipt.
+
+        Args:
+            line: The line of text.
+
+        Returns:
+            The item on the line, or None if the line isn't an item.
+        """
+        line = line.strip()
+        if not line:
+            return None
+        draft = self.draft
+        if draft.date is None and (date := _parse_date(line)):
+            draft.date = date
+            return None
+
+        found = PRICE_RE.search(line)
+        if found is None:
+            if draft.location is None and not draft.items and re.search("[A-Za-z]{2}", line):
+                draft.location = " ".join(line.split()).title()
+            return None
+
+        text = line[:found.start()].strip(" .:$-*")
+        words = _normalize(text)
+        amount = _parse_price(found["price"])
+        if _words(words, SUBTOTAL_WORDS):
+            draft.subtotal = amount
+            self._totals_started = True
+        elif _words(words, TAX_WORDS):
+            draft.tax = (draft.tax or 0) + amount
+            self._totals_started = True
+        elif _words(words, TOTAL_WORDS):
+            # The first total is the receipt's, later ones are usually payments (eg: 'TOTAL SAVINGS')
+            if draft.total is None:
+                draft.total = amount
+            self._totals_started = True
+        elif self._totals_started or _words(words, PAYMENT_WORDS) or not re.search("[a-z]{2}", words):
+            return None
+        else:
+            flag = (found["flag"] or "").upper()
+            item = LineItem(text=" ".join(text.split()), amount=amount, taxable=flag in TAX_FLAGS,
+                            item=self.index.match(text) if self.index is not None else None)
+            draft.items.append(item)
+            return item
+        return None
+
+
+def parse_receipt(lines: Iterable[str], index: ItemIndex = None) -> ReceiptDraft:
+    """
+    Parse the text of a receipt.
+
+    Args:
+        lines: The lines of text (eg: text.splitlines() of the OCR output, or lines as they are read).
+        index: The known expense names to match item names against.
+
+    Returns:
+        The ReceiptDraft read.
+    """
+    parser = ReceiptParser(index)
+    for line in lines:
+        parser.feed(line)
+    return parser.draft
@@ -0,0 +1,158 @@
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from dataclasses import dataclass
+import glob
+from OCR.backends import default_backend, get_engine
+from OCR.cache import image_hash, OCRCache
+import os
+import time
+from typing import Iterator
+
+
+# CONSTANTS
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+# The preprocessing pipeline (see OCR.preprocessing): the steps run, in order, and their parameters.
+# Cropping comes first so the receipt's width is known when downscaling, and deskewing is cheaper once downscaled.
+PREPROCESSING = {
+    "steps": ["grayscale", "crop", "downscale", "deskew", "threshold"],
+    "target_dpi": 300,
+    "receipt_width_inches": 3.15,
+    "max_skew_degrees": 10,
+    "threshold": "adaptive",
+    "block_size": 31,
+    "offset": 15,
+}
+
+
+@dataclass
+class ScanResult:
+    """
+    This class stores the outcome of scanning one receipt image.
+
+    Attributes:
+        path: The path to the image.
+        text: The text read from the image (None if the scan failed).
+        seconds: How long the scan took.
+        error: Why the scan failed, if it did.
+        cached: Whether the text came from the OCR cache.
+    """
+    path: str
+    text: str = None
+    seconds: float = 0.0
+    error: str = None
+    cached: bool = False
+
+
+def ocr_image(path: str, params: dict = None, backend: str = None) -> str:
+    """
+    Read the text of a receipt image: preprocess it and run the OCR engine on it.
+
+    Args:
+        path: The path to the image.
+        params: The preprocessing pipeline, default is PREPROCESSING (missing parameters are taken from it).
+        backend: The OCR backend (see OCR.backends), default is OCR.backends.default_backend().
+            Its engine is created on the first scan and reused for the rest of the process.
+
+    Returns:
+        The text of the receipt.
+    """
+    params = {**PREPROCESSING, **(params or {})}
+    # The OCR stack is slow to import and only needed here, so it is not loaded at startup
+    from OCR.preprocessing import load_image, preprocess
+
+    return get_engine(backend).read_text(preprocess(load_image(path, params), params))
+
+
+def find_receipt_images(path: str) -> list[str]:
+    """
+    List the receipt images to scan.
+
+    Args:
+        path: A directory (every image directly inside it is scanned), a glob (eg: 'receipts/2024-*/*.jpg') or an image.
+
+    Returns:
+        The sorted paths of the images.
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        paths = glob.glob(path)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def _available_cores() -> int:
+    # The cores this process may run on (which can be fewer than the machine has, eg: in a container)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(backend: str) -> None:
+    # Each worker scans one image at a time, so keep Tesseract (and OpenCV) from starting threads of their own
+    # that would compete with the other workers for the same cores
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    # Load the OCR engine once per worker, before its first image
+    get_engine(backend)
+
+
+def _scan(path: str, params: dict, backend: str = None) -> ScanResult:
+    """
+    Scan one image (usually in a worker process). Errors are returned rather than raised so one unreadable
+    image doesn't stop the batch.
+    """
+    start = time.perf_counter()
+    try:
+        text = ocr_image(path, params, backend)
+    except Exception as e:
+        return ScanResult(path=path, seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+    return ScanResult(path=path, text=text, seconds=time.perf_counter() - start)
+
+
+def scan_receipts(paths: list[str], workers: int = None, cache: OCRCache = None, backend: str = None) -> Iterator[ScanResult]:
+    """
+    Scan many receipt images in parallel, one image per worker process at a time.
+
+    With a cache, images already scanned with the cache's preprocessing parameters are returned
+    straight away (first) and the text of the others is added to the cache as they are scanned.
+
+    Args:
+        paths: The paths to the images.
+        workers: The number of worker processes, default is one per core (never more than there are images to scan).
+        cache: An optional OCRCache.
+        backend: The OCR backend (see OCR.backends), default is the cache's backend if there is a cache,
+            otherwise OCR.backends.default_backend().
+
+    Yields:
+        One ScanResult per image, in the order the scans complete.
+    """
+    params = cache.params if cache is not None else PREPROCESSING
+    backend = backend or (cache.backend if cache is not None else None) or default_backend()
+    hashes = {}
+    if cache is not None:
+        for path in paths:
+            start = time.perf_counter()
+            try:
+                hashes[path] = image_hash(path)
+            except OSError as e:
+                yield ScanResult(path=path, seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+        cached = cache.get_many(set(hashes.values()))
+        for path, digest in hashes.items():
+            if digest in cached:
+                yield ScanResult(path=path, text=cached[digest], cached=True)
+        paths = [path for path, digest in hashes.items() if digest not in cached]
+
+    def scanned(result: ScanResult) -> ScanResult:
+        if cache is not None and result.error is None:
+            cache.put(hashes[result.path], result.text)
+        return result
+
+    if len(paths) == 1:
+        # Not worth starting a worker process for
+        yield scanned(_scan(paths[0], params, backend))
+        return
+    if not paths:
+        return
+    workers = min(workers or _available_cores(), len(paths))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend,)) as executor:
+        futures = [executor.submit(_scan, path, params, backend) for path in paths]
+        for future in as_completed(futures):
+            yield scanned(future.result())
@@ -8,7 +8,7 @@ class Program:
     """
     Program is a class to handle the high level program functions. 
     Upon initializing, Program initializes a Database object and,
-    if there is no database file (.sqlite or .db) found in a subdirectory, 
+    if no database file (.sqlite3 or .db) is found, 
     the UI handles initializing a database.
 
     Attributes:
@@ -19,11 +19,14 @@ class Program:
     ui : UI
     database: Database
 
-    def __init__(self, ui: UI) -> None:
+    def __init__(self, ui: UI, db_path: str = None) -> None:
         self.ui = ui
-        db = Database()
+        db = Database(db_path)
         if not db.path:
-            db = self.ui._initialize_db(db)
+            self.ui._initialize_db(db)
+        # Remember the database so it is found immediately next time
+        if db.path:
+            db._remember_path(db.path)
         self.database = db
 
     def run(self) -> None:
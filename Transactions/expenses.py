@@ -9,7 +9,7 @@ class Receipt:
     This class stores the details about a receipt.
     
     Attributes:
-        total: The total price of the receipt.
+        total: The total price of the receipt, in cents.
         date: The date of the receipt (YYYY-MM-DD)
         location: The location of the receipt (eg: 'Costco')
 
@@ -17,7 +17,7 @@ class Receipt:
         insert_into_db(self, database_name): Insert the receipt into the database.
         
     """
-    total: float
+    total: int
     date: str
     location: str
 
@@ -46,7 +46,7 @@ class Expense:
     
     Attributes:
         item: The name of the expense
-        amount: The price of the expense
+        amount: The price of the expense, in cents
         type: The type of the expense (eg: 'want', 'need', 'savings')
         details: Any additional details about the expense
         receipt_id: The id of the receipt associated with the expense assigned by the database.
@@ -54,7 +54,7 @@ class Expense:
         
     """
     item: str
-    amount: str
+    amount: int
     receipt: Receipt
     type: str = None
     category_id: int = None
@@ -67,7 +67,7 @@ class LedgerEntry():
     This class stores the information about a single transaction in the ledger.
     
     Attributes:
-        date: The date of the transaction (YYYY-MM-DD)
+        amount: The amount paid, in cents
         receipt: The receipt associated with the transaction
         account_id: The account id associated with the transaction
 
@@ -75,6 +75,6 @@ class LedgerEntry():
         insert_into_db(self, database_name): Insert the ledger entry into the database.
 
     """
-    amount: str
+    amount: int
     receipt: Receipt
     account_id: int
@@ -0,0 +1,505 @@
+from dataclasses import dataclass, field, replace
+from Database.database import Database
+from Database.money import to_cents
+import csv
+import datetime
+from itertools import chain, islice
+import json
+import logging
+import os
+import re
+import time
+from Transactions.expenses import Expense, LedgerEntry, Receipt
+from Transactions.incomes import Income, Paystub, PaystubLedger
+from Transactions.transactions import ExpenseTransaction, IncomeTransaction, Transaction
+from typing import Iterable, Iterator
+
+
+# CONSTANTS
+IMPORT_BATCH_SIZE = 500
+OFX_EXTENSIONS = (".ofx", ".qfx")
+OFX_READ_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+# Rows read to detect whether a statement shows money spent as negative or positive amounts
+SIGN_SAMPLE_ROWS = 200
+
+
+@dataclass
+class ColumnMap:
+    """
+    This class stores how the columns of a bank statement CSV map onto an expense.
+
+    Attributes:
+        date: The column holding the date of the transaction.
+        amount: The column holding the amount of the transaction.
+        description: The column holding the description of the transaction (used as the item and the location).
+        account: An optional column holding the name of the account (for statements covering several accounts).
+        date_format: The strptime format of the date column.
+        debits_negative: Whether money spent is shown as a negative amount (most banks) or a positive one,
+                         None to detect it from the statement (see _debits_negative).
+    """
+    date: str = "Date"
+    amount: str = "Amount"
+    description: str = "Description"
+    account: str = None
+    date_format: str = "%Y-%m-%d"
+    debits_negative: bool = None
+
+
+@dataclass
+class StatementRow:
+    """
+    This class stores a single row of a bank statement once its columns have been mapped.
+
+    Attributes:
+        date: The date of the transaction (YYYY-MM-DD)
+        amount: The amount spent in cents (positive)
+        description: The description of the transaction
+        account: The name of the account, if the statement has an account column
+    """
+    date: str
+    amount: int
+    description: str
+    account: str = None
+
+
+@dataclass
+class ImportReport:
+    """
+    This class stores the outcome of importing a bank statement (or JSON lines, see import_jsonl).
+
+    Attributes:
+        rows_read: The number of rows read from the statement.
+        imported: The number of rows written to the database.
+        skipped: The number of rows skipped (credits, unparseable rows, rows with an unknown account or category).
+        failed: The number of rows rolled back by the database.
+        seconds: How long the import took.
+        errors: Why rows were skipped (only the first MAX_REPORTED_ERRORS are kept).
+    """
+    rows_read: int = 0
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    errors: list[str] = field(default_factory=list)
+
+    def add_error(self, error: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(error)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (f"Read {self.rows_read} rows: {self.imported} imported, {self.skipped} skipped, {self.failed} failed "
+                f"in {self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s).")
+
+
+def read_csv_rows(path: str) -> Iterator[dict]:
+    """
+    Stream the rows of a CSV bank statement.
+
+    Args:
+        path: The path to the CSV file.
+
+    Yields:
+        One dictionary of column name -> value per row.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def _read_ofx_tags(path: str) -> Iterator[tuple[str, str]]:
+    """
+    Stream the tags of an OFX/QFX file (SGML or XML flavour) in fixed size chunks.
+
+    Args:
+        path: The path to the OFX file.
+
+    Yields:
+        (tag, text) pairs, eg: ("TRNAMT", "-12.34") or ("/STMTTRN", "").
+    """
+    tag_regex = re.compile(r"<([^<>]+)>([^<]*)")
+    with open(path, encoding="utf-8", errors="replace") as f:
+        buffer = ""
+        while True:
+            chunk = f.read(OFX_READ_SIZE)
+            buffer += chunk
+            # Keep the last (possibly incomplete) tag in the buffer until more of the file is read
+            cut = max(buffer.rfind("<"), 0) if chunk else len(buffer)
+            for match in tag_regex.finditer(buffer, 0, cut):
+                yield match.group(1).strip().upper(), match.group(2).strip()
+            buffer = buffer[cut:]
+            if not chunk:
+                return
+
+
+def read_ofx_rows(path: str) -> Iterator[dict]:
+    """
+    Stream the transactions (STMTTRN blocks) of an OFX/QFX bank statement.
+
+    Args:
+        path: The path to the OFX file.
+
+    Yields:
+        One dictionary per transaction with keys "Date" (YYYY-MM-DD), "Amount", "Description" and "Account".
+    """
+    account = None
+    transaction = None
+    for tag, text in _read_ofx_tags(path):
+        if tag == "ACCTID":
+            account = text
+        elif tag == "STMTTRN":
+            transaction = {}
+        elif tag == "/STMTTRN" and transaction is not None:
+            posted = transaction.get("DTPOSTED", "")
+            description = transaction.get("NAME") or transaction.get("MEMO") or transaction.get("PAYEE", "")
+            yield {
+                "Date": f"{posted[0:4]}-{posted[4:6]}-{posted[6:8]}",
+                "Amount": transaction.get("TRNAMT", ""),
+                "Description": description,
+                "Account": account,
+            }
+            transaction = None
+        elif transaction is not None and text:
+            transaction[tag] = text
+
+
+def _parse_amount(amount: str) -> int:
+    """
+    Parse an amount as written in a bank statement (eg: "$1,234.56", "-12.00" or "(12.00)") into cents.
+    """
+    amount = amount.strip()
+    if amount.startswith("(") and amount.endswith(")"):
+        amount = "-" + amount[1:-1]
+    return to_cents(amount)
+
+
+def _debits_negative(rows: Iterable[dict], column_map: ColumnMap) -> bool:
+    """
+    Guess whether a statement shows money spent as negative amounts: it does if most of the amounts in rows are
+    negative, as a statement is mostly purchases. Rows whose amount can't be parsed are ignored.
+    """
+    negative = positive = 0
+    for row in rows:
+        try:
+            amount = _parse_amount(row[column_map.amount])
+        except (KeyError, ValueError, AttributeError):
+            continue
+        negative += amount < 0
+        positive += amount > 0
+    return negative >= positive
+
+
+def _map_columns(rows: Iterable[dict], column_map: ColumnMap, report: ImportReport) -> Iterator[StatementRow]:
+    """
+    Map the raw rows of a statement onto StatementRows, skipping credits and rows that can't be parsed.
+    """
+    for row in rows:
+        report.rows_read += 1
+        try:
+            amount = _parse_amount(row[column_map.amount])
+            date = datetime.datetime.strptime(row[column_map.date].strip(), column_map.date_format).strftime("%Y-%m-%d")
+            description = row[column_map.description].strip()
+        except (KeyError, ValueError, AttributeError) as e:
+            report.skipped += 1
+            report.add_error(f"Row {report.rows_read}: could not parse {row} ({e!r})")
+            continue
+
+        spent = -amount if column_map.debits_negative else amount
+        if spent <= 0 or not description:
+            report.skipped += 1
+            continue
+        account = row.get(column_map.account) if column_map.account else None
+        yield StatementRow(date=date, amount=spent, description=description, account=account)
+
+
+class _Resolver:
+    """
+    Resolves the account, category and type of imported expenses from what is already in the database:
+    an item is given the category and type it was last entered with. Each item's history is looked up
+    once, through the (item, id) index, so only the items being imported are read.
+    """
+    def __init__(self, database: Database, account_id: int, default_category_id: int, default_type: str,
+                 account_map: dict[str, int] = None):
+        self.database = database
+        self.account_id = account_id
+        self.account_map = account_map or {}
+        self.default_category_id = default_category_id
+        self.default_type = default_type
+        expense_cols = database._get_columns("expenses")
+        self.has_type = "type" in expense_cols
+        self.has_category = "category_id" in expense_cols
+
+        self.accounts = {name: account_id for account_id, name in database.query_db("SELECT id, name FROM accounts")}
+        self._history_cols = [col for col, keep in (("category_id", self.has_category), ("type", self.has_type)) if keep]
+        # Item -> {column: value} of the last time it was entered
+        self._history = {}
+
+    def _last_entered(self, item: str) -> dict:
+        if item not in self._history:
+            row = None
+            if self._history_cols:
+                with self.database._create_connection() as c:
+                    c.execute(f"SELECT {', '.join(self._history_cols)} FROM expenses WHERE item = ? ORDER BY id DESC LIMIT 1", (item,))
+                    row = c.fetchone()
+            self._history[item] = dict(zip(self._history_cols, row)) if row else {}
+        return self._history[item]
+
+    def account(self, account: str = None) -> int:
+        """
+        The id of an account named in the input: mapped explicitly (account_map) or by the account's name.
+        Rows naming no account belong to the default account, rows naming an unknown account to none (None),
+        rather than guessing which account was meant.
+        """
+        if not account:
+            return self.account_id
+        if account in self.account_map:
+            return self.account_map[account]
+        return self.accounts.get(account)
+
+    def category(self, item: str) -> int:
+        if not self.has_category:
+            return None
+        return self._last_entered(item).get("category_id", self.default_category_id)
+
+    def type(self, item: str) -> str:
+        if not self.has_type:
+            return None
+        return self._last_entered(item).get("type", self.default_type)
+
+
+def _build_transactions(rows: Iterable[StatementRow], resolver: _Resolver, report: ImportReport) -> Iterator[ExpenseTransaction]:
+    """
+    Turn each statement row into an ExpenseTransaction with one receipt, one expense and one ledger entry.
+    """
+    for row in rows:
+        account_id = resolver.account(row.account)
+        category_id = resolver.category(row.description)
+        if account_id is None:
+            report.skipped += 1
+            missing = f"unknown account {row.account!r}" if row.account else "no account"
+            report.add_error(f"Row {report.rows_read}: {missing} for {row.description!r}")
+            continue
+        if resolver.has_category and category_id is None:
+            report.skipped += 1
+            report.add_error(f"Row {report.rows_read}: no category for {row.description!r}")
+            continue
+
+        amount = row.amount
+        receipt = Receipt(total=amount, date=row.date, location=row.description)
+        expense = Expense(item=row.description, amount=amount, receipt=receipt, type=resolver.type(row.description), category_id=category_id)
+        ledger_entry = LedgerEntry(amount=amount, receipt=receipt, account_id=account_id)
+        yield ExpenseTransaction(receipt=receipt, expenses=[expense], ledger_entries=[ledger_entry])
+
+
+def import_statement(
+    database: Database,
+    path: str,
+    account_id: int = None,
+    column_map: ColumnMap = None,
+    default_category_id: int = None,
+    default_type: str = "need",
+    batch_size: int = IMPORT_BATCH_SIZE,
+    account_map: dict[str, int] = None
+    ) -> ImportReport:
+    """
+    Import a CSV or OFX/QFX bank statement as expense transactions.
+
+    The statement is streamed through a pipeline of generators (read -> map columns -> resolve account
+    and category -> build transactions) and written batch_size transactions at a time, so memory use
+    does not depend on the size of the file.
+
+    Args:
+        database: The database to import the statement into.
+        path: The path to the statement. Files ending in .ofx or .qfx are read as OFX, anything else as CSV.
+        account_id: The account the statement belongs to (used for rows that don't name an account). An OFX statement
+                    names its account by number, which is mapped to account_id unless account_map is given
+                    (rows of any other account in the file are then skipped as errors).
+        column_map: How the CSV columns map onto an expense (ignored for OFX). If it doesn't say whether money spent
+                    is negative (debits_negative is None), that is detected from the first SIGN_SAMPLE_ROWS rows.
+        default_category_id: The category given to items that have never been entered before.
+        default_type: The type given to items that have never been entered before.
+        batch_size: How many transactions to write per database transaction.
+        account_map: The account id of each account named in the statement (eg: {"1234": 2}), for names that
+                     aren't the name of an account in the database. Rows naming any other account are skipped as errors.
+
+    Returns:
+        An ImportReport with counts and throughput.
+
+    Effects:
+        Modifies tables 'receipts', 'expenses' and 'ledger' in the database.
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+
+    if path.lower().endswith(OFX_EXTENSIONS):
+        rows = read_ofx_rows(path)
+        # OFX amounts are signed from the account holder's point of view, money spent is negative
+        column_map = ColumnMap(account="Account", debits_negative=True)
+        if account_map is None and account_id is not None:
+            # The statement is for the account given: map its account number (the first one in the file) to it
+            first_row = next(rows, None)
+            if first_row is not None:
+                account_map = {first_row["Account"]: account_id}
+                rows = chain([first_row], rows)
+    else:
+        rows = read_csv_rows(path)
+        column_map = column_map or ColumnMap()
+        if column_map.debits_negative is None:
+            # Detect the sign of money spent from the first rows, then put them back in front of the rest
+            sample = list(islice(rows, SIGN_SAMPLE_ROWS))
+            column_map = replace(column_map, debits_negative=_debits_negative(sample, column_map))
+            logging.info(f"Money spent is shown as {'negative' if column_map.debits_negative else 'positive'} amounts in {path}.")
+            rows = chain(sample, rows)
+
+    resolver = _Resolver(database, account_id, default_category_id, default_type, account_map)
+    transactions = _build_transactions(_map_columns(rows, column_map, report), resolver, report)
+
+    while True:
+        batch = list(islice(transactions, batch_size))
+        if not batch:
+            break
+        ids = ExpenseTransaction.execute_many(database, batch, rollback_per_item=True)
+        failed = ids.count(None)
+        report.failed += failed
+        report.imported += len(ids) - failed
+
+    report.seconds = time.perf_counter() - start
+    logging.info(f"Imported {os.path.basename(path)}: {report}")
+    return report
+
+
+def _payments(record: dict, key: str, total: int, resolver: _Resolver) -> list[tuple[int, int]]:
+    """
+    The (amount in cents, account id) payments of a JSON record: the list under key,
+    or else the whole total paid from the record's 'account_id' or 'account' (by name).
+    """
+    def account_id(payment: dict) -> int:
+        if payment.get("account_id") is not None:
+            return payment["account_id"]
+        account_id = resolver.account(payment.get("account"))
+        if account_id is None:
+            raise ValueError(f"unknown account {payment['account']!r}" if payment.get("account") else "no account given")
+        return account_id
+
+    if key in record:
+        payments = [(to_cents(payment["amount"]), account_id(payment)) for payment in record[key]]
+    else:
+        payments = [(total, account_id(record))]
+    if sum(amount for amount, _ in payments) != total:
+        raise ValueError(f"{key} add up to {sum(amount for amount, _ in payments)} cents, not the total of {total} cents")
+    return payments
+
+
+def transaction_from_record(record: dict, resolver: _Resolver) -> Transaction:
+    """
+    Build a transaction from a JSON record (see import_jsonl).
+
+    Raises:
+        KeyError: If a required field is missing.
+        ValueError: If a field is invalid, or the payments don't add up to the total.
+    """
+    kind = record.get("kind") or ("income" if "payer" in record else "expense")
+    date = datetime.date.fromisoformat(record.get("date") or datetime.date.today().isoformat()).isoformat()
+    if kind == "expense":
+        receipt = Receipt(total=0, date=date, location=record["location"])
+        expenses = []
+        for item in record["items"]:
+            name = item["item"]
+            category_id = item["category_id"] if "category_id" in item else resolver.category(name)
+            if resolver.has_category and category_id is None:
+                raise ValueError(f"no category for {name!r}")
+            expenses.append(Expense(item=name, amount=to_cents(item["amount"]), receipt=receipt,
+                                    type=item["type"] if "type" in item else resolver.type(name), category_id=category_id,
+                                    details=item.get("details")))
+        receipt.total = sum(expense.amount for expense in expenses)
+        ledger_entries = [LedgerEntry(amount=amount, receipt=receipt, account_id=account_id)
+                          for amount, account_id in _payments(record, "payments", receipt.total, resolver)]
+        return ExpenseTransaction(receipt=receipt, expenses=expenses, ledger_entries=ledger_entries)
+    if kind == "income":
+        paystub = Paystub(total=0, date=date, payer=record["payer"])
+        incomes = [Income(amount=to_cents(income["amount"]), paystub=paystub, details=income.get("details"))
+                   for income in record.get("incomes", [record])]
+        paystub.total = sum(income.amount for income in incomes)
+        ledger_entries = [PaystubLedger(amount=amount, paystub=paystub, account_id=account_id)
+                          for amount, account_id in _payments(record, "deposits", paystub.total, resolver)]
+        return IncomeTransaction(paystub=paystub, income_events=incomes, ledger_entries=ledger_entries)
+    raise ValueError(f"unknown kind {kind!r}, expected 'expense' or 'income'")
+
+
+def _read_records(lines: Iterable[str | dict], resolver: _Resolver, report: ImportReport) -> Iterator[Transaction]:
+    """
+    Turn each JSON line (or record already parsed) into a transaction, skipping blank lines and lines that can't be parsed.
+    """
+    for line in lines:
+        if isinstance(line, str) and not line.strip():
+            continue
+        report.rows_read += 1
+        try:
+            yield transaction_from_record(json.loads(line) if isinstance(line, str) else line, resolver)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            report.skipped += 1
+            report.add_error(f"Line {report.rows_read}: could not import {str(line).strip()[:200]} ({e!r})")
+
+
+def import_jsonl(
+    database: Database,
+    lines: Iterable[str | dict],
+    account_id: int = None,
+    default_category_id: int = None,
+    default_type: str = "need",
+    batch_size: int = IMPORT_BATCH_SIZE
+    ) -> ImportReport:
+    """
+    Import transactions written as JSON lines (eg: streamed from stdin), one transaction per line. Amounts are
+    in dollars (numbers or strings) and the date defaults to today. An expense transaction looks like:
+
+        {"kind": "expense", "date": "2025-03-14", "location": "Costco",
+         "items": [{"item": "milk", "amount": 5.49, "type": "need", "category_id": 3, "details": "2%"}],
+         "payments": [{"account_id": 1, "amount": 5.49}]}
+
+    and an income transaction like:
+
+        {"kind": "income", "date": "2025-03-15", "payer": "Work", "amount": "2500.00", "details": "March",
+         "deposits": [{"account": "Chequing", "amount": "2500.00"}]}
+
+    Instead of a list of payments (or deposits) a transaction can give an 'account_id' or 'account' (by name)
+    paying the whole total, and an income transaction can list several 'incomes' (each with an amount and details).
+    The type and category of an item default to what it was last entered with, then to the defaults given.
+
+    Lines are parsed as they are read and written batch_size transactions at a time, each under
+    its own savepoint, so memory use does not depend on the size of the input.
+
+    Args:
+        database: The database to import the transactions into.
+        lines: The JSON lines (or the records, as dictionaries).
+        account_id: The account of transactions that don't give one.
+        default_category_id: The category given to items that have never been entered before.
+        default_type: The type given to items that have never been entered before.
+        batch_size: How many transactions to write per database transaction.
+
+    Returns:
+        An ImportReport with counts and throughput.
+
+    Effects:
+        Modifies tables 'receipts', 'expenses', 'ledger', 'paystubs', 'incomes' and 'paystub_ledger' in the database.
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+    resolver = _Resolver(database, account_id, default_category_id, default_type)
+    transactions = _read_records(lines, resolver, report)
+
+    while True:
+        batch = list(islice(transactions, batch_size))
+        if not batch:
+            break
+        ids = Transaction.execute_many(database, batch, rollback_per_item=True)
+        failed = ids.count(None)
+        report.failed += failed
+        report.imported += len(ids) - failed
+
+    report.seconds = time.perf_counter() - start
+    logging.info(f"Imported JSON lines: {report}")
+    return report
@@ -9,7 +9,7 @@ class Paystub:
     This class stores the details about a paystub.
     
     Attributes:
-        total: The total income of the paystub.
+        total: The total income of the paystub, in cents.
         date: The date of the receipt (YYYY-MM-DD)
         payer: The source of the paystub (eg: 'work')
 
@@ -17,7 +17,7 @@ class Paystub:
         insert_into_db(self, database_name): Insert the receipt into the database.
         
     """
-    total: float
+    total: int
     date: str
     payer: str
 
@@ -43,8 +43,13 @@ class Paystub:
 class Income:
     """
     This class stores the details about a single income instance. 
+
+    Attributes:
+        amount: The amount of the income, in cents
+        paystub: The paystub the income is part of
+        details: Any additional details about the income
     """
-    amount: str
+    amount: int
     paystub: Paystub
     details: str = None
 
@@ -55,14 +60,14 @@ class PaystubLedger():
     This class stores the information about a single transaction in the ledger.
     
     Attributes:
-        date: The date of the transaction (YYYY-MM-DD)
-        receipt: The receipt associated with the transaction
+        amount: The amount received, in cents
+        paystub: The paystub associated with the transaction
         account_id: The account id associated with the transaction
 
     Methods:
         insert_into_db(self, database_name): Insert the ledger entry into the database.
 
     """
-    amount: str
+    amount: int
     paystub: Paystub
     account_id: int
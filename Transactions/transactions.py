@@ -4,7 +4,37 @@ from Database.database import Database
 from Transactions.expenses import Expense, LedgerEntry, Receipt
 #from Database.manage_database import _create_connection
 from Transactions.incomes import Income, Paystub, PaystubLedger
+import logging
 import sqlite3
+from typing import Iterable
+
+
+def _insert_statement(table_name: str, row: object, parent_field: str = "", parent_id: int = None) -> tuple[str, list]:
+    """
+    Build a parameterized INSERT statement for a row dataclass (eg: an Expense or a LedgerEntry).
+    Fields that are None are left out, and the field referencing the parent receipt/paystub is
+    replaced by the parent's id (eg: Expense.receipt is inserted as expenses.receipt_id).
+
+    Args:
+        table_name: The name of the table to insert the row into.
+        row: The dataclass to insert.
+        parent_field: The name of the field referencing the parent receipt/paystub, if any.
+        parent_id: The id of the parent receipt/paystub in the database.
+
+    Returns:
+        The SQL statement and the list of values to bind to it.
+    """
+    cols = []
+    vals = []
+    for col, val in row.__dict__.items():
+        if val is None:
+            continue
+        if col == parent_field:
+            col, val = f"{col}_id", parent_id
+        cols.append(col)
+        vals.append(val)
+    placeholders = ", ".join("?" for _ in vals)
+    return f"INSERT INTO {table_name} ({', '.join(cols)}) VALUES ({placeholders})", vals
 
 
 class Transaction(ABC):
@@ -12,6 +42,86 @@ class Transaction(ABC):
     def execute(self, database_name: str) -> str:
         pass
 
+    @abstractmethod
+    def _rows(self) -> tuple[str, object, str, list[tuple[str, list]]]:
+        """
+        Returns the rows making up the transaction: the parent table, the parent row (eg: the receipt),
+        the name of the field children use to reference the parent, and a list of (table, rows) for the children.
+        """
+        pass
+
+    def _write(self, cursor: sqlite3.Cursor, pending: dict = None) -> int:
+        """
+        Insert the transaction using an open cursor. The parent row is inserted immediately (its id is needed
+        by the children). If pending is given, the child rows are added to it, keyed by statement,
+        to be inserted later with executemany, otherwise they are inserted immediately.
+
+        Args:
+            cursor: A cursor inside an open transaction.
+            pending: Optional dictionary of statement -> list of parameters to collect child rows in.
+
+        Returns:
+            The id of the parent row.
+        """
+        parent_table, parent, parent_field, children = self._rows()
+        cursor.execute(*_insert_statement(parent_table, parent))
+        parent_id = cursor.lastrowid
+        for table_name, rows in children:
+            for row in rows:
+                sql, vals = _insert_statement(table_name, row, parent_field=parent_field, parent_id=parent_id)
+                if pending is None:
+                    cursor.execute(sql, vals)
+                else:
+                    pending.setdefault(sql, []).append(vals)
+        return parent_id
+
+    @classmethod
+    def execute_many(cls, database: Database, transactions: Iterable["Transaction"], rollback_per_item: bool = False) -> list[int]:
+        """
+        Insert many transactions in a single database transaction. Child rows (expenses, ledger entries, ...)
+        are inserted with one executemany per distinct statement.
+
+        By default the whole batch is rolled back if any transaction fails. With rollback_per_item,
+        each transaction is written under its own savepoint so a failing transaction is rolled back on
+        its own and the rest of the batch is still committed.
+
+        Args:
+            database: The database to insert the transactions into.
+            transactions: The transactions to insert.
+            rollback_per_item: Whether to roll back failing transactions individually instead of the whole batch.
+
+        Returns:
+            The id of the receipt/paystub assigned to each transaction, in order
+            (None for transactions that were rolled back).
+
+        Raises:
+            sqlite3.Error: If a transaction fails and rollback_per_item is False. Nothing is committed.
+        """
+        ids = []
+        with database.transaction() as c:
+            if not rollback_per_item:
+                pending = {}
+                for transaction in transactions:
+                    ids.append(transaction._write(c, pending))
+                for sql, vals in pending.items():
+                    c.executemany(sql, vals)
+                return ids
+
+            for transaction in transactions:
+                pending = {}
+                c.execute("SAVEPOINT batch_item")
+                try:
+                    parent_id = transaction._write(c, pending)
+                    for sql, vals in pending.items():
+                        c.executemany(sql, vals)
+                except sqlite3.Error as e:
+                    logging.error(f"Transaction for {transaction._rows()[1]} rolled back. See error message -> {e}")
+                    c.execute("ROLLBACK TO batch_item")
+                    parent_id = None
+                c.execute("RELEASE batch_item")
+                ids.append(parent_id)
+        return ids
+
 
 @dataclass
 class ExpenseTransaction(Transaction):
@@ -50,38 +160,16 @@ class ExpenseTransaction(Transaction):
         Effects:
             Modifies table 'receipts', 'ledger' and 'expenses' in the database.
         """
-        with database._create_connection() as c:
-            c.execute("begin")
-            try:
-                # Inserting receipt
-                receipt_cols = ", ".join(str(i) for i in list(self.receipt.__dict__.keys()))
-                receipt_vals = ", ".join("\'" + str(i) + "\'" for i in list(self.receipt.__dict__.values()))
-                c.execute(f"""INSERT INTO receipts ({receipt_cols}) VALUES ({receipt_vals})""")
-
-                # Inserting expenses:
-                # Getting receipt id for the inserted receipt
-                receipt_id = c.execute(f"""SELECT last_insert_rowid()""").fetchone()[0]
-                # Inserting expenses
-                for expense in self.expenses:
-                    expense_cols = [col for col in expense.__dict__.keys() if expense.__dict__[col] is not None]
-                    expense_cols_str = ", ".join(str(i) if i != "receipt" else "receipt_id" for i in expense_cols)
-                    expense_vals = [val for val in expense.__dict__.values() if val is not None]
-                    expense_vals_str = ", ".join("\'" + str(val) + "\'" if not isinstance(val, Receipt) else str(receipt_id) for val in expense_vals )
-                    c.execute(f"""INSERT INTO expenses ({expense_cols_str}) VALUES ({expense_vals_str})""")
-
-                # Inserting ledger entries
-                for ledger_entry in self.ledger_entries:
-                    ledger_cols = [col for col in ledger_entry.__dict__.keys() if ledger_entry.__dict__[col] is not None]
-                    ledger_cols_str = ", ".join(str(i) if i != "receipt" else "receipt_id" for i in ledger_cols)
-                    ledger_vals = [val for val in ledger_entry.__dict__.values() if val is not None]
-                    ledger_vals_str = ", ".join("\'" + str(val) + "\'" if not isinstance(val, Receipt) else str(receipt_id) for val in ledger_vals )
-                    c.execute(f"""INSERT INTO ledger ({ledger_cols_str}) VALUES ({ledger_vals_str})""")
-
-                c.execute("commit")
-            except sqlite3.OperationalError as e:
-                print(e)
-                c.execute("rollback")
-                return e
+        try:
+            with database.transaction() as c:
+                # Inserting receipt, then its expenses and ledger entries
+                self._write(c)
+        except sqlite3.OperationalError as e:
+            print(e)
+            return e
+
+    def _rows(self) -> tuple[str, object, str, list[tuple[str, list]]]:
+        return "receipts", self.receipt, "receipt", [("expenses", self.expenses), ("ledger", self.ledger_entries)]
 
 
 @dataclass
@@ -123,32 +211,11 @@ class IncomeTransaction(Transaction):
         Effects:
             Modifies table 'paystubs', 'paystub_ledger' and 'incomes' in the database.
         """
-        with database._create_connection() as c:
-            c.execute("begin")
-            try:
-                paystub_cols = ", ".join(str(i) for i in list(self.paystub.__dict__.keys()))
-                paystub_vals = ", ".join("\'" + str(i) + "\'" for i in list(self.paystub.__dict__.values()))
-
-                c.execute(f"""INSERT INTO paystubs ({paystub_cols}) VALUES ({paystub_vals})""")
-
-                paystub_id = c.execute(f"""SELECT last_insert_rowid()""").fetchone()[0]
-                for income in self.income_events:
-                    income_cols = list(income.__dict__.keys())
-                    income_cols = ", ".join(str(i) if i != "paystub" else "paystub_id" for i in income_cols)
-                    income_vals = list(income.__dict__.values())
-                    income_vals = [income_vals[0]] + [paystub_id] + [income_vals[2]]
-                    income_vals = ", ".join("\'" + str(i) + "\'" for i in income_vals)
-
-                    c.execute(f"""INSERT INTO incomes ({income_cols}) VALUES ({income_vals})""")
-                for ledger_entry in self.ledger_entries:
-                    ledger_cols = list(ledger_entry.__dict__.keys())
-                    ledger_cols = ", ".join(str(i) if i != "paystub" else "paystub_id" for i in ledger_cols)
-                    ledger_vals = list(ledger_entry.__dict__.values())
-                    ledger_vals = [ledger_vals[0]] + [paystub_id] + [ledger_vals[2]]
-                    ledger_vals = ", ".join("\'" + str(i) + "\'" for i in ledger_vals)
-                    c.execute(f"""INSERT INTO paystub_ledger ({ledger_cols}) VALUES ({ledger_vals})""")
-
-                c.execute("commit")
-            except sqlite3.OperationalError as e:
-                c.execute("rollback")
-                return e
+        try:
+            with database.transaction() as c:
+                self._write(c)
+        except sqlite3.OperationalError as e:
+            return e
+
+    def _rows(self) -> tuple[str, object, str, list[tuple[str, list]]]:
+        return "paystubs", self.paystub, "paystub", [("incomes", self.income_events), ("paystub_ledger", self.ledger_entries)]
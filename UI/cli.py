@@ -1,18 +1,22 @@
 from collections import Counter
-import cv2
-from Database.database import Database
+from Database.database import Database, PAGE_SIZE, REPORT_MONEY_COLS, REPORT_MONTHS
+from Database.export import EXPENSE_HISTORY, export_to_path, source_query
+from Database.money import format_cents, to_cents
+from OCR.cache import OCRCache
+from OCR.scanner import find_receipt_images, PREPROCESSING, scan_receipts
 import datetime
-import numpy as np
-from PIL import Image
-from prompt_toolkit.completion import FuzzyCompleter
+import os
+from prompt_toolkit.completion import Completer, FuzzyCompleter
 from prompt_toolkit.shortcuts import prompt
-import pytesseract
+import sqlite3
 import sys
+import time
 from Transactions.categories import Account, ExpenseCategory
 from Transactions.expenses import Expense, LedgerEntry, Receipt
+from Transactions.importers import ColumnMap, import_statement, OFX_EXTENSIONS
 from Transactions.incomes import Income, Paystub, PaystubLedger
 from Transactions.transactions import IncomeTransaction, ExpenseTransaction
-from UI.cli_autocompleter import CustomCompleter
+from UI.cli_autocompleter import CompletionIndex, CustomCompleter, DeferredCompleter
 from UI.menu import Menu
 from UI.program_menus import IndexMenu, MainMenu, TableMenu
 
@@ -22,15 +26,15 @@ HST_TAX_RATE = 0.13
 
 
 # HELPERS
-def _apply_tax(expense_amount: float) -> float:
+def _apply_tax(expense_amount: int) -> int:
     """
-    _apply_tax takes a float expense amount and returns the amount after tax, if the expense is taxable.
+    _apply_tax takes an expense amount in cents and returns the amount after tax (rounded to the cent), if the expense is taxable.
 
     Args:
-        expense_amount: float, the amount of the expense.
+        expense_amount: int, the amount of the expense in cents.
 
     Returns:
-        float, the amount of the expense after tax, if applicable.
+        int, the amount of the expense after tax in cents, if applicable.
     """
     print("Is this expense taxable? (y/n): ")
     taxable = input("> ")
@@ -58,12 +62,38 @@ def _apply_tax(expense_amount: float) -> float:
                     if tax_rate == "":
                         tax_rate = HST_TAX_RATE
                         valid = True
-        expense_amount = float(expense_amount) * (1 + tax_rate)
+        expense_amount = round(expense_amount * (1 + tax_rate))
         
     return expense_amount
 
 
 class CLI():
+    def __init__(self, ocr_backend: str = None):
+        # The OCR backend receipts are scanned with (see OCR.backends), None for the default one
+        self.ocr_backend = ocr_backend
+        # Built on first use and then kept up to date as transactions are added (see _get_expense_name_index)
+        self._expense_name_index = None
+        # Same for the index receipt item names are matched against (see _get_item_index)
+        self._item_index = None
+
+    def _get_expense_name_index(self, database: Database) -> CompletionIndex:
+        """
+        Returns the completion index of expense names for this session, building it on first use.
+        """
+        if self._expense_name_index is None:
+            self._expense_name_index = CompletionIndex.from_usage(database._count_items())
+        return self._expense_name_index
+
+    def _get_item_index(self, database: Database):
+        """
+        Returns the index of expense names that names read from receipts are matched against, building it on first use.
+        """
+        if self._item_index is None:
+            from OCR.receipt_parser import ItemIndex
+
+            self._item_index = ItemIndex.from_usage(database._count_items())
+        return self._item_index
+
     @staticmethod
     def _read_user_receipt() -> list:
         """
@@ -102,7 +132,7 @@ class CLI():
         return {'date': receipt_date, 'location': receipt_location}
 
     @staticmethod
-    def _read_expense_name(expense_name_completer: FuzzyCompleter) -> str:
+    def _read_expense_name(expense_name_completer: Completer) -> str:
         print("Enter expense name (enter nothing or \"done\" if done entering expenses): ")
         expense_name = prompt(
             "> ",
@@ -133,7 +163,7 @@ class CLI():
         return expense_name
 
     @staticmethod
-    def _read_expense_amount(expense_amount_completer: FuzzyCompleter) -> float:
+    def _read_expense_amount(expense_amount_completer: FuzzyCompleter) -> int:
         print("Enter expense amount ($): ")
         expense_amount = prompt(
             "> ",
@@ -149,7 +179,7 @@ class CLI():
         valid = False
         while not valid:
             try:
-                expense_amount = float(expense_amount)
+                expense_amount = to_cents(expense_amount)
                 valid = True
             except ValueError:
                 print("Invalid amount entered, please try again: ")
@@ -162,8 +192,7 @@ class CLI():
                     return None
                 if expense_amount.lower() == "done":
                     return "done"                    
-        expense_amount = _apply_tax(expense_amount)
-        return float(expense_amount)
+        return _apply_tax(expense_amount)
 
     @staticmethod
     def _read_expense_type(expense_name: str, expense_types: list, completer: FuzzyCompleter) -> str:
@@ -216,7 +245,7 @@ class CLI():
 
         database_name = database.path
         print(f"Printing categories...")
-        database.print_table("categories")
+        database.print_table("categories", pager=False)
 
         if category_map_existing:
 
@@ -332,6 +361,23 @@ class CLI():
                     return "done"
         return expense_details
 
+    @staticmethod
+    def _fetch_item_history(database: Database, expense_name: str) -> dict:
+        """
+        Run the queries the amount, type and category prompts need for an expense item
+        (on the prefetch thread, see Database.prefetch), so they are cached by the time the prompts need them.
+
+        Returns:
+            The item's history, from _search_expenses.
+        """
+        expense_map = database._search_expenses(expense_item=expense_name)
+        if "category_id" in expense_map.keys():
+            database._search_categories()
+            expense_category_ids = list(dict.fromkeys(expense_map['category_id']))
+            if expense_category_ids:
+                database._search_categories(expense_category_ids)
+        return expense_map
+
     def _read_user_expenses(self, database: Database) -> list:
         """
         Reads all data required from user to initialize an expense object.
@@ -355,27 +401,25 @@ class CLI():
         expenses = []
         while True:
             user_data = {}
-            # Autocompletion for expense names:
-            expense_map = database._search_expenses()
-
-            # Read expense name:
-            expense_name_completer = FuzzyCompleter(CustomCompleter(expense_map['item']))
-            expense_name = self._read_expense_name(expense_name_completer)
+            # Read expense name (the completion index does its own fuzzy matching):
+            expense_name = self._read_expense_name(self._get_expense_name_index(database))
             if not expense_name:
                 return None
             if expense_name == "done":
                 break
             user_data['name'] = expense_name
             
-            # Read expense amount:
-            expense_map = database._search_expenses(expense_item=expense_name)
-            expense_amount_completer = FuzzyCompleter(CustomCompleter(list(str(x) for x in set(expense_map['amount']))))
+            # Read expense amount, while the item's history is looked up in the background:
+            history = database.prefetch(lambda: self._fetch_item_history(database, expense_name))
+            expense_amount_completer = FuzzyCompleter(DeferredCompleter(history, lambda expense_map: [format_cents(x) for x in set(expense_map['amount'])]))
             expense_amount = self._read_expense_amount(expense_amount_completer)
             if not expense_amount:
                 return None
             if expense_amount == "done":
                 break
             user_data['amount'] = expense_amount
+            # Prefetched by now (or waits for the prefetch to finish)
+            expense_map = database._search_expenses(expense_item=expense_name)
             
             # Read expense type:
             if "type" in expense_map.keys():
@@ -430,14 +474,13 @@ class CLI():
 
         return expenses
 
-    def _read_user_ledger_entries(self, database: Database, receipt_total: float) -> list[list[float, int]]:
+    def _read_user_ledger_entries(self, database: Database, receipt_total: int) -> list[list[int, int]]:
         print("How did you pay?")
-        tol = 10e-3
         ledger_entries = []
-        while abs(receipt_total) >= tol:
-            print("Remaining on receipt: ${:.2f}".format(receipt_total))
+        while receipt_total != 0:
+            print(f"Remaining on receipt: ${format_cents(receipt_total)}")
             print("Select account id used to pay (see accounts below): ")
-            database.print_table("accounts")
+            database.print_table("accounts", pager=False)
             print("Enter account id or enter \"add\" to add a new account: ")
             account_id = input("> ")
             if account_id.lower() == "q":
@@ -450,16 +493,22 @@ class CLI():
                 account = Account(account_name, account_description)
                 account_id = account.insert_into_db(database)
             
-            print(f"How much of the remaining ${receipt_total:.2f} did you pay with this account?")
-            print(f"Enter payment amount ($) or press enter if you paid the remaining ${receipt_total:.2f} with acccount id {account_id}: ")
+            print(f"How much of the remaining ${format_cents(receipt_total)} did you pay with this account?")
+            print(f"Enter payment amount ($) or press enter if you paid the remaining ${format_cents(receipt_total)} with acccount id {account_id}: ")
             payment_amount = input("> ")
             if payment_amount.lower() == "q":
                 return None
             if not payment_amount:
                 payment_amount = receipt_total
+            else:
+                try:
+                    payment_amount = to_cents(payment_amount)
+                except ValueError:
+                    print("Invalid amount entered, please try again.")
+                    continue
             
-            ledger_entries.append([float(payment_amount), int(account_id)])
-            receipt_total -= float(payment_amount)
+            ledger_entries.append([payment_amount, int(account_id)])
+            receipt_total -= payment_amount
         return ledger_entries
 
     def _read_expense_transaction_from_user(self, database: Database) -> ExpenseTransaction:
@@ -493,7 +542,7 @@ class CLI():
         
         receipt_date = receipt_user_data['date']
         receipt_location = receipt_user_data['location']
-        receipt = Receipt(total=f"{receipt_total:.2f}", date=receipt_date, location=receipt_location)
+        receipt = Receipt(total=receipt_total, date=receipt_date, location=receipt_location)
 
         expenses = []
         for exp in expense_user_data:
@@ -502,7 +551,7 @@ class CLI():
             expense_type = exp.get('type', None)
             expense_category = exp.get('category_id', None)
             expense_details = exp.get('details', None)
-            expense = Expense(item=expense_name, amount=f"{expense_amount:.2f}", type=expense_type,\
+            expense = Expense(item=expense_name, amount=expense_amount, type=expense_type,\
                             details=expense_details, receipt=receipt, category_id=expense_category)
             expenses.append(expense)
         
@@ -510,12 +559,105 @@ class CLI():
         for ledger_entry in ledger_entries_user_data:
             payment_amount = ledger_entry[0]
             account_id = ledger_entry[1]
-            ledger_entry = LedgerEntry(amount=f"{float(payment_amount):.2f}", receipt=receipt, account_id=account_id)
+            ledger_entry = LedgerEntry(amount=payment_amount, receipt=receipt, account_id=account_id)
             ledger_entries.append(ledger_entry)
 
         transaction = ExpenseTransaction(receipt=receipt, expenses=expenses, ledger_entries=ledger_entries)
         return transaction
 
+    @staticmethod
+    def _read_with_default(message: str, default: str, valid=None) -> str:
+        """
+        Reads a value from the user, who can press enter to accept default (if there is one).
+        valid, if given, checks the value and the user is asked again until it passes.
+
+        Returns:
+            The value, or None if the user quits early.
+        """
+        print(f"{message} or press enter for {default}: " if default else f"{message}: ")
+        while True:
+            value = input("> ")
+            if value.lower() == "q":
+                return None
+            value = value or default
+            if value and (valid is None or valid(value)):
+                return value
+            print("Invalid entry. Please try again: ")
+
+    def _read_expense_transaction_from_scan(self, database: Database, draft) -> ExpenseTransaction:
+        """
+        Shows the user what was read from a scanned receipt and has them confirm or correct it
+        (item names are prefilled with the known expense names they matched).
+
+        Arguments:
+            database: The database to use.
+            draft: The OCR.receipt_parser.ReceiptDraft read from the receipt.
+
+        Returns:
+            A Transaction object or None if the user doesn't save it or ends input early with 'q' input.
+        """
+        total = f"${format_cents(draft.total)}" if draft.total is not None else "unknown"
+        print(f"Read receipt from {draft.location or 'unknown location'} on {draft.date or 'unknown date'}, total {total}:")
+        for i, item in enumerate(draft.items, start=1):
+            matched = f" (known as \033[1m{item.item}\033[0m)" if item.item and item.item != item.text else ""
+            print(f"  {i}. {item.text}{matched}: ${format_cents(item.amount)}{' + tax' if item.taxable else ''}")
+        if not draft.items:
+            print("No items were read from the receipt.")
+            return None
+        print("Save this receipt as an expense transaction? (y/n): ")
+        if input("> ").lower() != "y":
+            return None
+
+        def valid_date(date: str) -> bool:
+            try:
+                datetime.datetime.strptime(date, '%Y-%m-%d')
+                return True
+            except ValueError:
+                return False
+
+        receipt_date = self._read_with_default("Enter date of expenses (YYYY-MM-DD)", draft.date, valid_date)
+        if not receipt_date:
+            return None
+        receipt_location = self._read_with_default("Enter location of expenses", draft.location)
+        if not receipt_location:
+            return None
+        receipt = Receipt(total=0, date=receipt_date, location=receipt_location)
+
+        expenses = []
+        for item, expense in zip(draft.items, draft.expenses(receipt, HST_TAX_RATE)):
+            print(f"\033[1m{expense.item}\033[0m ${format_cents(expense.amount)}: press enter to accept, "
+                  "enter the correct name, or enter \"skip\" to leave it out: ")
+            name = input("> ")
+            if name.lower() == "q":
+                return None
+            if name.lower() == "skip":
+                continue
+            expense.item = name or expense.item
+            # Fill in the type and category the item was first entered with, or ask for them if the item is new
+            history = database._search_expenses(expense_item=expense.item)
+            if "type" in history.keys():
+                expense.type = history["type"][0] if history["type"] else self._read_expense_type(
+                    expense.item, [], FuzzyCompleter(CustomCompleter(["want", "need", "savings"])))
+                if expense.type in (None, "done"):
+                    return None
+            if "category_id" in history.keys():
+                expense.category_id = history["category_id"][0] if history["category_id"] else self._read_expense_category(
+                    database, expense.item, {}, database._search_categories())
+                if expense.category_id in (None, "done"):
+                    return None
+            expenses.append(expense)
+        if not expenses:
+            return None
+
+        receipt.total = sum(expense.amount for expense in expenses)
+        if draft.total is not None and draft.total != receipt.total:
+            print(f"Note: the expenses add up to ${format_cents(receipt.total)} but the receipt's total reads ${format_cents(draft.total)}.")
+        ledger_entries_user_data = self._read_user_ledger_entries(database, receipt.total)
+        if not ledger_entries_user_data:
+            return None
+        ledger_entries = [LedgerEntry(amount=amount, receipt=receipt, account_id=account_id) for amount, account_id in ledger_entries_user_data]
+        return ExpenseTransaction(receipt=receipt, expenses=expenses, ledger_entries=ledger_entries)
+
     @staticmethod
     def _read_user_paystub(paystub_payer_completer: FuzzyCompleter) -> dict:
         """
@@ -580,7 +722,7 @@ class CLI():
         income_amount_completer: FuzzyCompleter,
         incomes_existing: dict,
         payer: str
-        ) -> float:
+        ) -> int:
         """
         Reads all data required from user to initialize an income object.
 
@@ -603,7 +745,7 @@ class CLI():
             #   get a promotion, it would take forever for it to change
             #   the most common amount.
             most_recent = incomes_existing['amount'][-1]
-            print(f"You last entered an income from \033[1m{payer}\033[0m in the amount of \033[1m${most_recent:.2f}\033[0m.")
+            print(f"You last entered an income from \033[1m{payer}\033[0m in the amount of \033[1m${format_cents(most_recent)}\033[0m.")
             print(f"\033[1mPress enter to accept\033[0m this suggestion or enter a new amount.")
         print("Enter income amount ($): ")
         income_amount = prompt(
@@ -614,7 +756,7 @@ class CLI():
 
         # User accepts suggestion
         if incomes_existing and not income_amount:
-            return float(most_recent)
+            return most_recent
         
         if income_amount.lower() == "q":
             return None
@@ -624,7 +766,7 @@ class CLI():
         valid = False
         while not valid:
             try:
-                income_amount = float(income_amount)
+                income_amount = to_cents(income_amount)
                 valid = True
             except ValueError:
                 print("Invalid amount entered, please try again: ")
@@ -637,7 +779,7 @@ class CLI():
                     return None
                 if income_amount.lower() == "done":
                     return "done"               
-        return float(income_amount)
+        return income_amount
 
     @staticmethod
     def _read_user_income_details() -> str:
@@ -650,7 +792,7 @@ class CLI():
         return income_details
 
     @staticmethod
-    def _read_user_paystub_ledger_entries(database: Database, paystub_total: float) -> list:
+    def _read_user_paystub_ledger_entries(database: Database, paystub_total: int) -> list:
         """
         Reads all data required from user to initialize a paystub_entry object.
 
@@ -667,12 +809,11 @@ class CLI():
 
         """
         print("What accounts are being credited through this income event?")
-        tol = 10e-3
         paystub_entries = []    
-        while abs(paystub_total) >= tol:
-            print("Remaining: ${:.2f}".format(paystub_total))
+        while paystub_total != 0:
+            print(f"Remaining: ${format_cents(paystub_total)}")
             print("Select account receiving money (see accounts below): ")
-            database.print_table("accounts")
+            database.print_table("accounts", pager=False)
             print("Enter account id or enter \"add\" to add a new payment type: ")
             account_id = input("> ")
             if account_id.lower() == "q":
@@ -685,17 +826,23 @@ class CLI():
                 account = Account(account_name, account_description)
                 account_id = account.insert_into_db(database)
             
-            print(f"How much of the remaining ${paystub_total:.2f} is being credited to this account?")
-            print(f"Enter payment amount ($) or press enter if you received the remaining ${paystub_total:.2f} with acccount id {account_id}: ")
+            print(f"How much of the remaining ${format_cents(paystub_total)} is being credited to this account?")
+            print(f"Enter payment amount ($) or press enter if you received the remaining ${format_cents(paystub_total)} with acccount id {account_id}: ")
 
             income_amount = input("> ")
             if income_amount.lower() == "q":
                 return None
             if not income_amount:
                 income_amount = paystub_total
+            else:
+                try:
+                    income_amount = to_cents(income_amount)
+                except ValueError:
+                    print("Invalid amount entered, please try again.")
+                    continue
             
             paystub_entries.append([income_amount, account_id])
-            paystub_total -= float(income_amount)
+            paystub_total -= income_amount
         return paystub_entries
 
     def _read_user_incomes(self, database: Database, payer: str = "") -> list:
@@ -708,7 +855,7 @@ class CLI():
         user_data = {}
 
         # Read income amount
-        income_amount_completer = FuzzyCompleter(CustomCompleter(list(str(x) for x in set(incomes_existing['amount']))))
+        income_amount_completer = FuzzyCompleter(CustomCompleter(list(format_cents(x) for x in set(incomes_existing['amount']))))
         income_amount = self._read_user_income_amount(income_amount_completer, incomes_existing, payer)
 
         if not income_amount:
@@ -752,8 +899,7 @@ class CLI():
         # Calculate paystub total:
         paystub_total = 0
         for income in income_user_data:
-            amount = float(income['amount'])
-            paystub_total += amount
+            paystub_total += income['amount']
         
         paystub_ledger_entries_user_data = self._read_user_paystub_ledger_entries(database, paystub_total)
         if not paystub_ledger_entries_user_data:
@@ -762,7 +908,7 @@ class CLI():
         paystub_date = paystub_user_data['date']
         paystub_payer = paystub_user_data['payer']
 
-        paystub = Paystub(total="{:.2f}".format(paystub_total), date=paystub_date, payer=paystub_payer)
+        paystub = Paystub(total=paystub_total, date=paystub_date, payer=paystub_payer)
 
         incomes = []
         for inc in income_user_data:
@@ -784,7 +930,7 @@ class CLI():
     def run(self, database: Database) -> None:
         # initialize prompt session !!
         main_menu_options = ["Insert expense transaction", "Insert income transaction", "Print table", "Delete row", \
-                         "Execute arbitrary sql query", "Scan receipt of expenses", "Exit"]
+                         "Execute arbitrary sql query", "Scan receipt of expenses", "Import bank statement", "Monthly report", "Account balances", "Export table or query", "Exit"]
         main_menu = MainMenu(main_menu_options)
         table_options = database._get_tables()
         table_menu = TableMenu(options=table_options)
@@ -805,25 +951,42 @@ class CLI():
             elif choice == 6:
                 self.scan_receipt(database)
             elif choice == 7:
-                    self.exit()
+                self.import_statement(database)
+                # Rebuild the expense name completions with the imported items next time they are needed
+                self._expense_name_index = None
+            elif choice == 8:
+                self.monthly_report(database)
+            elif choice == 9:
+                self.account_balances(database)
+            elif choice == 10:
+                self.export_data(database)
+            elif choice == 11:
+                self.exit(database)
     
     @staticmethod
     def _initialize_db(db: Database) -> None:
         # Initialize budget database
-        print("No database found, creating a new database...")
-        print("Enter database name (default name is budget): ")
-        database_name = input("> ")
+        if db.new_path:
+            # The database was given explicitly (--database or DB_PATH_ENV_VAR), create it there
+            print(f"Database {db.new_path} not found, creating a new database there...")
+            database_path = db.new_path
+            if os.path.dirname(database_path):
+                os.makedirs(os.path.dirname(database_path), exist_ok=True)
+        else:
+            print("No database found, creating a new database...")
+            print("Enter database name (default name is budget): ")
+            database_name = input("> ")
 
-        # If no custome database name is entered, use default name
-        if database_name == "":
-            database_name = "budget"
+            # If no custome database name is entered, use default name
+            if database_name == "":
+                database_name = "budget"
 
-        # Adding suffix to database name
-        if database_name[-3:] != ".db" or ".sqlite" not in database_name:
-            database_name += ".db"
+            # Adding suffix to database name
+            if database_name[-3:] != ".db" or ".sqlite" not in database_name:
+                database_name += ".db"
 
-        # Adding path to Database dir
-        database_path = "./Database/" + database_name
+            # Adding path to Database dir
+            database_path = "./Database/" + database_name
 
         # Optional columns:
         excluded_cols = []
@@ -918,7 +1081,7 @@ want to have the category be listed as \'groceries\' and the subcategory be \'ch
                 print("Enter subcategory (can be left blank): ")
                 subcategory = input("> ")
                 expense_category = ExpenseCategory(category_name, subcategory)
-                expense_category.insert_into_db(database_name)
+                expense_category.insert_into_db(db)
 
     def insert_expense_transactions(self, database_name: str) -> None:
         print("Enter q at any time to stop entering transactions.")
@@ -932,9 +1095,18 @@ want to have the category be listed as \'groceries\' and the subcategory be \'ch
                 retval = expense_transaction.execute(database_name)
                 if not retval:
                     print("Transaction added to database.")
+                    self._record_expense_names(database_name, expense_transaction)
                 else:
                     print(f"Transaction failed to be added. Error message: {retval}")
 
+    def _record_expense_names(self, database: Database, expense_transaction: ExpenseTransaction) -> None:
+        # Keep the session's name indexes up to date with the expenses just added
+        expense_name_index = self._get_expense_name_index(database)
+        for expense in expense_transaction.expenses:
+            expense_name_index.add(expense.item, expense_transaction.receipt.date)
+            if self._item_index is not None:
+                self._item_index.add(expense.item)
+
     def insert_income_transactions(self, database: Database) -> None:
         print("Enter q at any time to stop entering income transactions.")
         while True:
@@ -967,22 +1139,198 @@ want to have the category be listed as \'groceries\' and the subcategory be \'ch
         print("Enter SQL query: ")
         sql_query = input("> ")
         print("Executing query...")
-        vals = database.query_db(sql_query)
-        print(f"Results: {vals}")
+        with database._create_connection() as c:
+            changes = c.connection.total_changes
+            try:
+                c.execute(sql_query)
+            except sqlite3.Error as e:
+                print(f"Invalid SQL query. See error message -> {e}")
+                return
+            if c.description is None:
+                # Not a query returning rows (eg: an UPDATE)
+                print(f"{c.connection.total_changes - changes} rows changed.")
+                return
+            # Rows are fetched and printed a page at a time, to export them all use Export table or query
+            database._page_cursor(c, PAGE_SIZE, pager=True)
 
     def scan_receipt(self, database: Database):
-        print("Disclaimer: this feature is a work in progress, use at own risk.\nCurrently, only prints receipt text (and the text isn't exactly accurate yet!).")
-        print("Enter receipt path: ")
+        print("Disclaimer: this feature is a work in progress, use at own risk.\nThe text read isn't exactly accurate yet, so check what was read before saving it!")
+        print("Enter receipt path, or a directory or glob (eg: receipts/*.jpg) to scan many receipts: ")
         receipt_path = input("> ")
-        print("Scanning receipt...")
-        receipt = np.array(Image.open(receipt_path))
-        norm_receipt = np.zeros((receipt.shape[0], receipt.shape[1]))
-        norm_receipt = cv2.normalize(receipt, norm_receipt, 0, 255, cv2.NORM_MINMAX)
-        norm_receipt = cv2.threshold(norm_receipt, 100, 255, cv2.THRESH_BINARY)[1]
-        norm_receipt = cv2.GaussianBlur(norm_receipt, (1, 1), 0)
-        text = pytesseract.image_to_string(norm_receipt)
-        print(text)
+        if receipt_path.lower() == "q":
+            return
+        # Scanning an image again reuses its text, unless the preprocessing (see OCR.scanner.PREPROCESSING)
+        # or the OCR backend has changed since
+        cache = OCRCache(database, PREPROCESSING, backend=self.ocr_backend)
+        cache.evict()
+        if os.path.isfile(receipt_path):
+            print("Scanning receipt...")
+            result = next(scan_receipts([receipt_path], cache=cache))
+            if result.error is not None:
+                print(f"Scan failed: {result.error}")
+                return
+            print(result.text)
+            from OCR.receipt_parser import parse_receipt
+
+            draft = parse_receipt(result.text.splitlines(), self._get_item_index(database))
+            expense_transaction = self._read_expense_transaction_from_scan(database, draft)
+            if not expense_transaction:
+                print("Receipt not saved.")
+                return
+            retval = expense_transaction.execute(database)
+            if not retval:
+                print("Transaction added to database.")
+                self._record_expense_names(database, expense_transaction)
+            else:
+                print(f"Transaction failed to be added. Error message: {retval}")
+            return
+
+        receipt_paths = find_receipt_images(receipt_path)
+        if not receipt_paths:
+            print("No receipt images found.")
+            return
+        print(f"Scanning {len(receipt_paths)} receipts...")
+        start = time.perf_counter()
+        scanned = 0
+        for done, result in enumerate(scan_receipts(receipt_paths, cache=cache), start=1):
+            if result.error:
+                print(f"[{done}/{len(receipt_paths)}] {result.path} failed after {result.seconds:.1f}s: {result.error}")
+                continue
+            database._insert_into_table("receipt_scans", cols=["path", "text", "seconds"], values=[result.path, result.text, result.seconds])
+            scanned += 1
+            print(f"[{done}/{len(receipt_paths)}] {result.path} ({'cached' if result.cached else f'{result.seconds:.1f}s'})")
+        seconds = time.perf_counter() - start
+        print(f"Scanned {scanned} of {len(receipt_paths)} receipts in {seconds:.1f}s ({seconds / len(receipt_paths):.2f}s per receipt). "
+              "The text is in table receipt_scans.")
+
+    @staticmethod
+    def import_statement(database: Database) -> None:
+        print("Enter path of bank statement (.csv, .ofx or .qfx): ")
+        statement_path = input("> ")
+        if statement_path.lower() == "q":
+            return
+        if not os.path.isfile(statement_path):
+            print("File not found.")
+            return
+
+        column_map = ColumnMap()
+        if not statement_path.lower().endswith(OFX_EXTENSIONS):
+            print(f"Enter the date, amount and description column names separated by commas (or enter to use \"{column_map.date},{column_map.amount},{column_map.description}\"): ")
+            columns = input("> ")
+            if columns.lower() == "q":
+                return
+            if columns:
+                try:
+                    column_map.date, column_map.amount, column_map.description = (col.strip() for col in columns.split(","))
+                except ValueError:
+                    print("Expected three column names.")
+                    return
+            print(f"Enter the date format of the statement (or enter to use {column_map.date_format}): ")
+            date_format = input("> ")
+            if date_format.lower() == "q":
+                return
+            if date_format:
+                column_map.date_format = date_format
+            print("Are purchases shown as negative amounts (n, most banks) or positive amounts (p) in the statement? (or enter to detect it from the statement): ")
+            sign = input("> ").strip().lower()
+            if sign == "q":
+                return
+            if sign not in ("", "n", "p"):
+                print("Invalid choice, expected n or p.")
+                return
+            if sign:
+                column_map.debits_negative = sign == "n"
+
+        print("Select account id the statement is for (see accounts below): ")
+        database.print_table("accounts", pager=False)
+        account_id = input("> ")
+        if not account_id.strip().isnumeric():
+            print("Invalid account id.")
+            return
+
+        default_category_id = None
+        if "category_id" in database._get_columns("expenses"):
+            print("Select category id for items that have never been entered before (see categories below): ")
+            database.print_table("categories", pager=False)
+            default_category_id = input("> ")
+            if not default_category_id.strip().isnumeric():
+                print("Invalid category id.")
+                return
+            default_category_id = int(default_category_id)
+
+        print("Importing statement...")
+        report = import_statement(database, statement_path, account_id=int(account_id), column_map=column_map, \
+                                  default_category_id=default_category_id)
+        for error in report.errors:
+            print(error)
+        print(report)
+        if report.rows_read and not report.imported:
+            print("0 expenses imported: every row of the statement was skipped. Rows with no money spent are skipped as credits, "
+                  "so if purchases are shown with the other sign, import the statement again answering the sign question.")
+
+    @staticmethod
+    def monthly_report(database: Database) -> None:
+        print("Enter what to total each month by: category, type, account or payer (or \"rebuild\" to recompute the monthly totals): ")
+        by = input("> ").strip().lower()
+        if by == "q":
+            return
+        if by == "rebuild":
+            print("Rebuilding monthly totals...")
+            database.rebuild_rollups()
+            print("Monthly totals rebuilt.")
+            return
+
+        print(f"Enter number of months to show (or enter to show {REPORT_MONTHS}): ")
+        months = input("> ")
+        if months.lower() == "q":
+            return
+        if not months.isnumeric() or int(months) == 0:
+            months = REPORT_MONTHS
+        report = database.monthly_report(by or "category", int(months))
+        if report is None:
+            return
+        database._print_rows(list(report), list(zip(*report.values())), REPORT_MONEY_COLS)
+
+    @staticmethod
+    def account_balances(database: Database) -> None:
+        print("Enter date to show balances at the end of (YYYY-MM-DD), or enter for today: ")
+        date = input("> ")
+        if date.lower() == "q":
+            return
+        if date:
+            try:
+                datetime.datetime.strptime(date, '%Y-%m-%d')
+            except ValueError:
+                print("Invalid date format.")
+                return
+        balances = database.account_balances(date or None)
+        database._print_rows(["account", "balance"], list(zip(balances["name"], balances["balance"])), ("balance",))
+
+    @staticmethod
+    def export_data(database: Database) -> None:
+        print(f"Enter a table name, {EXPENSE_HISTORY} (every expense with its receipt and category) or an SQL query to export: ")
+        source = input("> ")
+        if source.lower() in ("q", ""):
+            return
+        print("Enter path of the file to export to (.csv, .jsonl or .parquet, add .gz or .zst to compress a .csv or .jsonl): ")
+        path = input("> ")
+        if path.lower() in ("q", ""):
+            return
+        if os.path.exists(path):
+            print("File already exists, overwrite it? (y/n)")
+            if input("> ").lower() != "y":
+                return
+        print("Exporting...")
+        try:
+            written = export_to_path(database, source_query(database, source), path)
+        except (sqlite3.Error, OSError, ValueError, ImportError) as e:
+            print(f"Export failed. See error message -> {e}")
+            return
+        print(f"Exported {written} rows to {path}.")
 
     @staticmethod
-    def exit() -> None:
+    def exit(database: Database) -> None:
+        if database.tracer is not None:
+            print(database.tracer.summary())
+        database.close()
         sys.exit(0)
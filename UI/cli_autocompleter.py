@@ -1,4 +1,19 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from concurrent.futures import Future
+import datetime
+import heapq
+import math
 from prompt_toolkit.completion import Completer, Completion
+from typing import Callable
+
+
+# CONSTANTS
+COMPLETION_TOP_K = 20
+RECENCY_HALF_LIFE_DAYS = 180
+CACHED_PREFIX_LENGTH = 3
+MAX_PREFIX_SCAN = 2000
+MAX_GRAM_POSTINGS = 5000
 
 
 class CustomCompleter(Completer):
@@ -10,7 +25,198 @@ class CustomCompleter(Completer):
         for expense_name in self.words:
             if expense_name.startswith(word):
                 yield Completion(
-                    expense_name, 
+                    expense_name,
                     start_position=-len(document.text)
                 )
-                
\ No newline at end of file
+
+
+class DeferredCompleter(Completer):
+    """
+    A completer over words that are still being fetched (eg: by Database.prefetch). Until they have arrived
+    there is nothing to complete, so the prompt is shown straight away instead of waiting for the query.
+    """
+    def __init__(self, result: Future, words: Callable[[object], list[str]]):
+        self._result = result
+        self._words = words
+        self._completer = None
+
+    def get_completions(self, document, complete_event):
+        if self._completer is None:
+            if not self._result.done() or self._result.exception() is not None:
+                return
+            self._completer = CustomCompleter(self._words(self._result.result()))
+        yield from self._completer.get_completions(document, complete_event)
+
+
+def _grams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CompletionIndex(Completer):
+    """
+    A completer over a large vocabulary (eg: every expense name ever entered) that is built once
+    and updated in place as new names are used.
+
+    Names are ranked by a frequency score that decays with age (a use RECENCY_HALF_LIFE_DAYS ago
+    counts half as much as one today) and at most top_k names are suggested.
+
+    Lookups are:
+        - prefix matches on the name or on any word in the name, from a sorted array of keys
+          (the best names for short prefixes are kept precomputed, since those ranges are large),
+        - if there aren't enough of those, fuzzy matches sharing trigrams with the text typed.
+
+    Attributes:
+        top_k: The maximum number of completions suggested.
+    """
+    def __init__(self, top_k: int = COMPLETION_TOP_K, half_life_days: float = RECENCY_HALF_LIFE_DAYS):
+        self.top_k = top_k
+        self._decay = math.log(2) / half_life_days
+        # name -> log of the sum over uses of exp(decay * day of use), which only grows as names are used
+        self._scores = {}
+        # Sorted (key, name) pairs: the lowercased name and each lowercased suffix starting at a word
+        self._keys = []
+        # Short prefix -> best names with a key starting with it, best first
+        self._top = defaultdict(list)
+        # Trigram -> names containing it
+        self._grams = defaultdict(set)
+
+    @classmethod
+    def from_usage(cls, usage: list[tuple[str, str, int]], **kwargs) -> "CompletionIndex":
+        """
+        Build an index from (name, date, count) rows (eg: from Database._count_items).
+        """
+        index = cls(**kwargs)
+        for name, date, count in usage:
+            index._add_use(name, date, count)
+        prefix_names = defaultdict(set)
+        for name in index._scores:
+            name_keys = index._name_keys(name)
+            for key in name_keys:
+                index._keys.append((key, name))
+                for length in range(CACHED_PREFIX_LENGTH + 1):
+                    prefix_names[key[:length]].add(name)
+            for gram in _grams(name.lower()):
+                index._grams[gram].add(name)
+        index._keys.sort()
+        for prefix, names in prefix_names.items():
+            index._top[prefix] = heapq.nlargest(index.top_k, names, key=index._scores.__getitem__)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._scores
+
+    def add(self, name: str, date: str = None, count: int = 1) -> None:
+        """
+        Record that a name was used (eg: an expense was entered), adding it to the index if it is new.
+
+        Args:
+            name: The name used.
+            date: The date of the use (YYYY-MM-DD), default is today.
+            count: How many times it was used on that date.
+        """
+        new = name not in self._scores
+        self._add_use(name, date, count)
+        self._add_to_lookups(name, keys=new)
+
+    def search(self, text: str) -> list[str]:
+        """
+        Find the best completions for text.
+
+        Args:
+            text: The text typed so far.
+
+        Returns:
+            At most top_k names, best first.
+        """
+        prefix = text.lower()
+        if len(prefix) <= CACHED_PREFIX_LENGTH:
+            names = list(self._top.get(prefix, []))
+        else:
+            start = bisect_left(self._keys, (prefix,))
+            matches = set()
+            for key, name in self._keys[start:start + MAX_PREFIX_SCAN]:
+                if not key.startswith(prefix):
+                    break
+                matches.add(name)
+            names = heapq.nlargest(self.top_k, matches, key=self._scores.__getitem__)
+
+        if len(names) < self.top_k and len(prefix) >= 3:
+            names += self._fuzzy_search(prefix, exclude=set(names))
+        return names
+
+    def get_completions(self, document, complete_event):
+        for name in self.search(document.text):
+            yield Completion(name, start_position=-len(document.text))
+
+    def _add_use(self, name: str, date: str, count: int) -> None:
+        day = (datetime.date.fromisoformat(date) if date else datetime.date.today()).toordinal()
+        use = self._decay * day + math.log(count)
+        old = self._scores.get(name)
+        if old is None:
+            self._scores[name] = use
+        else:
+            high, low = max(old, use), min(old, use)
+            self._scores[name] = high + math.log1p(math.exp(low - high))
+
+    @staticmethod
+    def _name_keys(name: str) -> set[str]:
+        lowered = name.lower()
+        keys = {lowered}
+        for i in range(1, len(lowered)):
+            if lowered[i - 1] == " " and lowered[i] != " ":
+                keys.add(lowered[i:])
+        return keys
+
+    def _add_to_lookups(self, name: str, keys: bool) -> None:
+        """
+        Add a name to the precomputed lists of best names and, if keys is True (a new name),
+        to the sorted keys and the trigram index.
+        """
+        name_keys = self._name_keys(name)
+        if keys:
+            for key in name_keys:
+                insort(self._keys, (key, name))
+            for gram in _grams(name.lower()):
+                self._grams[gram].add(name)
+
+        # Scores only ever grow, so a name can only move up in (or into) the precomputed lists
+        score = self._scores[name]
+        prefixes = {key[:length] for key in name_keys for length in range(CACHED_PREFIX_LENGTH + 1)}
+        for prefix in prefixes:
+            top = self._top[prefix]
+            if name in top:
+                top.remove(name)
+            elif len(top) >= self.top_k and self._scores[top[-1]] >= score:
+                continue
+            position = 0
+            while position < len(top) and self._scores[top[position]] >= score:
+                position += 1
+            top.insert(position, name)
+            del top[self.top_k:]
+
+    def _fuzzy_search(self, text: str, exclude: set) -> list[str]:
+        # Count shared trigrams starting from the rarest ones. Very common trigrams say little about
+        # the name and would make the lookup slow, so stop once MAX_GRAM_POSTINGS names have been counted.
+        postings = sorted((self._grams.get(gram, ()) for gram in _grams(text)), key=len)
+        shared = defaultdict(int)
+        counted = 0
+        used = 0
+        for names in postings:
+            if not names:
+                continue
+            if used and counted + len(names) > MAX_GRAM_POSTINGS:
+                break
+            for name in names:
+                shared[name] += 1
+            counted += len(names)
+            used += 1
+        needed = max(1, used // 2)
+        candidates = (name for name, count in shared.items() if count >= needed and name not in exclude)
+        return heapq.nlargest(
+            self.top_k - len(exclude),
+            candidates,
+            key=lambda name: (shared[name], self._scores[name])
+        )
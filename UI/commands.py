@@ -0,0 +1,177 @@
+"""
+Non-interactive subcommands (eg: python main.py add-expense ...), for scripts, pipelines and cron jobs.
+They skip the menus and don't import the interactive CLI (prompt_toolkit, the OCR stack), so they start quickly.
+"""
+import argparse
+from Database.database import Database, DB_PATH_ENV_VAR
+from Database.export import COMPRESSIONS, EXPENSE_HISTORY, EXPORT_FORMATS, export_query, export_to_path, source_query
+import datetime
+import os
+import sqlite3
+import sys
+from Transactions.importers import IMPORT_BATCH_SIZE, import_jsonl
+
+
+def _open_database(path: str = None) -> Database:
+    """
+    Open the database for a subcommand: the path given, otherwise the one in DB_PATH_ENV_VAR, otherwise the last one used.
+    Unlike the interactive program the working directory isn't searched, so a script never stops to ask which database to use.
+
+    Returns:
+        The database, or None if there is no such file.
+    """
+    path = path or os.environ.get(DB_PATH_ENV_VAR) or Database._read_remembered_path()
+    if not path or not os.path.isfile(path):
+        return None
+    return Database(path, resolve=False)
+
+
+def _account(args: argparse.Namespace) -> dict:
+    if args.account_id is not None:
+        return {"account_id": args.account_id}
+    return {"account": args.account}
+
+
+def _add(database: Database, record: dict, added: str) -> int:
+    """
+    Add the transaction of one JSON record (see Transactions.importers.import_jsonl), returning the exit code.
+    """
+    report = import_jsonl(database, [record])
+    for error in report.errors:
+        print(error, file=sys.stderr)
+    if report.imported:
+        print(added)
+        return 0
+    return 1
+
+
+def add_expense(database: Database, args: argparse.Namespace) -> int:
+    item_fields = {key: value for key, value in (("type", args.type), ("category_id", args.category_id), ("details", args.details))
+                   if value is not None}
+    record = {
+        "kind": "expense",
+        "date": args.date,
+        "location": args.location,
+        "items": [{"item": name, "amount": amount, **item_fields} for name, amount in args.item],
+        **_account(args),
+    }
+    return _add(database, record, "Expense transaction added.")
+
+
+def add_income(database: Database, args: argparse.Namespace) -> int:
+    record = {"kind": "income", "date": args.date, "payer": args.payer, "amount": args.amount, "details": args.details, **_account(args)}
+    return _add(database, record, "Income transaction added.")
+
+
+def query(database: Database, args: argparse.Namespace) -> int:
+    changes = database._get_connection().total_changes
+    sys.stdout.flush()
+    written = export_query(database, args.sql, sys.stdout.buffer, format=args.format)
+    if written is None:
+        print(f"{database._get_connection().total_changes - changes} rows changed.", file=sys.stderr)
+    return 0
+
+
+def export(database: Database, args: argparse.Namespace) -> int:
+    sql = source_query(database, args.source)
+    if args.output in (None, "-"):
+        sys.stdout.flush()
+        written = export_query(database, sql, sys.stdout.buffer, format=args.format or "csv", compression=args.compression,
+                               read_only=True)
+    else:
+        written = export_to_path(database, sql, args.output, format=args.format, compression=args.compression)
+    print(f"Exported {written} rows.", file=sys.stderr)
+    return 0
+
+
+def import_jsonl_command(database: Database, args: argparse.Namespace) -> int:
+    if args.file == "-":
+        report = import_jsonl(database, sys.stdin, account_id=args.account_id, default_category_id=args.default_category_id,
+                              default_type=args.default_type, batch_size=args.batch_size)
+    else:
+        with open(args.file) as f:
+            report = import_jsonl(database, f, account_id=args.account_id, default_category_id=args.default_category_id,
+                                  default_type=args.default_type, batch_size=args.batch_size)
+    for error in report.errors:
+        print(error, file=sys.stderr)
+    print(report, file=sys.stderr)
+    return 0 if report.imported == report.rows_read else 1
+
+
+def _add_account_arguments(parser: argparse.ArgumentParser) -> None:
+    accounts = parser.add_mutually_exclusive_group(required=True)
+    accounts.add_argument("--account-id", type=int, help="id of the account")
+    accounts.add_argument("--account", help="name of the account")
+
+
+def add_commands(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the subcommands to the program's argument parser.
+    """
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND",
+                                     description="Run a single command instead of the interactive menu.")
+    today = datetime.date.today().isoformat()
+
+    command = commands.add_parser("add-expense", help="add an expense transaction")
+    command.add_argument("--date", default=today, help="date of the receipt (YYYY-MM-DD, default today)")
+    command.add_argument("--location", required=True, help="location of the receipt (eg: Costco)")
+    command.add_argument("--item", nargs=2, action="append", required=True, metavar=("NAME", "AMOUNT"),
+                         help="an item and its amount in dollars (after tax), repeat for several items")
+    command.add_argument("--type", choices=["want", "need", "savings"], help="type of the items (default: as last entered)")
+    command.add_argument("--category-id", type=int, help="category of the items (default: as last entered)")
+    command.add_argument("--details", help="details about the items")
+    _add_account_arguments(command)
+    command.set_defaults(run=add_expense)
+
+    command = commands.add_parser("add-income", help="add an income transaction")
+    command.add_argument("--date", default=today, help="date of the paystub (YYYY-MM-DD, default today)")
+    command.add_argument("--payer", required=True, help="who paid (eg: Work)")
+    command.add_argument("--amount", required=True, help="amount in dollars")
+    command.add_argument("--details", help="details about the income")
+    _add_account_arguments(command)
+    command.set_defaults(run=add_income)
+
+    command = commands.add_parser("query", help="run an SQL statement and print its rows (amounts are in cents)")
+    command.add_argument("sql")
+    command.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    command.set_defaults(run=query)
+
+    command = commands.add_parser("export", help="export a table or the rows of a query (amounts are in cents)")
+    command.add_argument("source", help=f"a table name, {EXPENSE_HISTORY} (expenses with their receipts and categories) or an SQL query")
+    command.add_argument("--format", choices=EXPORT_FORMATS, help="default: from the output's extension (eg: .parquet), else csv")
+    command.add_argument("--compression", choices=COMPRESSIONS, help="default: from the output's extension (eg: .csv.gz), else none")
+    command.add_argument("-o", "--output", help="file to write to (default stdout)")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser("import-jsonl", help="add transactions read as JSON lines (see Transactions.importers.import_jsonl)")
+    command.add_argument("file", nargs="?", default="-", help="file to read (default stdin)")
+    command.add_argument("--account-id", type=int, help="account of transactions that don't give one")
+    command.add_argument("--default-category-id", type=int, help="category of items never entered before")
+    command.add_argument("--default-type", choices=["want", "need", "savings"], default="need", help="type of items never entered before")
+    command.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="transactions written per database transaction")
+    command.set_defaults(run=import_jsonl_command)
+
+
+def run_command(args: argparse.Namespace) -> int:
+    """
+    Run the subcommand given on the command line.
+
+    Returns:
+        The exit code: 0 if everything succeeded, 1 otherwise.
+    """
+    database = _open_database(args.database)
+    if database is None:
+        print("No database found: pass one with --database or set the environment variable "
+              f"{DB_PATH_ENV_VAR}.", file=sys.stderr)
+        return 1
+    if args.trace_sql:
+        database.enable_tracing(slow_threshold_ms=args.slow_query_ms, slow_log_path=args.slow_query_log)
+    try:
+        return args.run(database, args)
+    except (sqlite3.Error, OSError, ValueError, ImportError) as e:
+        print(f"{args.command} failed. See error message -> {e}", file=sys.stderr)
+        return 1
+    finally:
+        if database.tracer is not None:
+            print(database.tracer.summary(), file=sys.stderr)
+        database.close()
@@ -33,6 +33,22 @@ class UI(Protocol):
         ...
 
     @staticmethod
-    def exit() -> None:
+    def import_statement(database: Database) -> None:
+        ...
+
+    @staticmethod
+    def monthly_report(database: Database) -> None:
+        ...
+
+    @staticmethod
+    def account_balances(database: Database) -> None:
+        ...
+
+    @staticmethod
+    def export_data(database: Database) -> None:
+        ...
+
+    @staticmethod
+    def exit(database: Database) -> None:
         ...
     
\ No newline at end of file
@@ -1,5 +1,8 @@
-from Program.program import Program
-from UI.cli import CLI
+import argparse
+from Database.tracing import SLOW_QUERY_MS
+from OCR.backends import BACKENDS
+import sys
+from UI.commands import add_commands, run_command
 
 
 def main():
@@ -12,11 +15,34 @@ def main():
         - Print a table
         - Delete a row from a table
         - Execute an arbitrary sql query
+        - Export a table or query to CSV, JSONL or Parquet
         - Exit
 
+    The database can be given with --database, otherwise it is looked up as described in Database._resolve_path.
+
+    Given a subcommand (eg: add-expense, query, import-jsonl, see UI.commands), runs it without the menus and exits.
+
     """
-    cli = CLI()
-    Program(cli).run()
+    parser = argparse.ArgumentParser(description="Create, update, and maintain a sqlite budget database.")
+    parser.add_argument("-d", "--database", help="path to the database to use")
+    parser.add_argument("--trace-sql", action="store_true", help="time every SQL statement and print a summary on exit")
+    parser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS, help="log statements slower than this (with --trace-sql)")
+    parser.add_argument("--slow-query-log", help="file to append slow statements to (with --trace-sql)")
+    parser.add_argument("--ocr-backend", choices=list(BACKENDS), help="OCR engine to scan receipts with (default: tesserocr if installed, else pytesseract)")
+    add_commands(parser)
+    args = parser.parse_args()
+    if args.command:
+        sys.exit(run_command(args))
+
+    # The interactive program is slow to import (prompt_toolkit), so it is only loaded without a subcommand
+    from Program.program import Program
+    from UI.cli import CLI
+
+    cli = CLI(ocr_backend=args.ocr_backend)
+    program = Program(cli, db_path=args.database)
+    if args.trace_sql:
+        program.database.enable_tracing(slow_threshold_ms=args.slow_query_ms, slow_log_path=args.slow_query_log)
+    program.run()
 
 
 if __name__ == "__main__":
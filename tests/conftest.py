@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+
+# The repository's packages (Database, Transactions, ...) are imported from its root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Benchmarks.generator import generate_database  # noqa: E402
+from Database.database import Database  # noqa: E402
+
+
+# CONSTANTS
+# Parent table -> the tables referencing it, and through which column
+CHILDREN = {
+    "receipts": (("expenses", "receipt_id"), ("ledger", "receipt_id")),
+    "paystubs": (("incomes", "paystub_id"), ("paystub_ledger", "paystub_id")),
+}
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = generate_database(str(tmp_path / "budget.db"), years=0.5, receipts_per_day=2, seed=1)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def delete_transaction():
+    def delete(database: Database, parent: str, parent_first: bool) -> None:
+        """
+        Delete the first receipt or paystub and the rows referencing it, row by row like the delete menu.
+        """
+        with database._create_connection() as c:
+            parent_id = c.execute(f"SELECT MIN(id) FROM {parent}").fetchone()[0]
+            children = [(table, row_id) for table, col in CHILDREN[parent]
+                        for (row_id,) in c.execute(f"SELECT id FROM {table} WHERE {col} = ?", (parent_id,)).fetchall()]
+        assert children
+        if parent_first:
+            database.delete_row(parent, parent_id)
+        for table, row_id in children:
+            database.delete_row(table, row_id)
+        if not parent_first:
+            database.delete_row(parent, parent_id)
+    return delete
@@ -0,0 +1,28 @@
+"""
+The account balance checkpoints are kept up to date by triggers (see Database._create_balances), which must give
+the same balances as recomputing them from scratch (Database._rebuild_balances) whatever order rows are deleted in.
+"""
+from Database.database import Database
+import pytest
+
+
+def month_end_balances(database: Database) -> dict:
+    """
+    The balances of every account at the end of every month with a receipt or paystub.
+    """
+    with database._create_connection() as c:
+        month_ends = [date for (date,) in c.execute("""SELECT DISTINCT date(date, 'start of month', '+1 month', '-1 day')
+                                                       FROM (SELECT date FROM receipts UNION SELECT date FROM paystubs)""")]
+    return {date: list(database.account_balances(date)["balance"]) for date in month_ends}
+
+
+@pytest.mark.parametrize("parent", ["receipts", "paystubs"])
+@pytest.mark.parametrize("parent_first", [False, True])
+def test_balances_match_rebuild_after_deletes(database, delete_transaction, parent, parent_first):
+    before = month_end_balances(database)
+    delete_transaction(database, parent, parent_first)
+    kept = month_end_balances(database)
+    assert kept != before
+    with database.transaction() as c:
+        Database._rebuild_balances(c)
+    assert kept == month_end_balances(database)
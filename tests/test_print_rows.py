@@ -0,0 +1,16 @@
+"""
+Only columns known to hold amounts of money are printed as dollars: a query's column named like one (eg: total)
+may hold anything.
+"""
+def test_query_columns_are_printed_as_stored(database, capsys):
+    database.print_table("expenses", sql_query="SELECT COUNT(*) AS total FROM (SELECT 1 UNION SELECT 2)", pager=False)
+    out = capsys.readouterr().out
+    assert "|   2   |" in out
+
+
+def test_table_money_columns_are_printed_in_dollars(database, capsys):
+    with database._create_connection() as c:
+        amount = c.execute("SELECT amount FROM expenses ORDER BY rowid LIMIT 1").fetchone()[0]
+    database.print_table("expenses", cols="amount", page_size=1, pager=False)
+    out = capsys.readouterr().out
+    assert f" {amount // 100}.{amount % 100:02d} " in out
@@ -0,0 +1,20 @@
+"""
+The monthly rollups are kept up to date by triggers (see Database._create_rollups), which must give the same totals
+as recomputing them from scratch (Database._rebuild_rollups) whatever order rows are deleted in.
+"""
+from Database.database import Database
+import pytest
+
+
+def rollups(database: Database) -> dict:
+    with database._create_connection() as c:
+        return {name: sorted(c.execute(f"SELECT * FROM {name}").fetchall()) for name in Database._rollup_sources(c)}
+
+
+@pytest.mark.parametrize("parent", ["receipts", "paystubs"])
+@pytest.mark.parametrize("parent_first", [False, True])
+def test_rollups_match_rebuild_after_deletes(database, delete_transaction, parent, parent_first):
+    delete_transaction(database, parent, parent_first)
+    kept = rollups(database)
+    database.rebuild_rollups()
+    assert kept == rollups(database)
@@ -0,0 +1,27 @@
+"""
+The OCR stack (OpenCV, numpy, Pillow, tesseract) is slow to import, so it must only be imported when a receipt
+is scanned, never when the program starts. Each module is imported in a fresh interpreter, so modules already
+imported by pytest or other tests don't hide an import.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+# CONSTANTS
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OCR_MODULES = ("cv2", "numpy", "PIL", "pytesseract", "tesserocr")
+
+
+def _imported_ocr_modules(module: str) -> list:
+    code = f"import {module}, sys; print(' '.join(m for m in {OCR_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+# main only imports the interactive CLI (UI.cli) when no subcommand is given, so check that one too
+@pytest.mark.parametrize("module", ["main", "UI.cli"])
+def test_startup_does_not_import_ocr_stack(module):
+    assert _imported_ocr_modules(module) == []